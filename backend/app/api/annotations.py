@@ -2,19 +2,41 @@
 标注管理API
 """
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
-from ..models import Annotation, File
+from typing import Dict, List, Optional, Tuple
+from ..database import get_db, SessionLocal
+from ..models import Annotation, File, GenerationJob, Project
 from ..schemas.annotation import AnnotationCreate, AnnotationUpdate, AnnotationResponse
-from ..schemas.llm import LLMGenerateRequest
-from ..services.llm_service import get_llm_service
+from ..schemas.llm import LLMGenerateRequest, LLMProjectGenerateRequest, LLMEstimateRequest, LLMEstimateResponse, FileEstimate
+from ..services.llm_service import get_async_llm_service
+from ..services.llm_router import RoutedLLMService, load_endpoints, llm_router
+from ..services.annotation_generator import AnnotationGenerator, get_color_for_type
+from ..services.llm_dispatcher import llm_dispatcher
+from ..services.llm_cache import llm_cache
+from ..services.rate_limiter import rate_limiter
+from ..services.llm_metrics import llm_metrics
+from ..services.latency_model import latency_tracker
+from ..services.job_service import JobProgress, UNFINISHED_STATUSES, job_manager
+from ..services.project_scheduler import plan_project_files, throughput_report
+from ..services.incremental import delete_stale_annotations, plan_incremental, replace_previous_annotations
+from ..services.function_dedup import FunctionDedup
+from ..services.function_triage import FunctionTriage
+from ..services.singleflight import content_hash, generation_flights
+from ..services.usage_service import record_llm_usage
+from ..services.work_units import WorkCheckpoint, files_with_units
 from ..services.code_parser import code_parser
+from ..config import settings
 import os
 import json
+import time
+import asyncio
 
 router = APIRouter(prefix="/annotations", tags=["annotations"])
 
+# 流式生成时单次提交的最大调用单元数
+STREAM_COMMIT_BATCH = 8
+
 
 def _load_user_settings() -> dict:
     """加载用户设置"""
@@ -31,6 +53,45 @@ def _load_user_settings() -> dict:
     }
 
 
+def _create_llm_service():
+    """根据用户设置创建异步 LLM 服务实例（配置了多个端点时使用路由服务）"""
+    user_settings = _load_user_settings()
+    endpoints = load_endpoints(user_settings)
+    if endpoints:
+        return RoutedLLMService(endpoints)
+    return get_async_llm_service(
+        provider=user_settings.get("llmProvider", "openai"),
+        model=user_settings.get("llmModel", "gpt-3.5-turbo"),
+        openai_api_key=user_settings.get("openaiApiKey", ""),
+        openai_base_url=user_settings.get("openaiBaseUrl", ""),
+        anthropic_api_key=user_settings.get("anthropicApiKey", "")
+    )
+
+
+def _create_triage(enabled: bool) -> Optional[FunctionTriage]:
+    """请求启用分级时创建函数分级器（用户设置了 triageModel 时使用该小模型评分和生成简单函数的标注）"""
+    if not enabled:
+        return None
+    user_settings = _load_user_settings()
+    model = user_settings.get("triageModel")
+    if not model:
+        return FunctionTriage()
+    return FunctionTriage(get_async_llm_service(
+        provider=user_settings.get("llmProvider", "openai"),
+        model=model,
+        openai_api_key=user_settings.get("openaiApiKey", ""),
+        openai_base_url=user_settings.get("openaiBaseUrl", ""),
+        anthropic_api_key=user_settings.get("anthropicApiKey", "")
+    ))
+
+
+def _record_usage(project_id: Optional[int], llm_service, triage: Optional[FunctionTriage] = None):
+    """记录主模型和分级小模型的用量"""
+    record_llm_usage(project_id, llm_service)
+    if triage is not None and triage.cheap_service is not None:
+        record_llm_usage(project_id, triage.cheap_service)
+
+
 @router.post("/generate")
 async def generate_annotations(
     request: LLMGenerateRequest,
@@ -42,86 +103,582 @@ async def generate_annotations(
     if not file:
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    # 加载用户设置
-    user_settings = _load_user_settings()
-    provider = user_settings.get("llmProvider", "openai")
-    model = user_settings.get("llmModel", "gpt-3.5-turbo")
-    openai_api_key = user_settings.get("openaiApiKey", "")
-    openai_base_url = user_settings.get("openaiBaseUrl", "")
-    anthropic_api_key = user_settings.get("anthropicApiKey", "")
-    
-    # 创建 LLM 服务实例
-    llm_service = get_llm_service(
-        provider=provider, 
-        model=model,
-        openai_api_key=openai_api_key,
-        openai_base_url=openai_base_url,
-        anthropic_api_key=anthropic_api_key
-    )
+    # 作为后台任务执行，避免长时间生成被代理或浏览器超时中断
+    if request.background:
+        params = request.model_dump(exclude={"background"})
+        # 相同参数的任务尚未结束时直接返回该任务
+        job = next((
+            job for job in db.query(GenerationJob).filter(
+                GenerationJob.file_id == file.id,
+                GenerationJob.kind == "file",
+                GenerationJob.status.in_(UNFINISHED_STATUSES)
+            ) if job.params == params
+        ), None)
+        coalesced = job is not None
+        if job is None:
+            job = job_manager.submit(db, "file", params, file_id=file.id)
+        return {
+            "success": True,
+            "message": "已有相同的生成任务在执行" if coalesced else "生成任务已创建",
+            "job_id": job.id,
+            "status": job.status,
+            "coalesced": coalesced
+        }
+    
+    # 同一文件内容和参数的并发请求共享一次生成，只写入一组标注
+    key = (file.id, content_hash(file.content), request.generate_line_annotations, request.generate_function_annotations,
+           request.force_regenerate, request.batch_functions, request.incremental, request.compact_prompts, request.triage)
+    result, coalesced = await generation_flights.do(key, lambda: _generate_and_commit(file.id, request))
+    return dict(result, coalesced=coalesced)
+
+
+async def _generate_and_commit(file_id: int, request: LLMGenerateRequest) -> Dict:
+    """
+    生成单个文件的标注（使用独立会话，不依赖发起请求的连接）
+    
+    作为单文件任务在当前请求中执行，每个窗口/函数完成后立即提交；
+    服务在生成途中重启时，任务在启动后继续执行剩余的单元
+    """
+    db = SessionLocal()
+    try:
+        job = await job_manager.run(db, "file", request.model_dump(exclude={"background"}), file_id=file_id)
+    finally:
+        db.close()
+    
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "completed":
+        raise HTTPException(status_code=409 if job.status == "cancelled" else 503, detail=f"生成任务 {job.id} 未完成（{job.status}）")
+    return {
+        "success": True,
+        "message": f"成功生成{job.annotation_count}条标注",
+        "annotation_count": job.annotation_count,
+        "failed_count": job.failed_count,
+        "errors": job.errors or [],
+        **(job.result or {}),
+        "job_id": job.id
+    }
+
+
+def _apply_incremental_plan(file: File, db: Session) -> Tuple[List[dict], Dict, List[int]]:
+    """
+    按函数指纹比对已有的函数标注（不提交）
+    
+    未修改的函数保留标注并更新行号；已删除或已修改函数的标注在生成完成后才删除
+    （delete_stale_annotations），重新生成失败时保留旧标注
+    
+    Returns:
+        (需要调用 LLM 的函数列表, 复用统计, 过期的函数标注 ID)
+    """
+    parse_result = code_parser.parse_code(file.content, file.language or "")
+    functions = parse_result['functions'] if parse_result['success'] else []
+    existing = db.query(Annotation).filter(Annotation.file_id == file.id, Annotation.type == "function").all()
+    
+    plan = plan_incremental(functions, existing)
+    for annotation, func in plan['reanchor']:
+        annotation.line_number = func['line_start']
+        annotation.line_end = func.get('line_end')
+        annotation.function_name = func['name']
+    return plan['generate'], {
+        "reused_count": len(plan['reanchor']),
+        "function_calls": len(plan['generate'])
+    }, [annotation.id for annotation in plan['stale']]
+
+
+def _replaced_kinds(request: LLMGenerateRequest) -> List[str]:
+    """
+    生成后需要替换旧标注的类型
+
+    增量生成时函数标注已按指纹比对处理，只替换行内标注；强制重新生成时替换所有重新生成的类型，
+    否则新标注会与已有标注重复
+    """
+    if request.incremental:
+        return ["line"] if request.generate_line_annotations else []
+    if request.force_regenerate:
+        return [kind for kind, enabled in (("line", request.generate_line_annotations),
+                                           ("function", request.generate_function_annotations)) if enabled]
+    return []
+
+
+async def _generate_file_annotations(generator: AnnotationGenerator, file: File, request: LLMGenerateRequest, db: Session) -> Tuple[List[Annotation], List[dict], Dict]:
+    """
+    调用 LLM 生成文件标注并加入会话（不提交；生成器带检查点时标注已逐单元提交）
     
+    Returns:
+        (新增标注, 失败的调用, 增量生成统计)
+    """
     generated_annotations = []
+    errors = []
+    summary = {}
+    functions = None
+    stale_ids = []
+    checkpoint = generator.checkpoint
+    
+    # 增量生成：只为新增或修改过的函数调用 LLM
+    if request.incremental and request.generate_function_annotations:
+        functions, summary, stale_ids = _apply_incremental_plan(file, db)
+        if checkpoint is not None:
+            # 逐单元提交前先保存比对结果，恢复时重新比对会复用已生成的函数标注
+            db.commit()
     
     # 生成行内标注
     if request.generate_line_annotations:
-        line_result = llm_service.generate_line_annotations(file.content, file.language)
+        line_result = await generator.generate_line_annotations(file.content, file.language)
         
-        if 'error' in line_result:
-            raise HTTPException(status_code=500, detail=f"LLM调用失败: {line_result['error']}")
+        # 所有窗口都失败时视为调用失败，部分失败时保留成功窗口的结果
+        restored = checkpoint is not None and checkpoint.has_done('line')
+        if line_result['errors'] and not line_result['annotations'] and not restored:
+            raise HTTPException(status_code=500, detail=f"LLM调用失败: {line_result['errors'][0]['error']}")
         
-        if 'annotations' in line_result:
-            for ann in line_result['annotations']:
-                db_annotation = Annotation(
-                    file_id=file.id,
-                    type="line",
-                    line_number=ann['line'],
-                    content=ann['content'],
-                    annotation_type=ann['type'],
-                    color=_get_color_for_type(ann['type'])
-                )
-                db.add(db_annotation)
-                generated_annotations.append(db_annotation)
+        generated_annotations.extend(line_result['annotations'])
+        errors.extend(line_result['errors'])
+        summary = dict(summary, **generator.compaction_savings())
     
-    # 生成函数标注
+    # 生成函数标注（并发调用，部分失败时保留成功的结果）
     if request.generate_function_annotations:
-        # 解析代码
-        parse_result = code_parser.parse_code(file.content, file.language)
+        func_result = await generator.generate_function_annotations(
+            file.content,
+            file.language,
+            functions=functions,
+            batch=request.batch_functions
+        )
+        generated_annotations.extend(func_result['annotations'])
+        errors.extend(func_result['errors'])
+        summary = dict(summary, dedup_saved_calls=generator.saved_calls, **generator.triage_summary())
+    
+    if checkpoint is None:
+        db_annotations = [Annotation(file_id=file.id, **data) for data in generated_annotations]
+        db.add_all(db_annotations)
+    else:
+        # 标注已随工作单元提交，这里读取本任务（包括中断前的执行）写入的全部标注
+        db_annotations = checkpoint.rows(db)
+    replaced = _replaced_kinds(request)
+    if replaced:
+        # 与读取/写入新标注在同一事务中删除被取代的旧标注
+        db.flush()
+        replace_previous_annotations(db, file.id, {row.id for row in db_annotations}, errors, replaced)
+    if request.incremental and request.generate_function_annotations:
+        summary["deleted_count"] = delete_stale_annotations(db, stale_ids, errors)
+    return db_annotations, errors, summary
+
+
+async def _run_file_job(job, progress: JobProgress):
+    """
+    后台任务执行器：生成单个文件的标注
+    
+    每个窗口/函数完成后与其工作单元记录一起提交，中断后重新执行时只处理未完成的单元，
+    不会产生重复标注
+    """
+    request = LLMGenerateRequest(**job.params)
+    db = SessionLocal()
+    try:
+        file = db.query(File).filter(File.id == job.file_id).first()
+        if not file:
+            raise ValueError("文件不存在")
+        
+        llm_service = _create_llm_service()
+        checkpoint = WorkCheckpoint(job.id, file.id)
+        counts = {"annotation_count": len(checkpoint.annotation_ids()), "failed_count": 0}
+        reported_errors = []
         
-        if parse_result['success'] and parse_result['functions']:
-            for func in parse_result['functions']:
-                func_code = func.get('code', '')
-                if func_code:
-                    func_result = llm_service.generate_function_annotations(
-                        func_code,
-                        file.language,
-                        func['name']
-                    )
-                    
-                    if 'error' not in func_result:
-                        # 构建函数标注内容
-                        content = _build_function_annotation_content(func_result)
-                        
-                        db_annotation = Annotation(
-                            file_id=file.id,
-                            type="function",
-                            line_number=func['line_start'],
-                            line_end=func.get('line_end'),
-                            function_name=func['name'],
-                            content=content,
-                            annotation_type="info",
-                            color="#1890ff"
-                        )
-                        db.add(db_annotation)
-                        generated_annotations.append(db_annotation)
+        def on_progress(annotations: List[dict], new_errors: List[dict]):
+            counts["annotation_count"] += len(annotations)
+            counts["failed_count"] += len(new_errors)
+            reported_errors.extend(new_errors)
+            progress.update(
+                **generator.progress,
+                **counts,
+                requests=llm_service.usage["requests"],
+                input_tokens=llm_service.usage["input_tokens"],
+                output_tokens=llm_service.usage["output_tokens"],
+                errors=list(reported_errors)
+            )
+        
+        triage = _create_triage(request.triage)
+        generator = AnnotationGenerator(
+            llm_service,
+            use_cache=not request.force_regenerate,
+            on_progress=on_progress,
+            compact=request.compact_prompts,
+            triage=triage,
+            checkpoint=checkpoint
+        )
+        try:
+            rows, errors, summary = await _generate_file_annotations(generator, file, request, db)
+        except HTTPException as e:
+            raise RuntimeError(e.detail)
+        finally:
+            _record_usage(file.project_id, llm_service, triage)
+        db.commit()
+        progress.update(annotation_count=len(rows), failed_count=len(errors), errors=errors, result=summary or None)
+    finally:
+        db.close()
+
+
+job_manager.register("file", _run_file_job, lane="interactive")
+
+
+@router.post("/generate/project")
+async def generate_project_annotations(
+    request: LLMProjectGenerateRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    为整个项目生成标注（后台任务）
     
-    db.commit()
+    所有文件共享提供商并发上限和限流额度，默认跳过已有标注的文件，
+    通过 GET /api/jobs/{id} 查看逐文件结果和吞吐报告
+    """
+    project = db.query(Project).filter(Project.id == request.project_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="项目不存在")
     
+    job = job_manager.submit(db, "project", request.model_dump())
     return {
         "success": True,
-        "message": f"成功生成{len(generated_annotations)}条标注",
-        "annotation_count": len(generated_annotations)
+        "message": "项目生成任务已创建",
+        "job_id": job.id,
+        "status": job.status
     }
 
 
+async def _run_project_job(job, progress: JobProgress):
+    """
+    后台任务执行器：按规划顺序并发处理项目文件
+    
+    每个窗口/函数完成后单独提交，任务恢复时跳过已完成的文件，未完成的文件只处理剩余的单元
+    """
+    request = LLMProjectGenerateRequest(**job.params)
+    previous = job.result or {}
+    entries = {entry["file_id"]: entry for entry in previous.get("files", []) if entry["status"] == "completed"}
+    
+    db = SessionLocal()
+    try:
+        files = (
+            db.query(File.id, File.filename, File.filepath, File.size)
+            .filter(File.project_id == request.project_id)
+            .all()
+        )
+        annotated = {
+            file_id for (file_id,) in
+            db.query(Annotation.file_id).join(File).filter(File.project_id == request.project_id).distinct()
+        }
+        # 中断前已开始处理的文件虽然已有部分标注，仍需继续
+        annotated -= files_with_units(db, job.id)
+    finally:
+        db.close()
+    
+    planned, skipped = plan_project_files(
+        [f for f in files if f.id not in entries],
+        annotated,
+        order=request.order,
+        priority=request.priority,
+        include_annotated=request.force_regenerate or request.incremental
+    )
+    for file in skipped:
+        entries[file.id] = {"file_id": file.id, "filename": file.filename, "status": "skipped"}
+    
+    llm_service = _create_llm_service()
+    # 项目内相同的函数（复制的工具函数、生成代码）只请求一次 LLM
+    dedup = FunctionDedup()
+    triage = _create_triage(request.triage)
+    generators = []
+    started = time.monotonic()
+    elapsed_before = previous.get("elapsed_seconds", 0.0)
+    usage_before = {"requests": job.requests or 0, "input_tokens": job.input_tokens or 0, "output_tokens": job.output_tokens or 0}
+    
+    def report_progress():
+        usage = {key: usage_before[key] + llm_service.usage[key] for key in usage_before}
+        fields = {key: sum(g.progress[key] for g in generators) for key in ("windows_total", "windows_done", "functions_total", "functions_done")}
+        report = throughput_report(entries, elapsed_before + time.monotonic() - started, usage)
+        progress.update(
+            **fields,
+            **usage,
+            files_total=len(files),
+            files_done=len(entries),
+            annotation_count=report["annotation_count"],
+            failed_count=sum(entry.get("failed_count", 0) for entry in entries.values()),
+            result=report
+        )
+    
+    report_progress()
+    semaphore = asyncio.Semaphore(settings.PROJECT_FILE_CONCURRENCY)
+    
+    async def run_file(planned_file):
+        # 信号量按创建顺序唤醒，文件按规划顺序开始处理
+        async with semaphore:
+            file_request = LLMGenerateRequest(
+                file_id=planned_file.id,
+                generate_line_annotations=request.generate_line_annotations,
+                generate_function_annotations=request.generate_function_annotations,
+                force_regenerate=request.force_regenerate,
+                batch_functions=request.batch_functions,
+                incremental=request.incremental,
+                compact_prompts=request.compact_prompts,
+                triage=request.triage
+            )
+            entry = {"file_id": planned_file.id, "filename": planned_file.filename}
+            file_started = time.monotonic()
+            generator = AnnotationGenerator(
+                llm_service,
+                use_cache=not request.force_regenerate,
+                on_progress=lambda annotations, errors: report_progress(),
+                dedup=dedup,
+                priority=request.schedule,
+                tenant=request.project_id,
+                compact=request.compact_prompts,
+                triage=triage,
+                checkpoint=WorkCheckpoint(job.id, planned_file.id)
+            )
+            generators.append(generator)
+            file_db = SessionLocal()
+            try:
+                file = file_db.query(File).filter(File.id == planned_file.id).first()
+                rows, errors, summary = await _generate_file_annotations(generator, file, file_request, file_db)
+                file_db.commit()
+                entry.update(status="completed", annotation_count=len(rows), failed_count=len(errors), **summary)
+            except HTTPException as e:
+                entry.update(status="failed", error=e.detail)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                entry.update(status="failed", error=str(e))
+            finally:
+                file_db.close()
+            entry["seconds"] = round(time.monotonic() - file_started, 2)
+            entries[planned_file.id] = entry
+            report_progress()
+    
+    try:
+        await asyncio.gather(*(run_file(f) for f in planned))
+    finally:
+        _record_usage(request.project_id, llm_service, triage)
+    report_progress()
+
+
+job_manager.register("project", _run_project_job)
+
+
+@router.post("/generate/stream")
+async def generate_annotations_stream(
+    request: LLMGenerateRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    流式生成代码标注（NDJSON）
+    
+    每个窗口/函数的 LLM 调用完成后立即入库并推送一行事件：
+    start、annotation、error、done
+    """
+    file = db.query(File).filter(File.id == request.file_id).first()
+    if not file:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    functions, summary, stale_ids = None, {}, []
+    if request.incremental and request.generate_function_annotations:
+        functions, summary, stale_ids = _apply_incremental_plan(file, db)
+        db.commit()
+    
+    llm_service = _create_llm_service()
+    return StreamingResponse(
+        _stream_generation(llm_service, file.id, file.content, file.language, request, functions, summary, file.project_id, stale_ids),
+        media_type="application/x-ndjson"
+    )
+
+
+def _ndjson(event: str, data: dict) -> str:
+    """序列化一行流式事件"""
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
+
+
+async def _stream_generation(
+    llm_service,
+    file_id: int,
+    content: str,
+    language: str,
+    request: LLMGenerateRequest,
+    functions: Optional[List[dict]] = None,
+    summary: Optional[Dict] = None,
+    project_id: Optional[int] = None,
+    stale_ids: Optional[List[int]] = None
+):
+    """后台执行生成，按完成顺序小批量提交并推送标注；增量生成的过期函数标注在生成完成后删除"""
+    queue: asyncio.Queue = asyncio.Queue()
+    triage = _create_triage(request.triage)
+    generator = AnnotationGenerator(
+        llm_service,
+        use_cache=not request.force_regenerate,
+        on_progress=lambda annotations, errors: queue.put_nowait((annotations, errors)),
+        compact=request.compact_prompts,
+        triage=triage
+    )
+    
+    async def run():
+        try:
+            if request.generate_line_annotations:
+                await generator.generate_line_annotations(content, language)
+            if request.generate_function_annotations:
+                await generator.generate_function_annotations(
+                    content,
+                    language,
+                    functions=functions,
+                    batch=request.batch_functions
+                )
+        finally:
+            queue.put_nowait(None)
+    
+    task = asyncio.create_task(run())
+    # 流式响应期间请求级会话可能已关闭，这里使用独立会话
+    db = SessionLocal()
+    annotation_count = 0
+    failed_count = 0
+    generated_ids = set()
+    failures = []
+    try:
+        yield _ndjson("start", {"file_id": file_id})
+        finished = False
+        while not finished:
+            items = [await queue.get()]
+            # 合并已到达的结果，减少提交次数
+            while not queue.empty() and len(items) < STREAM_COMMIT_BATCH:
+                items.append(queue.get_nowait())
+            if None in items:
+                finished = True
+                items = [item for item in items if item is not None]
+            
+            rows = [Annotation(file_id=file_id, **data) for annotations, _ in items for data in annotations]
+            if rows:
+                db.add_all(rows)
+                db.commit()
+                annotation_count += len(rows)
+                generated_ids.update(row.id for row in rows)
+                for row in rows:
+                    yield _ndjson("annotation", AnnotationResponse.model_validate(row).model_dump(mode="json"))
+            for _, errors in items:
+                for error in errors:
+                    failed_count += 1
+                    failures.append(error)
+                    yield _ndjson("error", error)
+        
+        try:
+            await task
+        except Exception as e:
+            failed_count += 1
+            yield _ndjson("error", {"scope": "file", "error": str(e)})
+        
+        summary = dict(summary or {})
+        if request.incremental and request.generate_function_annotations and task.done() and not task.cancelled() and task.exception() is None:
+            summary["deleted_count"] = delete_stale_annotations(db, stale_ids or [], failures)
+        replaced = _replaced_kinds(request)
+        if replaced:
+            replace_previous_annotations(db, file_id, generated_ids, failures, replaced)
+        db.commit()
+        
+        yield _ndjson("done", {
+            "file_id": file_id,
+            "annotation_count": annotation_count,
+            "failed_count": failed_count,
+            **summary,
+            "dedup_saved_calls": generator.saved_calls,
+            **generator.compaction_savings(),
+            **generator.triage_summary()
+        })
+    finally:
+        # 客户端断开时停止剩余调用，已提交的标注保留
+        if not task.done():
+            task.cancel()
+        db.close()
+        _record_usage(project_id, llm_service, triage)
+
+
+@router.post("/estimate", response_model=LLMEstimateResponse)
+def estimate_generation(
+    request: LLMEstimateRequest,
+    db: Session = Depends(get_db)
+):
+    """预估生成标注的请求数、token 数和耗时（不调用 LLM）"""
+    if request.file_id is not None:
+        files = db.query(File).filter(File.id == request.file_id).all()
+    elif request.project_id is not None:
+        files = db.query(File).filter(File.project_id == request.project_id).all()
+    else:
+        raise HTTPException(status_code=400, detail="请提供 file_id 或 project_id")
+    if not files:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    llm_service = _create_llm_service()
+    generator = AnnotationGenerator(llm_service, use_cache=not request.force_regenerate, compact=request.compact_prompts)
+    
+    estimates = []
+    for file in files:
+        estimate = generator.estimate(
+            file.content,
+            file.language,
+            line_annotations=request.generate_line_annotations,
+            function_annotations=request.generate_function_annotations,
+            batch=request.batch_functions
+        )
+        estimates.append(FileEstimate(file_id=file.id, filename=file.filename, **estimate))
+    
+    serial = sum(e.serial_latency_seconds for e in estimates)
+    concurrency = generator.dispatcher.limit_for(llm_service.provider)
+    return LLMEstimateResponse(
+        provider=llm_service.provider,
+        model=llm_service.model,
+        file_count=len(estimates),
+        requests=sum(e.requests for e in estimates),
+        cached_requests=sum(e.cached_requests for e in estimates),
+        input_tokens=sum(e.input_tokens for e in estimates),
+        output_tokens=sum(e.output_tokens for e in estimates),
+        serial_latency_seconds=round(serial, 1),
+        estimated_seconds=round(max(serial / concurrency, max(e.estimated_seconds for e in estimates)), 1),
+        files=estimates
+    )
+
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """获取 LLM 响应缓存命中统计"""
+    return llm_cache.stats()
+
+
+@router.delete("/cache")
+def clear_cache():
+    """清空 LLM 响应缓存"""
+    llm_cache.clear()
+    return {"message": "缓存已清空"}
+
+
+@router.get("/rate-limits")
+def get_rate_limits():
+    """获取各 LLM 提供商的限流状态和重试统计"""
+    return rate_limiter.snapshot()
+
+
+@router.get("/dispatch")
+def get_dispatch_status():
+    """获取调度器各提供商的并发名额使用和各优先级排队情况"""
+    return llm_dispatcher.snapshot()
+
+
+@router.get("/endpoints")
+def get_endpoint_status():
+    """获取多端点路由的端点状态（延迟、进行中请求数、熔断状态）"""
+    return llm_router.snapshot()
+
+
+@router.get("/latency")
+def get_latency_model():
+    """获取各提供商/端点的延迟模型（耗时与预估之比的分位数、超时和对冲请求统计）"""
+    return latency_tracker.snapshot()
+
+
+@router.get("/llm-metrics")
+def get_llm_metrics():
+    """获取本进程内按提供商和模型汇总的调用耗时、token、重试和错误分类"""
+    return llm_metrics.snapshot()
+
+
 @router.post("/", response_model=AnnotationResponse)
 def create_annotation(
     annotation: AnnotationCreate,
@@ -142,7 +699,7 @@ def create_annotation(
         function_name=annotation.function_name,
         content=annotation.content,
         annotation_type=annotation.annotation_type,
-        color=annotation.color or _get_color_for_type(annotation.annotation_type),
+        color=annotation.color or get_color_for_type(annotation.annotation_type),
         status="pending"
     )
     
@@ -234,38 +791,3 @@ def delete_annotation(annotation_id: int, db: Session = Depends(get_db)):
     db.commit()
     
     return {"message": "标注已删除"}
-
-
-def _get_color_for_type(annotation_type: str) -> str:
-    """根据标注类型获取颜色"""
-    color_map = {
-        'info': '#1890ff',      # 蓝色
-        'warning': '#faad14',   # 黄色
-        'suggestion': '#52c41a', # 绿色
-        'security': '#f5222d'   # 红色
-    }
-    return color_map.get(annotation_type, '#1890ff')
-
-
-def _build_function_annotation_content(func_data: dict) -> str:
-    """构建函数标注内容"""
-    lines = []
-    
-    if 'description' in func_data:
-        lines.append(f"功能: {func_data['description']}")
-    
-    if 'parameters' in func_data and func_data['parameters']:
-        lines.append("\n参数:")
-        for param in func_data['parameters']:
-            lines.append(f"  - {param.get('name')}: {param.get('description')} ({param.get('type', '')})")
-    
-    if 'returns' in func_data and func_data['returns']:
-        ret = func_data['returns']
-        lines.append(f"\n返回: {ret.get('description')} ({ret.get('type', '')})")
-    
-    if 'example' in func_data and func_data['example']:
-        lines.append(f"\n示例:\n{func_data['example']}")
-    
-    return '\n'.join(lines)
-
-
@@ -6,7 +6,7 @@ from sqlalchemy.orm import Session
 from typing import List
 from ..database import get_db
 from ..models import File, Project
-from ..schemas.file import FileCreate, FileResponse
+from ..schemas.file import FileCreate, FileUpdate, FileResponse
 from ..services.file_service import file_service
 from ..services.git_service import git_service
 
@@ -131,6 +131,27 @@ def list_project_files(project_id: int, db: Session = Depends(get_db)):
     return results
 
 
+@router.put("/{file_id}", response_model=FileResponse)
+def update_file(file_id: int, file_update: FileUpdate, db: Session = Depends(get_db)):
+    """
+    更新文件内容
+    
+    已有标注保持不变，可通过增量生成（incremental）只为修改过的函数重新生成标注
+    """
+    file = db.query(File).filter(File.id == file_id).first()
+    if not file:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    file.content = file_update.content
+    file.size = len(file_update.content.encode('utf-8'))
+    db.commit()
+    db.refresh(file)
+    
+    response = FileResponse.model_validate(file)
+    response.annotation_count = len(file.annotations)
+    return response
+
+
 @router.delete("/{file_id}")
 def delete_file(file_id: int, db: Session = Depends(get_db)):
     """删除文件"""
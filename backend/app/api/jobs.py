@@ -0,0 +1,75 @@
+"""
+生成任务API
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from ..database import get_db
+from ..models import GenerationJob
+from ..schemas.job import JobResponse
+from ..services.job_service import job_manager
+from ..services.work_units import unit_summary
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def _job_response(job: GenerationJob) -> JobResponse:
+    """构建任务响应并计算进度"""
+    response = JobResponse.model_validate(job)
+    if job.kind == "project":
+        total, done = response.files_total, response.files_done
+    else:
+        total = response.windows_total + response.functions_total
+        done = response.windows_done + response.functions_done
+    if job.status == "completed":
+        response.progress = 1.0
+    elif total:
+        response.progress = round(min(1.0, done / total), 4)
+    return response
+
+
+@router.get("/", response_model=List[JobResponse])
+def list_jobs(
+    status: Optional[str] = None,
+    file_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """获取任务列表（按创建时间倒序）"""
+    query = db.query(GenerationJob)
+    if status:
+        query = query.filter(GenerationJob.status == status)
+    if file_id is not None:
+        query = query.filter(GenerationJob.file_id == file_id)
+    jobs = query.order_by(GenerationJob.id.desc()).offset(skip).limit(limit).all()
+    return [_job_response(job) for job in jobs]
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    """获取任务进度"""
+    job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return _job_response(job)
+
+
+@router.get("/{job_id}/units")
+def get_job_units(job_id: int, file_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """获取任务的工作单元统计（按类型和状态计数，任务恢复时只执行未完成的单元）"""
+    job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return dict(unit_summary(db, job_id, file_id), job_id=job_id, status=job.status, attempts=job.attempts or 0)
+
+
+@router.post("/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(job_id: int, db: Session = Depends(get_db)):
+    """取消任务"""
+    job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job.status not in ("queued", "running"):
+        raise HTTPException(status_code=400, detail=f"任务已结束（{job.status}），无法取消")
+    return _job_response(await job_manager.cancel(db, job))
@@ -7,6 +7,8 @@ from typing import List
 from ..database import get_db
 from ..models import Project
 from ..schemas.project import ProjectCreate, ProjectUpdate, ProjectResponse
+from ..schemas.llm import ProjectLLMUsageResponse
+from ..services.usage_service import project_usage
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
@@ -98,6 +100,16 @@ def archive_project(project_id: int, db: Session = Depends(get_db)):
     return {"message": "项目已归档"}
 
 
+@router.get("/{project_id}/llm-usage", response_model=ProjectLLMUsageResponse)
+def get_project_llm_usage(project_id: int, db: Session = Depends(get_db)):
+    """获取项目的 LLM 用量汇总（按提供商和模型）"""
+    project = db.query(Project).filter(Project.id == project_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="项目不存在")
+    
+    return project_usage(db, project_id)
+
+
 @router.delete("/{project_id}")
 def delete_project(project_id: int, db: Session = Depends(get_db)):
     """删除项目"""
@@ -3,15 +3,27 @@
 """
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import json
 import os
+from ..services.llm_clients import client_registry
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
 # 设置文件路径
 SETTINGS_FILE = "user_settings.json"
 
+class LLMEndpointSettings(BaseModel):
+    """多端点路由中的单个端点"""
+    name: str
+    provider: str = "openai"  # openai（含兼容服务）、anthropic、ollama
+    model: str
+    baseUrl: Optional[str] = ""
+    apiKey: Optional[str] = ""
+    weight: float = 1.0
+    maxConcurrency: int = 4
+    enabled: bool = True
+
 class UserSettings(BaseModel):
     """用户设置模型"""
     theme: str = "light"
@@ -24,6 +36,8 @@ class UserSettings(BaseModel):
     openaiApiKey: Optional[str] = ""
     openaiBaseUrl: Optional[str] = ""  # 支持自定义 API 地址（如 DeepSeek）
     anthropicApiKey: Optional[str] = ""
+    triageModel: Optional[str] = ""  # 函数分级使用的小模型（与 llmProvider 相同的提供商），为空时简单函数使用模板标注
+    llmEndpoints: List[LLMEndpointSettings] = []  # 配置后按延迟和容量在端点间路由，忽略上面的单一提供商设置
 
 def load_settings() -> dict:
     """加载设置"""
@@ -54,6 +68,8 @@ async def update_settings(settings: UserSettings):
     """更新用户设置"""
     try:
         save_settings(settings.dict())
+        # 丢弃按旧设置创建的客户端连接
+        client_registry.clear()
         return {"success": True, "message": "设置保存成功"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -64,6 +80,7 @@ async def reset_settings():
     try:
         default_settings = UserSettings().dict()
         save_settings(default_settings)
+        client_registry.clear()
         return {"success": True, "data": default_settings, "message": "设置已重置"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,413 @@
+"""
+命令行批量标注 - 不启动 Web 服务，直接导入仓库并生成标注
+
+导入仓库后在进程池中解析文件，LLM 调用经调度器并发执行，结果按工作单元批量提交。
+任务记录在 generation_jobs 表中（类型 cli），中断后以相同参数再次运行时只处理剩余的单元，
+运行期间也可以通过 Web 服务的 GET /api/jobs/{id} 查看进度
+
+运行:
+    cd backend
+    python -m app.cli annotate https://github.com/user/repo.git --project nightly
+    python -m app.cli annotate ../some_repo --workers 8 --concurrency 16 --batch --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from .api.settings import load_settings
+from .config import settings
+from .database import SessionLocal, init_db
+from .models import Annotation, File, GenerationJob, Project
+from .services.annotation_generator import AnnotationGenerator, prepare_file
+from .services.file_service import file_service
+from .services.function_dedup import FunctionDedup
+from .services.function_triage import FunctionTriage
+from .services.git_service import git_service
+from .services.incremental import replace_previous_annotations
+from .services.job_service import JobProgress, update_job
+from .services.llm_dispatcher import LLMDispatcher
+from .services.llm_router import RoutedLLMService, load_endpoints
+from .services.llm_service import get_async_llm_service
+from .services.project_scheduler import plan_project_files, throughput_report
+from .services.usage_service import record_llm_usage
+from .services.work_units import WorkCheckpoint, files_with_units
+
+# 命令行任务的类型（Web 服务不会重新入队这类任务）
+CLI_JOB_KIND = "cli"
+# 可以恢复的任务状态（failed 表示上次运行被中断或出错）
+RESUMABLE_STATUSES = ("queued", "running", "failed")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _is_remote(source: str) -> bool:
+    return "://" in source or source.startswith("git@")
+
+
+def _project_name(source: str) -> str:
+    name = os.path.basename(source.rstrip("/\\"))
+    return name[:-4] if name.endswith(".git") else name or source
+
+
+def import_repository(db: Session, source: str, project_name: Optional[str]) -> Tuple[Project, Dict]:
+    """
+    导入仓库的代码文件到项目（同名项目已存在时复用，只新增项目中还没有的路径）
+
+    Args:
+        db: 数据库会话
+        source: Git 仓库地址或本地目录
+        project_name: 项目名称，为空时使用仓库名
+
+    Returns:
+        (项目, 导入统计)
+    """
+    result = git_service.clone_repository(source) if _is_remote(source) else git_service.read_directory(source)
+    if not result['success']:
+        raise SystemExit(result['error'])
+    try:
+        name = project_name or _project_name(source)
+        project = db.query(Project).filter(Project.name == name).order_by(Project.id).first()
+        if project is None:
+            project = Project(name=name, description=f"命令行导入: {source}")
+            db.add(project)
+            db.flush()
+        existing = {path for (path,) in db.query(File.filepath).filter(File.project_id == project.id)}
+        new_files = [
+            File(
+                project_id=project.id,
+                filename=file_data['filename'],
+                filepath=file_data['filepath'],
+                content=file_data['content'],
+                language=file_service.get_file_language(file_data['filename']),
+                size=file_data['size']
+            )
+            for file_data in result['files'] if file_data['filepath'] not in existing
+        ]
+        db.add_all(new_files)
+        db.commit()
+        db.refresh(project)
+    finally:
+        if result.get('temp_dir'):
+            git_service.cleanup_temp_dir(result['temp_dir'])
+    return project, {"files_found": len(result['files']), "files_imported": len(new_files)}
+
+
+def open_job(db: Session, project_id: int, params: Dict, fresh: bool = False) -> Tuple[GenerationJob, bool]:
+    """
+    恢复同一项目、相同参数的未完成命令行任务，没有时新建
+
+    Returns:
+        (任务, 是否为恢复的任务)
+    """
+    job = None
+    if not fresh:
+        candidates = (
+            db.query(GenerationJob)
+            .filter(GenerationJob.kind == CLI_JOB_KIND, GenerationJob.status.in_(RESUMABLE_STATUSES))
+            .order_by(GenerationJob.id.desc())
+        )
+        job = next((candidate for candidate in candidates if candidate.params == params), None)
+    resumed = job is not None
+    if job is None:
+        job = GenerationJob(kind=CLI_JOB_KIND, params=params, errors=[], attempts=0)
+        db.add(job)
+    job.status = "running"
+    job.error = None
+    job.started_at = _now()
+    job.finished_at = None
+    job.attempts = (job.attempts or 0) + 1
+    db.commit()
+    db.refresh(job)
+    return job, resumed
+
+
+def _create_llm_service(args, user_settings: Dict):
+    """按用户设置创建 LLM 服务（命令行指定提供商或模型时不使用多端点路由）"""
+    endpoints = load_endpoints(user_settings)
+    if endpoints and not args.provider and not args.model:
+        return RoutedLLMService(endpoints)
+    return get_async_llm_service(
+        provider=args.provider or user_settings.get("llmProvider", "openai"),
+        model=args.model or user_settings.get("llmModel", "gpt-3.5-turbo"),
+        openai_api_key=user_settings.get("openaiApiKey", ""),
+        openai_base_url=user_settings.get("openaiBaseUrl", ""),
+        anthropic_api_key=user_settings.get("anthropicApiKey", "")
+    )
+
+
+def _create_triage(args, user_settings: Dict) -> Optional[FunctionTriage]:
+    """启用分级时创建函数分级器"""
+    if not args.triage:
+        return None
+    model = args.triage_model or user_settings.get("triageModel")
+    if not model:
+        return FunctionTriage()
+    return FunctionTriage(get_async_llm_service(
+        provider=args.provider or user_settings.get("llmProvider", "openai"),
+        model=model,
+        openai_api_key=user_settings.get("openaiApiKey", ""),
+        openai_base_url=user_settings.get("openaiBaseUrl", ""),
+        anthropic_api_key=user_settings.get("anthropicApiKey", "")
+    ))
+
+
+async def annotate(args) -> Dict:
+    """
+    导入仓库并生成标注
+
+    Returns:
+        吞吐报告（throughput_report 的字段，另含任务、导入和解析统计）
+    """
+    started = time.monotonic()
+    init_db()
+    db = SessionLocal()
+    try:
+        project, import_stats = import_repository(db, args.source, args.project)
+        import_seconds = time.monotonic() - started
+        params = {
+            "project_id": project.id,
+            "generate_line_annotations": not args.no_lines,
+            "generate_function_annotations": not args.no_functions,
+            "force_regenerate": args.force,
+            "batch_functions": args.batch,
+            "compact_prompts": args.compact,
+            "triage": args.triage
+        }
+        job, resumed = open_job(db, project.id, params, fresh=args.fresh)
+        job_id = job.id
+        previous = job.result or {}
+        usage_before = {"requests": job.requests or 0, "input_tokens": job.input_tokens or 0, "output_tokens": job.output_tokens or 0}
+        files = (
+            db.query(File.id, File.filename, File.filepath, File.size, File.content, File.language)
+            .filter(File.project_id == project.id)
+            .all()
+        )
+        annotated = {
+            file_id for (file_id,) in
+            db.query(Annotation.file_id).join(File).filter(File.project_id == project.id).distinct()
+        }
+        annotated -= files_with_units(db, job_id)
+    finally:
+        db.close()
+
+    entries = {entry["file_id"]: entry for entry in previous.get("files", []) if entry["status"] == "completed"}
+    planned, skipped = plan_project_files(
+        [f for f in files if f.id not in entries],
+        annotated,
+        order=args.order,
+        include_annotated=args.force
+    )
+    for file in skipped:
+        entries[file.id] = {"file_id": file.id, "filename": file.filename, "status": "skipped"}
+
+    user_settings = load_settings()
+    llm_service = _create_llm_service(args, user_settings)
+    triage = _create_triage(args, user_settings)
+    # 没有交互式请求，不为其预留名额
+    dispatcher = LLMDispatcher(reserved=0)
+    if args.concurrency:
+        dispatcher.set_limit(llm_service.provider, args.concurrency)
+    dedup = FunctionDedup()
+    progress = JobProgress(job_id)
+    generators: List[AnnotationGenerator] = []
+    elapsed_before = previous.get("elapsed_seconds", 0.0)
+    generation_started = time.monotonic()
+    parse_stats = {"files": 0, "seconds": 0.0}
+
+    def report() -> Dict:
+        usage = {key: usage_before[key] + llm_service.usage[key] for key in usage_before}
+        result = throughput_report(entries, elapsed_before + time.monotonic() - generation_started, usage)
+        progress.update(
+            **{key: sum(g.progress[key] for g in generators) for key in ("windows_total", "windows_done", "functions_total", "functions_done")},
+            **usage,
+            files_total=len(files),
+            files_done=len(entries),
+            annotation_count=result["annotation_count"],
+            failed_count=sum(entry.get("failed_count", 0) for entry in entries.values()),
+            result=result
+        )
+        return result
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(args.file_concurrency)
+    status, error = "failed", "已中断"
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # 所有文件的解析、行窗口切分和压缩先提交到进程池，与 LLM 调用重叠执行
+        parse_tasks = {}
+        if not (args.no_lines and args.no_functions):
+            parse_started = time.monotonic()
+
+            def parsed(_):
+                parse_stats["files"] += 1
+                parse_stats["seconds"] = time.monotonic() - parse_started
+
+            for file in planned:
+                parse_tasks[file.id] = loop.run_in_executor(
+                    pool, prepare_file, file.content, file.language or "", llm_service.provider, llm_service.model,
+                    not args.no_lines, not args.no_functions, args.compact
+                )
+                parse_tasks[file.id].add_done_callback(parsed)
+
+        replaced_kinds = [kind for kind, enabled in (("line", not args.no_lines), ("function", not args.no_functions)) if enabled]
+
+        def replace_annotations(file_id: int, keep_ids, errors):
+            """--force 时删除被本次结果取代的旧标注，避免重复"""
+            db = SessionLocal()
+            try:
+                replace_previous_annotations(db, file_id, keep_ids, errors, replaced_kinds)
+                db.commit()
+            finally:
+                db.close()
+
+        async def run_file(file):
+            async with semaphore:
+                checkpoint = WorkCheckpoint(job_id, file.id, batch_size=args.commit_batch)
+                generator = AnnotationGenerator(
+                    llm_service,
+                    dispatcher=dispatcher,
+                    use_cache=not args.force,
+                    on_progress=lambda annotations, errors: report(),
+                    dedup=dedup,
+                    priority="bulk",
+                    tenant=project.id,
+                    compact=args.compact,
+                    triage=triage,
+                    checkpoint=checkpoint
+                )
+                generators.append(generator)
+                entry = {"file_id": file.id, "filename": file.filename}
+                file_started = time.monotonic()
+                errors = []
+                try:
+                    prepared = await parse_tasks[file.id] if file.id in parse_tasks else {}
+                    if not args.no_lines:
+                        line_result = await generator.generate_line_annotations(
+                            file.content,
+                            file.language,
+                            windows=prepared['windows']
+                        )
+                        errors.extend(line_result['errors'])
+                    if not args.no_functions:
+                        func_result = await generator.generate_function_annotations(
+                            file.content,
+                            file.language,
+                            functions=prepared['functions'],
+                            batch=args.batch
+                        )
+                        errors.extend(func_result['errors'])
+                    checkpoint.flush()
+                    if args.force:
+                        replace_annotations(file.id, set(checkpoint.annotation_ids()), errors)
+                    annotation_count = len(checkpoint.annotation_ids())
+                    entry.update(
+                        # 所有单元都失败时视为文件失败
+                        status="failed" if errors and not annotation_count else "completed",
+                        annotation_count=annotation_count,
+                        failed_count=len(errors),
+                        dedup_saved_calls=generator.saved_calls,
+                        **generator.compaction_savings(),
+                        **generator.triage_summary()
+                    )
+                    if entry["status"] == "failed":
+                        entry["error"] = errors[0]["error"]
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    entry.update(status="failed", error=str(e))
+                entry["seconds"] = round(time.monotonic() - file_started, 2)
+                entries[file.id] = entry
+                report()
+
+        try:
+            await asyncio.gather(*(run_file(f) for f in planned))
+            status, error = "completed", None
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            # 中断时提交已完成但尚未写入的单元，下次运行时跳过
+            for generator in generators:
+                generator.checkpoint.flush()
+            record_llm_usage(project.id, llm_service)
+            if triage is not None and triage.cheap_service is not None:
+                record_llm_usage(project.id, triage.cheap_service)
+            result = report()
+            progress.flush()
+            update_job(job_id, status=status, error=error, finished_at=_now())
+
+    return dict(
+        result,
+        job_id=job_id,
+        resumed=resumed,
+        project_id=project.id,
+        project_name=project.name,
+        **import_stats,
+        import_seconds=round(import_seconds, 1),
+        parsed_files=parse_stats["files"],
+        parse_seconds=round(parse_stats["seconds"], 1),
+        workers=args.workers or os.cpu_count(),
+        total_seconds=round(time.monotonic() - started, 1)
+    )
+
+
+def print_summary(report: Dict):
+    """打印吞吐汇总"""
+    print(f"项目          {report['project_name']} (id {report['project_id']})  任务 {report['job_id']}{'（恢复）' if report['resumed'] else ''}")
+    print(f"导入          找到 {report['files_found']} 个文件，新增 {report['files_imported']} 个  {report['import_seconds']:.1f} s")
+    print(f"解析          {report['parsed_files']} 个文件  {report['parse_seconds']:.1f} s  （{report['workers']} 个进程）")
+    print(f"文件          完成 {report['files_completed']}  失败 {report['files_failed']}  跳过 {report['files_skipped']}")
+    print(f"标注          {report['annotation_count']}  （重复函数省去调用 {report['dedup_saved_calls']}）")
+    # 恢复的任务中请求数和生成耗时包括之前的运行
+    cumulative = "（含之前的运行）" if report["resumed"] else ""
+    print(f"LLM 请求      {report['requests']}  输入 {report['input_tokens']} token  输出 {report['output_tokens']} token{cumulative}")
+    print(f"吞吐量        {report['files_per_minute']:.2f} 文件/min  {report['tokens_per_second']:.1f} token/s  "
+          f"生成耗时 {report['elapsed_seconds']:.1f} s{cumulative}  本次耗时 {report['total_seconds']:.1f} s")
+    for entry in report["files"]:
+        if entry["status"] == "failed":
+            print(f"失败          {entry['filename']}: {entry.get('error')}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="代码标注命令行工具")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    annotate_parser = commands.add_parser("annotate", help="导入仓库并批量生成标注")
+    annotate_parser.add_argument("source", help="Git 仓库地址或本地目录")
+    annotate_parser.add_argument("--project", help="项目名称（默认使用仓库名），同名项目已存在时复用")
+    annotate_parser.add_argument("--workers", type=int, default=None, help="解析文件的进程数（默认为 CPU 核数）")
+    annotate_parser.add_argument("--concurrency", type=int, default=None, help="提供商并发上限（默认使用 LLM_CONCURRENCY）")
+    annotate_parser.add_argument("--file-concurrency", type=int, default=settings.PROJECT_FILE_CONCURRENCY, help="同时处理的文件数")
+    annotate_parser.add_argument("--commit-batch", type=int, default=50, help="每次提交的工作单元数")
+    annotate_parser.add_argument("--order", choices=["largest", "smallest"], default="largest")
+    annotate_parser.add_argument("--no-lines", action="store_true", help="不生成行内标注")
+    annotate_parser.add_argument("--no-functions", action="store_true", help="不生成函数标注")
+    annotate_parser.add_argument("--batch", action="store_true", help="打包小函数")
+    annotate_parser.add_argument("--compact", action="store_true", help="压缩行内标注的提示词")
+    annotate_parser.add_argument("--triage", action="store_true", help="按复杂度为函数分级")
+    annotate_parser.add_argument("--triage-model", help="分级使用的小模型（默认使用设置中的 triageModel）")
+    annotate_parser.add_argument("--provider", choices=["openai", "anthropic", "ollama"], help="覆盖设置中的提供商")
+    annotate_parser.add_argument("--model", help="覆盖设置中的模型")
+    annotate_parser.add_argument("--force", action="store_true", help="不读取缓存，并重新处理已有标注的文件（替换其已有标注）")
+    annotate_parser.add_argument("--fresh", action="store_true", help="不恢复未完成的任务，新建任务")
+    annotate_parser.add_argument("--json", action="store_true", help="以 JSON 输出汇总")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(annotate(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_summary(report)
+    # 有失败的文件时返回非零，便于流水线判断
+    return 1 if report["files_failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,6 +23,86 @@ class Settings(BaseSettings):
     DEFAULT_LLM_PROVIDER: str = "openai"  # openai, anthropic, ollama
     DEFAULT_MODEL: str = "gpt-3.5-turbo"
     
+    # Ollama 配置
+    OLLAMA_BASE_URL: str = "http://localhost:11434"
+    OLLAMA_STREAM: bool = True  # 流式读取输出，按分片间隔判断超时
+    OLLAMA_KEEP_ALIVE: str = "30m"  # 模型在内存中保留的时间
+    OLLAMA_CONNECT_TIMEOUT: float = 10.0
+    OLLAMA_LOAD_TIMEOUT: float = 300.0  # 等待首个输出分片的时间（含模型加载）
+    OLLAMA_IDLE_TIMEOUT: float = 60.0  # 相邻输出分片的最大间隔
+    OLLAMA_WARMUP: bool = False  # 启动时预加载当前设置的 Ollama 模型
+    
+    # LLM 并发配置（每个提供商同时进行的请求数上限，所有生成请求共享）
+    LLM_CONCURRENCY: dict = {"openai": 8, "anthropic": 4, "ollama": 2}
+    LLM_DEFAULT_CONCURRENCY: int = 4
+    LLM_INTERACTIVE_RESERVED_SLOTS: int = 1  # 每个提供商只给交互式请求使用的名额（至少保留一个给批量任务）
+    
+    # LLM 限流与重试配置（rpm: 每分钟请求数，tpm: 每分钟 token 数；未配置的提供商根据 429 自动推断）
+    LLM_RATE_LIMITS: dict = {
+        "openai": {"rpm": 500, "tpm": 200000},
+        "anthropic": {"rpm": 50, "tpm": 40000}
+    }
+    LLM_RATE_BURST_SECONDS: float = 10.0  # 令牌桶可积攒的额度（秒）
+    LLM_RATE_MIN_FACTOR: float = 0.1  # 收到 429 后速率最低降至配置值的比例
+    LLM_RATE_RECOVERY_STEP: float = 0.02  # 每次成功后恢复的速率比例
+    LLM_MAX_RETRIES: int = 4
+    LLM_RETRY_BASE_DELAY: float = 1.0  # 指数退避初始等待（秒）
+    LLM_RETRY_MAX_DELAY: float = 60.0
+    
+    # 多端点路由配置（端点列表在用户设置 llmEndpoints 中配置）
+    LLM_ROUTER_EWMA_ALPHA: float = 0.3  # 端点延迟滑动平均中最新样本的权重
+    LLM_ROUTER_FAILURE_THRESHOLD: int = 3  # 连续失败多少次后熔断端点
+    LLM_ROUTER_COOLDOWN: float = 30.0  # 熔断后多久放行一次试探请求（秒）
+    LLM_ROUTER_MAX_RETRIES: int = 1  # 单个端点上的重试次数，之后切换到其他端点
+    
+    # LLM 客户端连接池配置
+    LLM_POOL_MAX_CONNECTIONS: int = 100
+    LLM_POOL_MAX_KEEPALIVE: int = 20
+    LLM_POOL_KEEPALIVE_EXPIRY: float = 120.0  # 空闲连接保留时间（秒）
+    
+    # 函数打包请求配置
+    LLM_BATCH_TOKEN_BUDGET: int = 1500  # 单个打包请求中代码的 token 上限
+    LLM_BATCH_MAX_FUNCTION_TOKENS: int = 300  # 超过该大小的函数单独请求
+    LLM_BATCH_MAX_FUNCTIONS: int = 10  # 单个打包请求的函数数量上限
+    
+    # 自适应超时：按 token 数和端点的历史耗时为每次调用计算超时，超过预期 p95 时发出对冲请求
+    LLM_ADAPTIVE_TIMEOUT: bool = True
+    LLM_TIMEOUT_MIN: float = 15.0  # 超时下限（秒）
+    LLM_TIMEOUT_MAX: float = 900.0  # 超时上限（秒）
+    LLM_TIMEOUT_MARGIN: float = 1.5  # 超时 = 预估耗时 × 耗时比值的 p99 × 余量
+    LLM_TIMEOUT_COLD_FACTOR: float = 5.0  # 样本不足时超时 = 预估耗时 × 该倍数
+    LLM_LATENCY_WINDOW: int = 200  # 每个端点保留的耗时样本数
+    LLM_LATENCY_MIN_SAMPLES: int = 20  # 样本达到该数量后才使用分位数和对冲
+    LLM_HEDGE_ENABLED: bool = True  # 对 OpenAI / Anthropic 调用发出对冲请求（Ollama 为本地服务，不对冲）
+    LLM_HEDGE_BUDGET: float = 0.05  # 对冲请求数不超过调用数的比例
+    
+    # 结构化输出：按请求类型的 JSON Schema 约束输出（OpenAI json_schema、Anthropic 工具调用、Ollama format）
+    LLM_STRUCTURED_OUTPUT: bool = True
+    
+    # 函数分级配置（请求中 triage 为 true 时生效）
+    LLM_TRIAGE_THRESHOLD: float = 6.0  # 启发式复杂度（圈复杂度 + 语句数 / 4）达到该值直接交给主模型
+    LLM_TRIAGE_MODEL_THRESHOLD: int = 7  # 小模型评分（1-10）达到该值时交给主模型
+    LLM_TRIAGE_SCORE_BATCH: int = 20  # 单次评分请求的函数数量上限
+    
+    # 行内标注分块配置
+    LLM_LINE_WINDOW_LINES: int = 200  # 单个窗口的最大行数（实际行数还受 token 预算限制）
+    LLM_TOKEN_BUDGET_RATIO: float = 0.5  # 单次请求最多使用上下文窗口和超时时间的比例
+    LLM_LINE_WINDOW_OVERLAP: int = 20  # 相邻窗口的重叠行数
+    
+    # LLM 响应缓存配置
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = "llm_cache.db"
+    LLM_CACHE_MEMORY_ENTRIES: int = 512  # 内存 LRU 条目数
+    LLM_CACHE_MAX_BYTES: int = 200 * 1024 * 1024  # 磁盘缓存容量上限 200MB
+    LLM_CACHE_TTL: int = 7 * 24 * 3600  # 缓存有效期（秒），0 表示不过期
+    LLM_CACHE_FLUSH_INTERVAL: float = 1.0  # 新条目和访问时间批量写入磁盘的间隔（秒）
+    
+    # 后台生成任务配置
+    JOB_WORKERS: int = 2  # 同时执行的批量任务数（项目任务）
+    JOB_INTERACTIVE_WORKERS: int = 2  # 同时执行的单文件任务数，不被项目任务占用
+    JOB_PROGRESS_INTERVAL: float = 1.0  # 任务进度写入数据库的最小间隔（秒）
+    PROJECT_FILE_CONCURRENCY: int = 8  # 项目任务同时处理的文件数（LLM 并发仍受 LLM_CONCURRENCY 限制）
+    
     # 文件上传配置
     UPLOAD_DIR: str = "uploads"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
@@ -2,11 +2,21 @@
 FastAPI主应用
 """
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .database import init_db
 from .config import settings
-from .api import projects, files, annotations, quality, annotation_types
+from .api import projects, files, annotations, quality, annotation_types, jobs
 from .api import settings as settings_api
+from .services.job_service import job_manager
+from .services.llm_service import get_async_llm_service
+from .services.llm_cache import llm_cache
+from .services.llm_metrics import llm_metrics, gauge_lines
+from .services.rate_limiter import rate_limiter
+from .services.llm_router import llm_router
+from .services.llm_dispatcher import llm_dispatcher
+from .services.latency_model import latency_tracker
+import asyncio
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -31,6 +41,7 @@ app.include_router(annotations.router, prefix=settings.API_PREFIX)
 app.include_router(quality.router, prefix=settings.API_PREFIX)
 app.include_router(annotation_types.router, prefix=settings.API_PREFIX)
 app.include_router(settings_api.router, prefix=settings.API_PREFIX)
+app.include_router(jobs.router, prefix=settings.API_PREFIX)
 
 
 @app.on_event("startup")
@@ -38,6 +49,27 @@ async def startup_event():
     """应用启动时初始化数据库"""
     init_db()
     print("数据库初始化完成")
+    await job_manager.start()
+    if settings.OLLAMA_WARMUP:
+        asyncio.create_task(warmup_ollama())
+
+
+async def warmup_ollama():
+    """后台预加载当前设置的 Ollama 模型，不阻塞启动"""
+    user_settings = settings_api.load_settings()
+    if user_settings.get("llmProvider") != "ollama":
+        return
+    llm_service = get_async_llm_service(provider="ollama", model=user_settings.get("llmModel"))
+    if await llm_service.warmup():
+        print(f"Ollama 模型 {llm_service.model} 已预加载")
+    else:
+        print(f"Ollama 模型 {llm_service.model} 预加载失败")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止后台任务（未完成的任务在下次启动时恢复）"""
+    await job_manager.stop()
 
 
 @app.get("/")
@@ -55,3 +87,58 @@ def health_check():
     """健康检查"""
     return {"status": "healthy"}
 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus 指标：LLM 调用耗时、token、重试、错误分类，以及缓存和限流状态"""
+    cache = llm_cache.stats() if settings.LLM_CACHE_ENABLED else None
+    extra = []
+    if cache:
+        extra += gauge_lines("llm_cache_lookups_total", "LLM 缓存查询次数", [
+            ({"result": "memory_hit"}, cache["memory_hits"]),
+            ({"result": "disk_hit"}, cache["disk_hits"]),
+            ({"result": "miss"}, cache["misses"])
+        ], kind="counter")
+        extra += gauge_lines("llm_cache_entries", "LLM 缓存条目数", [
+            ({"tier": "memory"}, cache["memory_entries"]),
+            ({"tier": "disk"}, cache["disk_entries"])
+        ])
+    limits = rate_limiter.snapshot()
+    extra += gauge_lines("llm_rate_limit_factor", "自适应限流的当前降速系数（1 为未降速）", [
+        ({"provider": provider}, state["factor"]) for provider, state in limits.items()
+    ])
+    extra += gauge_lines("llm_rate_limit_wait_seconds_total", "限流等待累计时间", [
+        ({"provider": provider}, state["wait_seconds"]) for provider, state in limits.items()
+    ], kind="counter")
+    endpoints = llm_router.snapshot()
+    extra += gauge_lines("llm_endpoint_latency_seconds", "端点成功请求耗时的滑动平均", [
+        ({"endpoint": name}, state["latency"]) for name, state in endpoints.items() if state["latency"] is not None
+    ])
+    extra += gauge_lines("llm_endpoint_in_flight", "端点进行中的请求数", [
+        ({"endpoint": name}, state["in_flight"]) for name, state in endpoints.items()
+    ])
+    extra += gauge_lines("llm_endpoint_circuit_open", "端点是否处于熔断状态（1 为熔断）", [
+        ({"endpoint": name}, int(state["status"] == "open")) for name, state in endpoints.items()
+    ])
+    dispatch = llm_dispatcher.snapshot()
+    extra += gauge_lines("llm_dispatch_slots_in_use", "调度器已占用的并发名额", [
+        ({"provider": provider}, state["in_use"]) for provider, state in dispatch.items()
+    ])
+    extra += gauge_lines("llm_dispatch_waiting", "调度器中等待名额的调用数", [
+        ({"provider": provider, "priority": priority}, count)
+        for provider, state in dispatch.items() for priority, count in state["waiting"].items()
+    ])
+    latency = latency_tracker.snapshot()
+    extra += gauge_lines("llm_latency_ratio_p99", "实际耗时与预估耗时之比的 p99（决定自适应超时）", [
+        ({"key": key}, state["ratio_p99"]) for key, state in latency.items() if state["ratio_p99"] is not None
+    ])
+    extra += gauge_lines("llm_call_timeouts_total", "超过自适应超时的调用数", [
+        ({"key": key}, state["timeouts"]) for key, state in latency.items()
+    ], kind="counter")
+    extra += gauge_lines("llm_hedged_requests_total", "发出的对冲请求数", [
+        ({"key": key}, state["hedged"]) for key, state in latency.items()
+    ], kind="counter")
+    extra += gauge_lines("llm_hedge_wins_total", "对冲请求先于原请求返回的次数", [
+        ({"key": key}, state["hedge_wins"]) for key, state in latency.items()
+    ], kind="counter")
+    return PlainTextResponse(llm_metrics.render(extra), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -5,6 +5,9 @@ from .project import Project
 from .file import File
 from .annotation import Annotation, AnnotationType
 from .setting import LLMConfig
+from .job import GenerationJob
+from .usage import LLMUsage
+from .work_unit import GenerationWorkUnit
 
-__all__ = ["Project", "File", "Annotation", "AnnotationType", "LLMConfig"]
+__all__ = ["Project", "File", "Annotation", "AnnotationType", "LLMConfig", "GenerationJob", "LLMUsage", "GenerationWorkUnit"]
 
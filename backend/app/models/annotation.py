@@ -21,6 +21,7 @@ class Annotation(Base):
     annotation_type = Column(String(50), nullable=False)  # info, warning, suggestion, security
     status = Column(String(20), default="pending")  # pending, approved, rejected
     color = Column(String(20), nullable=True)  # 颜色标识
+    fingerprint = Column(String(64), nullable=True, index=True)  # 函数指纹（函数标注用），用于增量重新生成
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
     
@@ -0,0 +1,36 @@
+"""
+生成任务模型
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy.sql import func
+from ..database import Base
+
+
+class GenerationJob(Base):
+    """后台标注生成任务表"""
+    __tablename__ = "generation_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), default="file")  # 任务类型，对应 job_manager 中注册的执行器
+    file_id = Column(Integer, ForeignKey("files.id"), nullable=True, index=True)
+    status = Column(String(20), default="queued", index=True)  # queued, running, completed, failed, cancelled
+    params = Column(JSON, nullable=True)  # 生成请求参数
+    files_total = Column(Integer, default=0)  # 项目任务：计划处理的文件数
+    files_done = Column(Integer, default=0)
+    windows_total = Column(Integer, default=0)  # 行内标注窗口数
+    windows_done = Column(Integer, default=0)
+    functions_total = Column(Integer, default=0)
+    functions_done = Column(Integer, default=0)
+    annotation_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    requests = Column(Integer, default=0)  # 实际发出的 LLM 请求数（不含缓存命中）
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    errors = Column(JSON, nullable=True)  # 失败的窗口/函数
+    error = Column(Text, nullable=True)  # 任务整体失败原因
+    result = Column(JSON, nullable=True)  # 项目任务：逐文件结果和吞吐报告
+    attempts = Column(Integer, default=0)  # 执行次数（重启后恢复会递增）
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
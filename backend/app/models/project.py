@@ -22,4 +22,5 @@ class Project(Base):
     
     # 关系
     files = relationship("File", back_populates="project", cascade="all, delete-orphan")
+    llm_usage = relationship("LLMUsage", cascade="all, delete-orphan")
 
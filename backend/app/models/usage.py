@@ -0,0 +1,24 @@
+"""
+LLM 用量模型
+"""
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from ..database import Base
+
+
+class LLMUsage(Base):
+    """按项目、提供商和模型累计的 LLM 用量表"""
+    __tablename__ = "llm_usage"
+    __table_args__ = (UniqueConstraint("project_id", "provider", "model"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False, index=True)
+    provider = Column(String(50), nullable=False)
+    model = Column(String(100), nullable=False)
+    calls = Column(Integer, default=0)  # 调用次数（不含缓存命中）
+    requests = Column(Integer, default=0)  # 提供商返回了响应的请求数
+    errors = Column(Integer, default=0)  # 失败的调用数（含响应无法解析）
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    latency_seconds = Column(Float, default=0.0)  # 调用累计耗时
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
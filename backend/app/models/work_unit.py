@@ -0,0 +1,24 @@
+"""
+生成工作单元模型
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, UniqueConstraint
+from sqlalchemy.sql import func
+from ..database import Base
+
+
+class GenerationWorkUnit(Base):
+    """生成任务的工作单元表（一个行窗口或一个函数），完成时与其标注在同一事务中提交"""
+    __tablename__ = "generation_work_units"
+    __table_args__ = (UniqueConstraint("job_id", "file_id", "unit_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("generation_jobs.id"), nullable=False, index=True)
+    file_id = Column(Integer, ForeignKey("files.id"), nullable=False, index=True)
+    unit_key = Column(String(300), nullable=False)  # line:起始行-结束行 或 function:起始行:函数名
+    kind = Column(String(20), nullable=False)  # line, function
+    state = Column(String(20), default="pending", index=True)  # pending, done, failed
+    annotation_ids = Column(JSON, nullable=True)  # 该单元写入的标注
+    error = Column(JSON, nullable=True)  # 失败信息（与任务 errors 中的条目格式一致）
+    attempts = Column(Integer, default=0)  # 执行次数（失败的单元在任务恢复时重试）
+    content_hash = Column(String(64), nullable=True)  # 登记单元时的文件内容哈希，文件被修改后单元的行号不再有效
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
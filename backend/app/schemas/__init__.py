@@ -2,16 +2,18 @@
 Pydantic schemas
 """
 from .project import ProjectCreate, ProjectUpdate, ProjectResponse
-from .file import FileCreate, FileResponse
+from .file import FileCreate, FileUpdate, FileResponse
 from .annotation import AnnotationCreate, AnnotationUpdate, AnnotationResponse
-from .llm import LLMGenerateRequest, LLMGenerateResponse
+from .llm import LLMGenerateRequest, LLMGenerateResponse, LLMProjectGenerateRequest, LLMEstimateRequest, LLMEstimateResponse, LLMUsageItem, ProjectLLMUsageResponse
+from .job import JobResponse
 from .quality import FileQualityMetrics, ProjectQualityMetrics, QualitySummary
 
 __all__ = [
     "ProjectCreate", "ProjectUpdate", "ProjectResponse",
-    "FileCreate", "FileResponse",
+    "FileCreate", "FileUpdate", "FileResponse",
     "AnnotationCreate", "AnnotationUpdate", "AnnotationResponse",
-    "LLMGenerateRequest", "LLMGenerateResponse",
+    "LLMGenerateRequest", "LLMGenerateResponse", "LLMProjectGenerateRequest", "LLMEstimateRequest", "LLMEstimateResponse", "LLMUsageItem", "ProjectLLMUsageResponse",
+    "JobResponse",
     "FileQualityMetrics", "ProjectQualityMetrics", "QualitySummary"
 ]
 
@@ -19,6 +19,11 @@ class FileCreate(FileBase):
     project_id: int
 
 
+class FileUpdate(BaseModel):
+    """更新文件Schema"""
+    content: str
+
+
 class FileResponse(FileBase):
     """文件响应Schema"""
     model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,37 @@
+"""
+生成任务Schemas
+"""
+from pydantic import BaseModel, ConfigDict
+from typing import Optional, List
+from datetime import datetime
+
+
+class JobResponse(BaseModel):
+    """生成任务响应Schema"""
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    kind: str
+    file_id: Optional[int] = None
+    status: str  # queued, running, completed, failed, cancelled
+    params: Optional[dict] = None
+    files_total: int = 0
+    files_done: int = 0
+    windows_total: int = 0
+    windows_done: int = 0
+    functions_total: int = 0
+    functions_done: int = 0
+    progress: float = 0.0  # 已完成调用单元的比例（0-1）
+    annotation_count: int = 0
+    failed_count: int = 0
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    errors: List[dict] = []
+    error: Optional[str] = None
+    result: Optional[dict] = None  # 项目任务的汇总报告
+    attempts: int = 0
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
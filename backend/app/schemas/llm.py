@@ -2,7 +2,8 @@
 LLM相关Schemas
 """
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
+from datetime import datetime
 
 
 class LLMGenerateRequest(BaseModel):
@@ -10,6 +11,90 @@ class LLMGenerateRequest(BaseModel):
     file_id: int
     generate_line_annotations: bool = True
     generate_function_annotations: bool = True
+    force_regenerate: bool = False  # 跳过缓存，强制重新调用 LLM，新标注替换已有的同类标注
+    batch_functions: bool = False  # 将多个小函数打包到一次请求中
+    background: bool = False  # 作为后台任务执行，立即返回任务 ID
+    incremental: bool = False  # 只为新增或修改过的函数调用 LLM，并替换旧的行内标注
+    compact_prompts: bool = False  # 行内标注的代码去掉注释、空行和多余缩进后再发送，行号自动还原
+    triage: bool = False  # 按复杂度分级：只有复杂函数交给主模型，其余由小模型（设置中的 triageModel）或模板生成
+
+
+class LLMProjectGenerateRequest(BaseModel):
+    """项目批量生成请求（作为后台任务执行）"""
+    project_id: int
+    generate_line_annotations: bool = True
+    generate_function_annotations: bool = True
+    force_regenerate: bool = False  # 跳过缓存，并重新处理已有标注的文件（替换其已有标注）
+    batch_functions: bool = False
+    incremental: bool = False  # 已有标注的文件按函数指纹增量生成
+    compact_prompts: bool = False
+    triage: bool = False
+    order: Literal["largest", "smallest"] = "largest"  # 按文件大小排序
+    priority: List[str] = []  # 优先处理的路径通配模式，如 ["src/core/*"]
+    schedule: Literal["bulk", "backfill"] = "bulk"  # 调度优先级：backfill 只使用批量任务剩余的并发名额
+
+
+class LLMEstimateRequest(BaseModel):
+    """生成预估请求（file_id 与 project_id 二选一）"""
+    file_id: Optional[int] = None
+    project_id: Optional[int] = None
+    generate_line_annotations: bool = True
+    generate_function_annotations: bool = True
+    force_regenerate: bool = False
+    batch_functions: bool = False
+    compact_prompts: bool = False
+
+
+class FileEstimate(BaseModel):
+    """单个文件的生成预估"""
+    file_id: int
+    filename: str
+    requests: int  # 需要发出的请求数（不含缓存命中）
+    cached_requests: int  # 可由缓存直接返回的请求数
+    input_tokens: int
+    output_tokens: int
+    serial_latency_seconds: float  # 所有请求串行执行的耗时
+    estimated_seconds: float  # 按提供商并发上限估算的耗时
+
+
+class LLMEstimateResponse(BaseModel):
+    """生成预估响应"""
+    provider: str
+    model: str
+    file_count: int
+    requests: int
+    cached_requests: int
+    input_tokens: int
+    output_tokens: int
+    serial_latency_seconds: float
+    estimated_seconds: float
+    files: List[FileEstimate] = []
+
+
+class LLMUsageItem(BaseModel):
+    """单个提供商和模型的累计用量"""
+    provider: str
+    model: str
+    calls: int = 0  # 调用次数（不含缓存命中）
+    requests: int = 0  # 提供商返回了响应的请求数
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency_seconds: float = 0.0
+    updated_at: Optional[datetime] = None
+
+
+class ProjectLLMUsageResponse(BaseModel):
+    """项目 LLM 用量汇总"""
+    project_id: int
+    calls: int = 0
+    requests: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency_seconds: float = 0.0
+    average_latency: Optional[float] = None  # 平均每次调用耗时（秒）
+    models: List[LLMUsageItem] = []
 
 
 class LineAnnotationData(BaseModel):
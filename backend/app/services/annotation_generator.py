@@ -0,0 +1,575 @@
+"""
+标注生成服务 - 组织 LLM 调用并整理为标注数据
+"""
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+from .code_parser import code_parser, parse_functions
+from .function_batcher import pack_functions
+from .function_dedup import FunctionDedup
+from .function_triage import TIER_CHEAP, TIER_MAIN, TIER_TEMPLATE, TIERS, FunctionTriage, template_annotation
+from .line_chunker import split_into_windows
+from .prompt_compactor import FileCompactor
+from .token_estimator import FUNCTION_OUTPUT_TOKENS, LINE_OUTPUT_TOKENS_PER_LINE, token_estimator
+from .llm_dispatcher import LLMDispatcher, TaskResult, llm_dispatcher
+from .work_units import WorkCheckpoint
+
+
+class LLMCallError(Exception):
+    """LLM 返回错误结果"""
+
+
+def split_windows(code: str, language: str, provider: str, model: str) -> List[Dict]:
+    """按模型上下文窗口和超时预算切分行窗口"""
+    max_lines = token_estimator.window_lines(code, provider, model)
+    return split_into_windows(code, language, max_lines=max_lines)
+
+
+def prepare_file(
+    code: str,
+    language: str,
+    provider: str,
+    model: str,
+    line_annotations: bool = True,
+    function_annotations: bool = True,
+    compact: bool = False
+) -> Dict:
+    """
+    解析文件并切分行窗口（模块级函数，可以提交到进程池执行）
+
+    Args:
+        code: 代码内容
+        language: 编程语言
+        provider: 提供商，决定窗口大小和 token 计数
+        model: 模型
+        line_annotations: 是否切分行窗口
+        function_annotations: 是否解析函数
+        compact: 是否同时生成窗口的压缩片段（window['compacted']）
+
+    Returns:
+        {'functions': 函数列表或 None, 'windows': 行窗口列表或 None}，
+        分别作为 generate_function_annotations / generate_line_annotations 的参数
+    """
+    windows = None
+    if line_annotations:
+        windows = split_windows(code, language, provider, model)
+        if compact:
+            compactor = FileCompactor(code, language, provider, model)
+            for window in windows:
+                window['compacted'] = compactor.compact_window(window)
+    return {
+        'functions': parse_functions(code, language) if function_annotations else None,
+        'windows': windows
+    }
+
+    def __init__(self, result: Dict):
+        self.result = result
+        super().__init__(result.get("error", "LLM 调用失败"))
+
+
+def get_color_for_type(annotation_type: str) -> str:
+    """根据标注类型获取颜色"""
+    color_map = {
+        'info': '#1890ff',      # 蓝色
+        'warning': '#faad14',   # 黄色
+        'suggestion': '#52c41a', # 绿色
+        'security': '#f5222d'   # 红色
+    }
+    return color_map.get(annotation_type, '#1890ff')
+
+
+def build_function_annotation_content(func_data: dict) -> str:
+    """构建函数标注内容"""
+    lines = []
+
+    if 'description' in func_data:
+        lines.append(f"功能: {func_data['description']}")
+
+    if 'parameters' in func_data and func_data['parameters']:
+        lines.append("\n参数:")
+        for param in func_data['parameters']:
+            lines.append(f"  - {param.get('name')}: {param.get('description')} ({param.get('type', '')})")
+
+    if 'returns' in func_data and func_data['returns']:
+        ret = func_data['returns']
+        lines.append(f"\n返回: {ret.get('description')} ({ret.get('type', '')})")
+
+    if 'example' in func_data and func_data['example']:
+        lines.append(f"\n示例:\n{func_data['example']}")
+
+    return '\n'.join(lines)
+
+
+class AnnotationGenerator:
+    """
+    标注生成器
+
+    生成结果为标注字段字典（与 Annotation 模型字段一致，不含 file_id），
+    由调用方决定如何持久化。设置 on_progress 后，每个窗口/函数/打包请求完成时
+    立即以 (新增标注列表, 新增错误列表) 回调，用于流式输出和进度上报；
+    已完成的调用单元数记录在 progress 中。
+    相同函数体只请求一次 LLM，传入共享的 dedup 时在多个生成器（如项目内所有文件）间去重。
+    priority 和 tenant 决定调用在调度器中的优先级和所属项目。
+    compact 为 True 时行内标注的代码去掉注释、空行和多余缩进后再发送，返回的行号按映射还原，
+    节省的 token 累计在 compaction 中。
+    传入 triage 时先为函数分级，只有复杂函数交给主模型，其余由小模型或模板生成。
+    传入 checkpoint 时每个窗口/函数完成后立即将其标注写入数据库并记录单元状态，
+    之前执行中已完成的单元直接跳过（返回结果只包含本次生成的标注）
+    """
+
+    def __init__(
+        self,
+        llm_service,
+        dispatcher: LLMDispatcher = None,
+        use_cache: bool = True,
+        on_progress: Optional[Callable[[List[Dict], List[Dict]], None]] = None,
+        dedup: Optional[FunctionDedup] = None,
+        priority: str = "interactive",
+        tenant: Optional[int] = None,
+        compact: bool = False,
+        triage: Optional[FunctionTriage] = None,
+        checkpoint: Optional[WorkCheckpoint] = None
+    ):
+        self.llm_service = llm_service
+        self.dispatcher = dispatcher or llm_dispatcher
+        self.use_cache = use_cache
+        self.on_progress = on_progress
+        self.dedup = dedup or FunctionDedup()
+        self.priority = priority
+        self.tenant = tenant
+        self.progress = {'windows_total': 0, 'windows_done': 0, 'functions_total': 0, 'functions_done': 0}
+        self.saved_calls = 0  # 复用重复函数结果而省去的 LLM 调用数
+        self.compact = compact
+        self.compaction = {'prompt_tokens_original': 0, 'prompt_tokens_compacted': 0}
+        self.triage = triage
+        # 各分级的函数数，以及主模型单函数调用、小模型调用和评分的耗时（秒）
+        self.triage_stats = {tier: 0 for tier in TIERS}
+        self.triage_stats.update(main_calls=0, main_seconds=0.0, cheap_seconds=0.0, scoring_seconds=0.0)
+        self.checkpoint = checkpoint
+
+    def _report(self, annotations: List[Dict], errors: List[Dict]):
+        """上报单个调用单元的结果（结果为空时也上报，以便更新进度）"""
+        if self.on_progress:
+            self.on_progress(annotations, errors)
+
+    def _save(self, key: str, kind: str, annotations: List[Dict], errors: List[Dict]):
+        """启用检查点时提交单个工作单元的标注和状态"""
+        if self.checkpoint is not None:
+            self.checkpoint.complete(key, kind, annotations, errors)
+
+    def _pending_units(self, items: List[Dict], key_of: Callable[[Dict], str], kind: str, done_field: str) -> List[Dict]:
+        """跳过之前执行中已完成的单元（计入进度），并登记其余单元"""
+        if self.checkpoint is None:
+            return items
+        pending = [item for item in items if not self.checkpoint.is_done(key_of(item))]
+        self.progress[done_field] += len(items) - len(pending)
+        self.checkpoint.plan({key_of(item): kind for item in pending})
+        return pending
+
+    @staticmethod
+    def _window_key(window: Dict) -> str:
+        return f"line:{window['own_start']}-{window['own_end']}"
+
+    @staticmethod
+    def _function_key(func: Dict) -> str:
+        return f"function:{func['line_start']}:{func['name']}"
+
+    async def generate_line_annotations(self, code: str, language: str, windows: Optional[List[Dict]] = None) -> Dict:
+        """
+        生成行内标注，大文件按行窗口切分后并发处理
+
+        Args:
+            code: 代码内容
+            language: 编程语言
+            windows: 已切分的行窗口（prepare_file 的结果，可包含压缩片段），为 None 时在此切分
+
+        Returns:
+            {'annotations': 按行号排序的标注字典列表, 'errors': 失败的窗口及原因}
+        """
+        if windows is None:
+            windows = self._split_windows(code, language)
+        self.progress['windows_total'] += len(windows)
+        windows = self._pending_units(windows, self._window_key, 'line', 'windows_done')
+        if self.compact:
+            self._compact_windows(code, language, windows)
+
+        async def worker(window: Dict) -> Dict:
+            compacted = window.get('compacted')
+            if compacted is not None and compacted.empty:
+                # 窗口内只有注释和空行，无需调用 LLM
+                return {'annotations': []}
+            prompt_code = window['code'] if compacted is None else compacted.code
+            result = await self.llm_service.generate_line_annotations(prompt_code, language, use_cache=self.use_cache)
+            if 'error' in result:
+                raise LLMCallError(result)
+            return result
+
+        annotations = []
+        errors = []
+        seen = set()
+
+        def on_done(task: TaskResult):
+            window = task.item
+            self.progress['windows_done'] += 1
+            if not task.ok:
+                error = {'scope': 'line', 'line_start': window['start'], 'line_end': window['end'], 'error': task.error}
+                errors.append(error)
+                self._save(self._window_key(window), 'line', [], [error])
+                self._report([], [error])
+                return
+            new_annotations = []
+            for ann in self._window_annotations(window, task.value):
+                key = (ann['line_number'], ann['annotation_type'], ann['content'])
+                if key not in seen:
+                    seen.add(key)
+                    new_annotations.append(ann)
+            annotations.extend(new_annotations)
+            self._save(self._window_key(window), 'line', new_annotations, [])
+            self._report(new_annotations, [])
+
+        await self.dispatcher.map(self.llm_service.provider, windows, worker, on_done, self.priority, self.tenant)
+
+        annotations.sort(key=lambda ann: ann['line_number'])
+        return {'annotations': annotations, 'errors': errors}
+
+    def _split_windows(self, code: str, language: str) -> List[Dict]:
+        """按模型上下文窗口和超时预算切分行窗口"""
+        return split_windows(code, language, self.llm_service.provider, self.llm_service.model)
+
+    def _compact_windows(self, code: str, language: str, windows: List[Dict]):
+        """为尚无压缩片段的窗口生成压缩片段（window['compacted']），并累计节省的 token"""
+        compactor = None
+        for window in windows:
+            if window.get('compacted') is None:
+                compactor = compactor or FileCompactor(code, language, self.llm_service.provider, self.llm_service.model)
+                window['compacted'] = compactor.compact_window(window)
+            self.compaction['prompt_tokens_original'] += window['compacted'].original_tokens
+            self.compaction['prompt_tokens_compacted'] += window['compacted'].compacted_tokens
+
+    def compaction_savings(self) -> Dict:
+        """行内标注代码压缩前后的 token 数和节省量（未启用压缩时为空）"""
+        if not self.compact:
+            return {}
+        original = self.compaction['prompt_tokens_original']
+        saved = original - self.compaction['prompt_tokens_compacted']
+        return dict(
+            self.compaction,
+            prompt_tokens_saved=saved,
+            prompt_tokens_saved_ratio=round(saved / original, 3) if original else 0.0
+        )
+
+    @staticmethod
+    def _prepare_functions(code: str, language: str, functions: Optional[List[Dict]]) -> List[Dict]:
+        """解析函数并分配调用单元编号"""
+        if functions is None:
+            parse_result = code_parser.parse_code(code, language)
+            functions = parse_result['functions'] if parse_result['success'] else []
+        return [dict(func, id=f"f{index}") for index, func in enumerate(functions) if func.get('code')]
+
+    def _window_annotations(self, window: Dict, result: Dict) -> List[Dict]:
+        """将窗口内的相对行号（压缩时先还原为压缩前的行号）换算为绝对行号，并丢弃不归该窗口负责的行"""
+        annotations = []
+        compacted = window.get('compacted')
+        for ann in result.get('annotations') or []:
+            if not isinstance(ann, dict):
+                continue
+            try:
+                line = int(ann['line'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if compacted is not None:
+                line = compacted.original_line(line)
+                if line is None:
+                    continue
+            line += window['start'] - 1
+            if window['own_start'] <= line <= window['own_end']:
+                annotations.append(self._line_annotation(dict(ann, line=line)))
+        return annotations
+
+    async def generate_function_annotations(
+        self,
+        code: str,
+        language: str,
+        functions: Optional[List[Dict]] = None,
+        batch: bool = False
+    ) -> Dict:
+        """
+        并发生成函数标注，结果按源码顺序排列
+
+        Args:
+            code: 代码内容
+            language: 编程语言
+            functions: 已解析的函数列表，为空时自动解析
+            batch: 是否将多个小函数打包到一次请求中
+
+        Returns:
+            {'annotations': 成功的标注字典列表, 'errors': 失败的函数及原因}
+        """
+        functions = self._prepare_functions(code, language, functions)
+        self.progress['functions_total'] += len(functions)
+        functions = self._pending_units(functions, self._function_key, 'function', 'functions_done')
+        leaders, followers = self.dedup.split(functions, language)
+
+        results = {}
+        errors = {}
+        try:
+            await asyncio.gather(
+                self._run_leaders(leaders, language, batch, results, errors),
+                *(self._follow(func, results, errors) for func in followers)
+            )
+        finally:
+            # 中断时让等待这些函数的其他生成器得到错误，而不是一直等待
+            for func in leaders:
+                self.dedup.resolve(func['dedup_key'], error="重复函数的首次生成未完成")
+
+        annotations = []
+        error_list = []
+        for func in functions:
+            if func['id'] in results:
+                annotations.append(self._function_annotation(func, results[func['id']]))
+            elif func['id'] in errors:
+                error_list.append(self._function_error(func, errors[func['id']]))
+        return {'annotations': annotations, 'errors': error_list}
+
+    async def _run_leaders(self, functions: List[Dict], language: str, batch: bool, results: Dict, errors: Dict):
+        """为去重后的函数请求 LLM（启用分级时按分级选择主模型、小模型或模板），结果写入 results / errors 并发布给重复函数"""
+        cheap = []
+        if self.triage is not None and functions:
+            tiers, seconds = await self.triage.route(functions, language, use_cache=self.use_cache)
+            self.triage_stats['scoring_seconds'] += seconds
+            main = []
+            for func in functions:
+                tier = tiers[func['id']]
+                self.triage_stats[tier] += 1
+                if tier == TIER_TEMPLATE:
+                    self._finish_function(func, results, errors, template_annotation(func, language, func.get('boilerplate')))
+                elif tier == TIER_CHEAP:
+                    cheap.append(func)
+                else:
+                    main.append(func)
+            functions = main
+
+        singles = functions
+        if batch:
+            batches, singles = pack_functions(functions, self.llm_service.provider, self.llm_service.model)
+            fallback = await self._run_batches(batches, language, results)
+            singles = sorted(singles + fallback, key=lambda func: func['line_start'])
+
+        await asyncio.gather(
+            self._run_singles(self.llm_service, singles, language, results, errors),
+            self._run_singles(self.triage.cheap_service if cheap else None, cheap, language, results, errors)
+        )
+
+    async def _run_singles(self, service, functions: List[Dict], language: str, results: Dict, errors: Dict):
+        """逐个函数请求 LLM"""
+        if not functions:
+            return
+        timing_key = 'main' if service is self.llm_service else 'cheap'
+
+        async def worker(func: Dict) -> Dict:
+            started = time.perf_counter()
+            func_result = await service.generate_function_annotations(
+                func['code'],
+                language,
+                func['name'],
+                use_cache=self.use_cache
+            )
+            self.triage_stats[f'{timing_key}_seconds'] += time.perf_counter() - started
+            if timing_key == 'main':
+                self.triage_stats['main_calls'] += 1
+            if 'error' in func_result:
+                raise LLMCallError(func_result)
+            return func_result
+
+        def on_done(task: TaskResult):
+            self._finish_function(task.item, results, errors, task.value if task.ok else None, None if task.ok else task.error)
+
+        await self.dispatcher.map(service.provider, functions, worker, on_done, self.priority, self.tenant)
+
+    def _finish_function(self, func: Dict, results: Dict, errors: Dict, value: Optional[Dict] = None, error: Optional[str] = None):
+        """记录单个函数的结果或错误，并发布给重复函数"""
+        self.progress['functions_done'] += 1
+        if error is None:
+            results[func['id']] = value
+            self.dedup.resolve(func['dedup_key'], result=value)
+            self._finish_unit(func, value, None)
+        else:
+            errors[func['id']] = error
+            self.dedup.resolve(func['dedup_key'], error=error)
+            self._finish_unit(func, None, error)
+
+    def _finish_unit(self, func: Dict, value: Optional[Dict], error: Optional[str]):
+        """提交并上报单个函数的标注或错误"""
+        annotations = [self._function_annotation(func, value)] if error is None else []
+        func_errors = [self._function_error(func, error)] if error is not None else []
+        self._save(self._function_key(func), 'function', annotations, func_errors)
+        self._report(annotations, func_errors)
+
+    def triage_summary(self) -> Dict:
+        """
+        分级统计（未启用分级时为空）
+
+        Returns:
+            各分级的函数数、省去的主模型调用数，以及估算的串行耗时节省
+            （省去的调用按本次主模型单函数调用的平均耗时计算，扣除小模型调用和评分的耗时）
+        """
+        if self.triage is None:
+            return {}
+        stats = self.triage_stats
+        saved_calls = stats[TIER_CHEAP] + stats[TIER_TEMPLATE]
+        if stats['main_calls']:
+            per_call = stats['main_seconds'] / stats['main_calls']
+        else:
+            per_call = token_estimator.expected_latency(self.llm_service.provider, self.llm_service.model, FUNCTION_OUTPUT_TOKENS)
+        saved_seconds = saved_calls * per_call - stats['cheap_seconds'] - stats['scoring_seconds']
+        return {
+            'triage_main': stats[TIER_MAIN],
+            'triage_cheap': stats[TIER_CHEAP],
+            'triage_template': stats[TIER_TEMPLATE],
+            'triage_calls_saved': saved_calls,
+            'triage_latency_saved_seconds': round(saved_seconds, 1)
+        }
+
+    async def _follow(self, func: Dict, results: Dict, errors: Dict):
+        """等待相同函数体的结果，按本函数的位置生成标注"""
+        func_result, error = await self.dedup.wait(func['dedup_key'])
+        self.progress['functions_done'] += 1
+        if error is None:
+            self.saved_calls += 1
+            results[func['id']] = func_result
+        else:
+            errors[func['id']] = error
+        self._finish_unit(func, func_result if error is None else None, error)
+
+    async def _run_batches(self, batches: List[List[Dict]], language: str, results: Dict) -> List[Dict]:
+        """
+        执行打包请求，将结果写入 results
+
+        Returns:
+            打包响应失败或缺失的函数，需要回退为单函数请求
+        """
+        async def worker(batch: List[Dict]) -> Dict:
+            batch_result = await self.llm_service.generate_batch_function_annotations(
+                batch,
+                language,
+                use_cache=self.use_cache
+            )
+            if 'error' in batch_result:
+                raise LLMCallError(batch_result)
+            return batch_result
+
+        fallback = []
+
+        def on_done(task: TaskResult):
+            batch_result = task.value if task.ok else {}
+            finished = []
+            for func in task.item:
+                if func['id'] in batch_result:
+                    results[func['id']] = batch_result[func['id']]
+                    self.dedup.resolve(func['dedup_key'], result=batch_result[func['id']])
+                    annotation = self._function_annotation(func, batch_result[func['id']])
+                    self._save(self._function_key(func), 'function', [annotation], [])
+                    finished.append(annotation)
+                else:
+                    fallback.append(func)
+            self.progress['functions_done'] += len(finished)
+            self._report(finished, [])
+
+        await self.dispatcher.map(self.llm_service.provider, batches, worker, on_done, self.priority, self.tenant)
+        return fallback
+
+    def estimate(
+        self,
+        code: str,
+        language: str,
+        line_annotations: bool = True,
+        function_annotations: bool = True,
+        batch: bool = False
+    ) -> Dict:
+        """
+        预估生成流程将发出的请求（不调用 LLM）
+
+        Args:
+            code: 代码内容
+            language: 编程语言
+            line_annotations: 是否生成行内标注
+            function_annotations: 是否生成函数标注
+            batch: 是否打包小函数
+
+        Returns:
+            请求数、缓存命中数、输入/输出 token 和预计耗时
+        """
+        service = self.llm_service
+        provider, model = service.provider, service.model
+        requests = []
+
+        if line_annotations:
+            windows = self._split_windows(code, language)
+            compactor = FileCompactor(code, language, provider, model) if self.compact else None
+            for window in windows:
+                prompt_code = window['code']
+                if compactor is not None:
+                    compacted = compactor.compact_window(window)
+                    if compacted.empty:
+                        continue
+                    prompt_code = compacted.code
+                prompt = service._build_line_annotation_prompt(prompt_code, language)
+                lines = window['end'] - window['start'] + 1
+                cached = self.use_cache and service.is_cached("line", language, prompt_code)
+                requests.append((prompt, LINE_OUTPUT_TOKENS_PER_LINE * lines, cached))
+
+        if function_annotations:
+            functions = self._prepare_functions(code, language, None)
+            singles = functions
+            if batch:
+                batches, singles = pack_functions(functions, provider, model)
+                for group in batches:
+                    prompt = service._build_batch_function_annotation_prompt(group, language)
+                    cached = self.use_cache and all(service.is_cached("function", language, f['code']) for f in group)
+                    requests.append((prompt, FUNCTION_OUTPUT_TOKENS * len(group), cached))
+            for func in singles:
+                prompt = service._build_function_annotation_prompt(func['code'], language)
+                cached = self.use_cache and service.is_cached("function", language, func['code'])
+                requests.append((prompt, FUNCTION_OUTPUT_TOKENS, cached))
+
+        pending = [(prompt, output) for prompt, output, cached in requests if not cached]
+        latencies = [token_estimator.expected_latency(provider, model, output) for _, output in pending]
+        concurrency = self.dispatcher.limit_for(provider)
+        return {
+            'requests': len(pending),
+            'cached_requests': len(requests) - len(pending),
+            'input_tokens': sum(token_estimator.count(prompt, provider, model) for prompt, _ in pending),
+            'output_tokens': sum(output for _, output in pending),
+            'serial_latency_seconds': round(sum(latencies), 1),
+            'estimated_seconds': round(max(sum(latencies) / concurrency, max(latencies, default=0.0)), 1)
+        }
+
+    @staticmethod
+    def _line_annotation(ann: Dict) -> Dict:
+        """LLM 行内标注结果 -> 标注字段"""
+        return {
+            'type': 'line',
+            'line_number': ann['line'],
+            'content': ann['content'],
+            'annotation_type': ann['type'],
+            'color': get_color_for_type(ann['type'])
+        }
+
+    @staticmethod
+    def _function_error(func: Dict, error: str) -> Dict:
+        """函数标注失败信息"""
+        return {'scope': 'function', 'function_name': func['name'], 'line_start': func.get('line_start'), 'error': error}
+
+    @staticmethod
+    def _function_annotation(func: Dict, func_result: Dict) -> Dict:
+        """LLM 函数标注结果 -> 标注字段"""
+        return {
+            'type': 'function',
+            'line_number': func['line_start'],
+            'line_end': func.get('line_end'),
+            'function_name': func['name'],
+            'content': build_function_annotation_content(func_result),
+            'annotation_type': 'info',
+            'color': '#1890ff',
+            'fingerprint': func.get('fingerprint')
+        }
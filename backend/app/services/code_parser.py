@@ -2,7 +2,20 @@
 代码解析服务 - 使用AST解析代码结构
 """
 import ast
-from typing import List, Dict, Optional
+import hashlib
+import io
+import tokenize
+from typing import List, Dict, Optional, Set
+
+# 使用 // 和 /* */ 注释的语言
+C_STYLE_LANGUAGES = {
+    'javascript', 'typescript', 'js', 'ts', 'jsx', 'tsx', 'java', 'c', 'cpp', 'c++', 'csharp', 'c#',
+    'go', 'rust', 'kotlin', 'swift', 'scala', 'php', 'dart'
+}
+# 使用 # 注释的语言
+HASH_COMMENT_LANGUAGES = {'ruby', 'shell', 'bash', 'sh', 'yaml', 'r', 'perl', 'toml'}
+# 使用 -- 注释的语言
+DASH_COMMENT_LANGUAGES = {'sql', 'lua', 'haskell'}
 
 
 class CodeParser:
@@ -31,7 +44,8 @@ class CodeParser:
                         'line_start': node.lineno,
                         'line_end': node.end_lineno,
                         'args': [arg.arg for arg in node.args.args],
-                        'code': ast.get_source_segment(code, node) or ""
+                        'code': ast.get_source_segment(code, node) or "",
+                        'fingerprint': CodeParser.function_fingerprint(node)
                     }
                     functions.append(func_info)
                 
@@ -59,6 +73,23 @@ class CodeParser:
                 'total_lines': len(code.split('\n'))
             }
     
+    @staticmethod
+    def function_fingerprint(node: ast.AST) -> str:
+        """
+        计算函数指纹
+        
+        基于规范化的 AST（不含行号、空白和注释）计算哈希，
+        函数移动位置或仅调整格式、注释时指纹不变
+        
+        Args:
+            node: 函数定义节点
+            
+        Returns:
+            sha256 十六进制字符串
+        """
+        normalized = ast.dump(node, include_attributes=False)
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    
     @staticmethod
     def parse_javascript(code: str) -> Dict:
         """
@@ -104,6 +135,76 @@ class CodeParser:
             'total_lines': len(lines)
         }
     
+    @staticmethod
+    def non_semantic_lines(code: str, language: str) -> Set[int]:
+        """
+        找出不影响代码语义的行：空行、整行注释、多行文档字符串的中间行
+        
+        Args:
+            code: 代码字符串
+            language: 编程语言
+            
+        Returns:
+            行号集合（1 起始）
+        """
+        lines = code.split('\n')
+        result = {index for index, line in enumerate(lines, 1) if not line.strip()}
+        language = (language or '').lower()
+        
+        if language == 'python':
+            result |= CodeParser._python_non_semantic_lines(code, lines)
+        elif language in C_STYLE_LANGUAGES:
+            in_block = False
+            for index, line in enumerate(lines, 1):
+                stripped = line.strip()
+                if in_block:
+                    # 块注释结束行之后还有代码时保留该行
+                    if '*/' in stripped:
+                        in_block = False
+                        if stripped.endswith('*/'):
+                            result.add(index)
+                    else:
+                        result.add(index)
+                elif stripped.startswith('//'):
+                    result.add(index)
+                elif stripped.startswith('/*'):
+                    if '*/' not in stripped[2:]:
+                        in_block = True
+                        result.add(index)
+                    elif stripped.endswith('*/'):
+                        result.add(index)
+        elif language in HASH_COMMENT_LANGUAGES or language in DASH_COMMENT_LANGUAGES:
+            marker = '#' if language in HASH_COMMENT_LANGUAGES else '--'
+            result |= {index for index, line in enumerate(lines, 1) if line.strip().startswith(marker)}
+        return result
+    
+    @staticmethod
+    def _python_non_semantic_lines(code: str, lines: List[str]) -> Set[int]:
+        """Python：按词法分析找整行注释，按 AST 找多行文档字符串的中间行"""
+        result = set()
+        code_lines = set()
+        try:
+            for token in tokenize.generate_tokens(io.StringIO(code).readline):
+                if token.type in (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER):
+                    continue
+                code_lines.update(range(token.start[0], token.end[0] + 1))
+            result |= {index for index, line in enumerate(lines, 1) if line.strip().startswith('#') and index not in code_lines}
+        except (tokenize.TokenError, IndentationError, SyntaxError):
+            return result
+        
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return result
+        for node in ast.walk(tree):
+            if not isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) or not node.body:
+                continue
+            first = node.body[0]
+            if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and isinstance(first.value.value, str):
+                # 保留首行（通常是摘要）和结束行，删除中间的详细说明
+                result.update(range(first.lineno + 1, first.end_lineno))
+        return result
+    
     @staticmethod
     def parse_code(code: str, language: str) -> Dict:
         """
@@ -133,6 +234,18 @@ class CodeParser:
             }
 
 
+
+def parse_functions(code: str, language: str) -> List[Dict]:
+    """
+    解析代码中的函数（模块级函数，可以提交到进程池执行）
+    
+    Returns:
+        函数列表，解析失败时为空
+    """
+    parse_result = CodeParser.parse_code(code, language)
+    return parse_result['functions'] if parse_result['success'] else []
+
+
 # 创建全局实例
 code_parser = CodeParser()
 
@@ -0,0 +1,59 @@
+"""
+函数打包服务 - 将多个小函数合并到一次 LLM 请求中
+"""
+from typing import Dict, List, Tuple
+from ..config import settings
+from .token_estimator import token_estimator
+
+
+def pack_functions(
+    functions: List[Dict],
+    provider: str = None,
+    model: str = None,
+    token_budget: int = None,
+    max_function_tokens: int = None,
+    max_batch_size: int = None,
+) -> Tuple[List[List[Dict]], List[Dict]]:
+    """
+    按 token 预算将小函数打包
+
+    Args:
+        functions: 函数解析结果列表（需包含 code）
+        provider: LLM 提供商，用于选择 token 计数方式
+        model: 模型名称
+        token_budget: 单个打包请求中代码的 token 上限
+        max_function_tokens: 超过该大小的函数单独请求
+        max_batch_size: 单个打包请求的函数数量上限
+
+    Returns:
+        (打包后的函数分组列表, 需要单独请求的函数列表)，均保持源码顺序
+    """
+    token_budget = token_budget or settings.LLM_BATCH_TOKEN_BUDGET
+    max_function_tokens = max_function_tokens or settings.LLM_BATCH_MAX_FUNCTION_TOKENS
+    max_batch_size = max_batch_size or settings.LLM_BATCH_MAX_FUNCTIONS
+
+    batches = []
+    singles = []
+    current = []
+    current_tokens = 0
+
+    for func in functions:
+        tokens = token_estimator.count(func['code'], provider, model)
+        if tokens > max_function_tokens:
+            singles.append(func)
+            continue
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(func)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+
+    # 只有一个函数的分组没有打包的意义
+    for batch in [b for b in batches if len(b) == 1]:
+        batches.remove(batch)
+        singles.append(batch[0])
+
+    return batches, singles
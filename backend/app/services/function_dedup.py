@@ -0,0 +1,80 @@
+"""
+函数去重服务 - 按规范化函数体哈希合并重复函数的 LLM 调用
+"""
+import asyncio
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+
+def normalized_body_hash(func: Dict, language: str) -> Optional[str]:
+    """
+    函数的规范化哈希
+
+    Python 函数使用 AST 指纹（忽略注释、空白和位置），
+    其他语言按去除首尾空白和空行后的源码计算
+
+    Returns:
+        哈希值，函数没有源码时返回 None
+    """
+    if func.get('fingerprint'):
+        return func['fingerprint']
+    code = func.get('code')
+    if not code:
+        return None
+    lines = [line.strip() for line in code.splitlines() if line.strip()]
+    normalized = language + "\n" + "\n".join(lines)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class FunctionDedup:
+    """
+    函数去重表（一次生成或一个项目任务内共享）
+
+    相同哈希的函数只有第一个（leader）发起 LLM 请求，其余（follower）等待其结果，
+    再按各自的行号生成标注
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, asyncio.Future] = {}
+        self.stats = {"unique": 0, "duplicates": 0, "saved_calls": 0}
+
+    def split(self, functions: List[Dict], language: str) -> Tuple[List[Dict], List[Dict]]:
+        """
+        划分需要请求 LLM 的函数和等待已有结果的重复函数，并为函数记录 dedup_key
+
+        Returns:
+            (leaders, followers)，均保持原有顺序
+        """
+        leaders, followers = [], []
+        for func in functions:
+            key = normalized_body_hash(func, language)
+            func['dedup_key'] = key
+            if key is None:
+                leaders.append(func)
+            elif key in self._futures:
+                self.stats["duplicates"] += 1
+                followers.append(func)
+            else:
+                self._futures[key] = asyncio.get_running_loop().create_future()
+                self.stats["unique"] += 1
+                leaders.append(func)
+        return leaders, followers
+
+    def resolve(self, key: Optional[str], result: Optional[Dict] = None, error: Optional[str] = None):
+        """发布 leader 的结果或错误（重复发布时忽略）"""
+        future = self._futures.get(key) if key else None
+        if future is not None and not future.done():
+            future.set_result((result, error))
+
+    async def wait(self, key: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        等待 leader 的结果
+
+        Returns:
+            (结果, 错误)，成功时错误为 None
+        """
+        # shield：某个 follower 被取消时不影响等待同一结果的其他函数
+        result, error = await asyncio.shield(self._futures[key])
+        if error is None:
+            self.stats["saved_calls"] += 1
+        return result, error
@@ -0,0 +1,233 @@
+"""
+函数分级服务 - 按复杂度决定函数标注由主模型、小模型还是模板生成
+"""
+import ast
+import re
+import textwrap
+import time
+from typing import Dict, List, Optional, Tuple
+from ..config import settings
+
+# 分级结果
+TIER_MAIN = "main"  # 主模型
+TIER_CHEAP = "cheap"  # 小模型
+TIER_TEMPLATE = "template"  # 模板，不调用 LLM
+TIERS = (TIER_MAIN, TIER_CHEAP, TIER_TEMPLATE)
+
+# Python 中增加一条执行路径的节点（圈复杂度）
+_DECISION_NODES = (
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.Try, ast.ExceptHandler, ast.With, ast.AsyncWith,
+    ast.IfExp, ast.comprehension, ast.Assert
+)
+# 其他语言按关键字估算分支数
+_DECISION_PATTERN = re.compile(r'\b(if|for|while|case|catch|except|elif|foreach)\b|&&|\|\||\?\s*[^:]+:')
+
+
+def _parse_function(func: Dict) -> Optional[ast.AST]:
+    """解析单个 Python 函数（方法需要先去掉类内缩进）"""
+    try:
+        tree = ast.parse(textwrap.dedent(func.get('code') or ''))
+    except SyntaxError:
+        return None
+    if tree.body and isinstance(tree.body[0], (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return tree.body[0]
+    return None
+
+
+def _body_without_docstring(node: ast.AST) -> List[ast.stmt]:
+    body = list(node.body)
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+        body = body[1:]
+    return body
+
+
+def complexity_score(func: Dict, language: str) -> float:
+    """
+    函数复杂度：圈复杂度 + 语句数 / 4
+
+    Python 函数按 AST 统计分支和语句，其他语言按关键字和非空行数估算
+
+    Args:
+        func: code_parser 解析出的函数
+        language: 编程语言
+
+    Returns:
+        复杂度分数，简单的存取函数约为 1-2
+    """
+    node = _parse_function(func) if language == 'python' else None
+    if node is not None:
+        decisions = 0
+        statements = 0
+        for child in ast.walk(node):
+            if isinstance(child, _DECISION_NODES):
+                decisions += 1
+            elif isinstance(child, ast.BoolOp):
+                decisions += len(child.values) - 1
+            if isinstance(child, ast.stmt) and child is not node:
+                statements += 1
+        # 文档字符串不计入语句数
+        statements -= len(node.body) - len(_body_without_docstring(node))
+        return 1 + decisions + statements / 4
+
+    lines = [line.strip() for line in (func.get('code') or '').splitlines() if line.strip()]
+    decisions = sum(len(_DECISION_PATTERN.findall(line)) for line in lines)
+    return 1 + decisions + max(0, len(lines) - 2) / 4
+
+
+def _is_simple_value(node: ast.AST) -> bool:
+    """常量、变量、属性访问（如 self.name）"""
+    if isinstance(node, ast.Attribute):
+        return _is_simple_value(node.value)
+    return isinstance(node, (ast.Constant, ast.Name))
+
+
+def boilerplate_kind(func: Dict, language: str) -> Optional[str]:
+    """
+    识别无需 LLM 的样板函数（仅 Python）
+
+    Returns:
+        empty（空实现）、getter（直接返回属性或常量）、setter（只给一个属性赋值）、
+        init（只保存参数的构造函数）；不是样板函数时返回 None
+    """
+    if language != 'python':
+        return None
+    node = _parse_function(func)
+    if node is None:
+        return None
+    body = _body_without_docstring(node)
+
+    if all(isinstance(stmt, ast.Pass) or (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant)) for stmt in body):
+        return "empty"
+    if len(body) == 1 and isinstance(body[0], ast.Return) and body[0].value is not None and _is_simple_value(body[0].value):
+        return "getter"
+    if len(body) == 1 and isinstance(body[0], ast.Assign) and len(body[0].targets) == 1 \
+            and isinstance(body[0].targets[0], ast.Attribute) and _is_simple_value(body[0].value):
+        return "setter"
+    if node.name == '__init__':
+        for stmt in body:
+            if isinstance(stmt, (ast.Assign, ast.AnnAssign)):
+                targets = stmt.targets if isinstance(stmt, ast.Assign) else [stmt.target]
+                value = stmt.value
+                if not all(isinstance(t, ast.Attribute) for t in targets) or (value is not None and not _is_simple_value(value)):
+                    return None
+            elif not (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call)
+                      and isinstance(stmt.value.func, ast.Attribute) and stmt.value.func.attr == '__init__'):
+                # 只允许 super().__init__(...) 调用
+                return None
+        return "init"
+    return None
+
+
+def template_annotation(func: Dict, language: str, kind: Optional[str] = None) -> Dict:
+    """
+    按函数签名生成模板标注（格式与 LLM 函数标注一致）
+
+    Args:
+        func: code_parser 解析出的函数
+        language: 编程语言
+        kind: boilerplate_kind 的结果
+
+    Returns:
+        标注数据字典
+    """
+    name = func.get('name', '')
+    node = _parse_function(func) if language == 'python' else None
+    parameters = []
+    returns = None
+    if node is not None:
+        for arg in node.args.args + node.args.kwonlyargs:
+            if arg.arg in ('self', 'cls'):
+                continue
+            parameters.append({
+                'name': arg.arg,
+                'type': ast.unparse(arg.annotation) if arg.annotation is not None else '',
+                'description': f"参数 {arg.arg}"
+            })
+        if node.returns is not None:
+            returns = {'type': ast.unparse(node.returns), 'description': '返回值'}
+    else:
+        parameters = [
+            {'name': arg, 'type': '', 'description': f"参数 {arg}"}
+            for arg in func.get('args', []) if arg not in ('self', 'cls')
+        ]
+
+    descriptions = {
+        'empty': f"{name}：空实现（占位或由子类覆盖）",
+        'getter': f"{name}：直接返回对应的属性或常量",
+        'setter': f"{name}：设置对应的属性",
+        'init': f"{name}：初始化实例，保存传入的参数",
+    }
+    result = {
+        'function_name': name,
+        'description': descriptions.get(kind, f"{name}：逻辑简单的辅助函数"),
+        'parameters': parameters,
+        'template': True
+    }
+    if returns:
+        result['returns'] = returns
+    return result
+
+
+class FunctionTriage:
+    """
+    函数分级器（一次生成或一个项目任务内共享）
+
+    1. 样板函数（空实现、存取函数、只保存参数的构造函数）使用模板
+    2. 启发式复杂度达到 threshold 的函数交给主模型
+    3. 其余函数在配置了小模型时由小模型一次性评分，评分达到 model_threshold 的交给主模型，
+       其他由小模型生成标注；未配置小模型时使用模板
+    """
+
+    def __init__(
+        self,
+        cheap_service=None,
+        threshold: float = None,
+        model_threshold: int = None,
+        model_scoring: bool = True
+    ):
+        self.cheap_service = cheap_service
+        self.threshold = threshold or settings.LLM_TRIAGE_THRESHOLD
+        self.model_threshold = model_threshold or settings.LLM_TRIAGE_MODEL_THRESHOLD
+        self.model_scoring = model_scoring and cheap_service is not None
+
+    async def route(self, functions: List[Dict], language: str, use_cache: bool = True) -> Tuple[Dict[str, str], float]:
+        """
+        为函数分级，并记录样板函数的类型（func['boilerplate']）
+
+        Args:
+            functions: 函数列表（含 id）
+            language: 编程语言
+            use_cache: 小模型评分是否读取缓存
+
+        Returns:
+            ({函数 id: 分级}, 小模型评分耗时（秒）)
+        """
+        tiers = {}
+        candidates = []
+        for func in functions:
+            kind = boilerplate_kind(func, language)
+            if kind is not None:
+                func['boilerplate'] = kind
+                tiers[func['id']] = TIER_TEMPLATE
+            elif complexity_score(func, language) >= self.threshold:
+                tiers[func['id']] = TIER_MAIN
+            else:
+                candidates.append(func)
+
+        seconds = 0.0
+        scores = {}
+        if self.model_scoring and candidates:
+            size = settings.LLM_TRIAGE_SCORE_BATCH
+            started = time.perf_counter()
+            for offset in range(0, len(candidates), size):
+                result = await self.cheap_service.score_functions(candidates[offset:offset + size], language, use_cache=use_cache)
+                # 评分失败时按启发式结果处理，不影响生成
+                if 'error' not in result:
+                    scores.update(result)
+            seconds = time.perf_counter() - started
+
+        fallback = TIER_CHEAP if self.cheap_service is not None else TIER_TEMPLATE
+        for func in candidates:
+            score = scores.get(func['id'])
+            tiers[func['id']] = TIER_MAIN if score is not None and score >= self.model_threshold else fallback
+        return tiers, seconds
@@ -51,6 +51,29 @@ class GitService:
                 'error': f'处理失败: {str(e)}'
             }
     
+    @staticmethod
+    def read_directory(directory: str) -> Dict:
+        """
+        读取本地目录（如已检出的仓库）中的代码文件
+        
+        Args:
+            directory: 目录路径
+            
+        Returns:
+            结果字典，格式与 clone_repository 一致（不含 temp_dir）
+        """
+        if not os.path.isdir(directory):
+            return {
+                'success': False,
+                'error': f'目录不存在: {directory}'
+            }
+        files = GitService._get_code_files(directory)
+        return {
+            'success': True,
+            'files': files,
+            'message': f'找到{len(files)}个代码文件'
+        }
+    
     @staticmethod
     def _get_code_files(directory: str) -> List[Dict]:
         """
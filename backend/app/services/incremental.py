@@ -0,0 +1,101 @@
+"""
+增量生成服务 - 按函数指纹比对已有的函数标注，以及重新生成后替换旧标注
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+from sqlalchemy.orm import Session
+from ..models import Annotation
+
+
+def plan_incremental(functions: List[Dict], existing: List) -> Dict:
+    """
+    比对当前函数与已有函数标注
+
+    Args:
+        functions: 当前代码的函数解析结果（需包含 fingerprint）
+        existing: 文件已有的函数标注
+
+    Returns:
+        {
+            'generate': 新增或修改过、需要调用 LLM 的函数,
+            'reanchor': 未修改的 (标注, 函数)，只需更新行号,
+            'stale': 函数已删除或已修改、需要删除的标注（包括重复的标注和没有指纹的旧标注）
+        }
+    """
+    by_fingerprint = defaultdict(list)
+    stale = []
+    for annotation in existing:
+        if annotation.fingerprint:
+            by_fingerprint[annotation.fingerprint].append(annotation)
+        else:
+            stale.append(annotation)
+
+    generate = []
+    reanchor = []
+    for func in functions:
+        candidates = by_fingerprint.get(func.get('fingerprint'))
+        if candidates:
+            reanchor.append((candidates.pop(0), func))
+        else:
+            generate.append(func)
+
+    for candidates in by_fingerprint.values():
+        stale.extend(candidates)
+    return {'generate': generate, 'reanchor': reanchor, 'stale': stale}
+
+
+def replace_previous_annotations(db: Session, file_id: int, keep_ids: Set[int], errors: List[Dict], kinds: Iterable[str]):
+    """
+    删除被本次生成结果取代的旧标注（不提交）
+
+    生成失败的窗口内的行内标注和生成失败的函数的标注保留，避免失败时丢失已有标注
+
+    Args:
+        db: 数据库会话
+        file_id: 文件 ID
+        keep_ids: 本次生成写入的标注
+        errors: 本次生成失败的窗口/函数
+        kinds: 重新生成的标注类型（line / function）
+    """
+    failed_windows = [(e['line_start'], e['line_end']) for e in errors if e.get('scope') == 'line']
+    failed_functions = {(e.get('function_name'), e.get('line_start')) for e in errors if e.get('scope') == 'function'}
+    query = db.query(Annotation).filter(Annotation.file_id == file_id, Annotation.type.in_(list(kinds)))
+    for annotation in query:
+        if annotation.id in keep_ids:
+            continue
+        if annotation.type == "line":
+            if any(start <= (annotation.line_number or 0) <= end for start, end in failed_windows):
+                continue
+        elif (annotation.function_name, annotation.line_number) in failed_functions:
+            continue
+        db.delete(annotation)
+
+
+def delete_stale_annotations(db: Session, stale_ids: Iterable[int], errors: List[Dict]) -> int:
+    """
+    生成完成后删除已删除或已修改函数的旧标注（不提交）
+
+    重新生成失败的函数保留旧标注。修改过的函数行号可能已变化，按函数名匹配失败的函数
+
+    Args:
+        db: 数据库会话
+        stale_ids: 增量比对得到的过期函数标注
+        errors: 本次生成失败的窗口/函数
+
+    Returns:
+        删除的标注数
+    """
+    stale_ids = list(stale_ids)
+    if not stale_ids:
+        return 0
+    failed = {e.get('function_name') for e in errors if e.get('scope') == 'function'}
+    deleted = 0
+    # 不触发 autoflush：删除留到调用方提交时一起写入，避免提前持有数据库写锁
+    with db.no_autoflush:
+        stale = db.query(Annotation).filter(Annotation.id.in_(stale_ids)).all()
+    for annotation in stale:
+        if annotation.function_name in failed:
+            continue
+        db.delete(annotation)
+        deleted += 1
+    return deleted
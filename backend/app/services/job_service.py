@@ -0,0 +1,276 @@
+"""
+后台任务服务 - 持久化的进程内任务队列和 worker 池
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models import GenerationJob
+
+# 未结束的任务状态，应用重启后会重新入队
+UNFINISHED_STATUSES = ("queued", "running")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def update_job(job_id: int, **fields):
+    """使用独立会话更新任务字段"""
+    db = SessionLocal()
+    try:
+        job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        if job is None:
+            return
+        for key, value in fields.items():
+            setattr(job, key, value)
+        db.commit()
+    finally:
+        db.close()
+
+
+class JobProgress:
+    """任务进度，按最小间隔写入数据库"""
+
+    def __init__(self, job_id: int, interval: float = None):
+        self.job_id = job_id
+        self.interval = settings.JOB_PROGRESS_INTERVAL if interval is None else interval
+        self._pending: Dict = {}
+        self._flushed_at = 0.0
+
+    def update(self, **fields):
+        """
+        记录进度字段
+
+        Args:
+            fields: GenerationJob 的字段，如 functions_done、input_tokens
+        """
+        self._pending.update(fields)
+        if time.monotonic() - self._flushed_at >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """立即写入未保存的进度"""
+        if self._pending:
+            update_job(self.job_id, **self._pending)
+            self._pending = {}
+        self._flushed_at = time.monotonic()
+
+
+# 任务执行器：接收已脱离会话的任务对象和进度对象，失败时抛出异常
+JobRunner = Callable[[GenerationJob, JobProgress], Awaitable[None]]
+
+
+class JobManager:
+    """
+    任务管理器
+
+    任务先写入 generation_jobs 表再入队，由固定数量的 worker 在应用事件循环中执行。
+    单文件任务和项目任务分属 interactive / bulk 两个队列，各有独立的 worker，
+    长时间运行的项目任务不会阻塞单文件任务。
+    应用关闭时正在执行的任务保持 running 状态，下次启动时与排队中的任务一起重新入队。
+    没有注册执行器的任务（如命令行批量标注）由创建它的进程负责恢复，不会被重新入队
+    """
+
+    def __init__(self, workers: int = None, interactive_workers: int = None):
+        self.workers = workers or settings.JOB_WORKERS
+        self.interactive_workers = interactive_workers or settings.JOB_INTERACTIVE_WORKERS
+        self._runners: Dict[str, JobRunner] = {}
+        self._lanes: Dict[str, str] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[int, asyncio.Task] = {}
+        self._cancel_requested = set()
+        self._stopping = False
+
+    def register(self, kind: str, runner: JobRunner, lane: str = "bulk"):
+        """
+        注册任务类型的执行器
+
+        Args:
+            kind: 任务类型
+            runner: 执行器
+            lane: 所属队列，interactive（单文件）或 bulk（项目）
+        """
+        self._runners[kind] = runner
+        self._lanes[kind] = lane
+
+    @property
+    def started(self) -> bool:
+        return bool(self._queues)
+
+    def _enqueue(self, job: GenerationJob):
+        self._queues[self._lanes.get(job.kind, "bulk")].put_nowait(job.id)
+
+    async def start(self):
+        """启动 worker，并恢复上次未完成的任务"""
+        if self.started:
+            return
+        self._queues = {"interactive": asyncio.Queue(), "bulk": asyncio.Queue()}
+        self._stopping = False
+        db = SessionLocal()
+        try:
+            jobs = (
+                db.query(GenerationJob)
+                .filter(GenerationJob.status.in_(UNFINISHED_STATUSES), GenerationJob.kind.in_(list(self._runners)))
+                .order_by(GenerationJob.id)
+                .all()
+            )
+            for job in jobs:
+                job.status = "queued"
+                self._enqueue(job)
+            db.commit()
+            if jobs:
+                print(f"恢复 {len(jobs)} 个未完成的生成任务")
+        finally:
+            db.close()
+        self._workers = [asyncio.create_task(self._worker("bulk")) for _ in range(self.workers)]
+        self._workers += [asyncio.create_task(self._worker("interactive")) for _ in range(self.interactive_workers)]
+
+    async def stop(self):
+        """停止 worker（正在执行的任务保留 running 状态，重启后恢复）"""
+        self._stopping = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._running.clear()
+        self._queues = {}
+
+    def submit(self, db: Session, kind: str, params: Dict, file_id: int = None) -> GenerationJob:
+        """
+        创建任务并入队
+
+        Args:
+            db: 数据库会话
+            kind: 任务类型
+            params: 任务参数
+            file_id: 关联的文件
+
+        Returns:
+            新建的任务
+        """
+        if kind not in self._runners:
+            raise ValueError(f"未知的任务类型: {kind}")
+        job = GenerationJob(kind=kind, file_id=file_id, params=params, status="queued", errors=[])
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        # 未启动时任务保持 queued，启动后自动入队
+        if self.started:
+            self._enqueue(job)
+        return job
+
+    async def run(self, db: Session, kind: str, params: Dict, file_id: int = None) -> GenerationJob:
+        """
+        创建任务并在当前协程中执行（不经过队列，用于同步生成）
+
+        进程在执行期间退出时任务保持 running 状态，下次启动时与其他未完成的任务一起恢复
+
+        Args:
+            db: 数据库会话
+            kind: 任务类型
+            params: 任务参数
+            file_id: 关联的文件
+
+        Returns:
+            执行结束后的任务
+        """
+        if kind not in self._runners:
+            raise ValueError(f"未知的任务类型: {kind}")
+        job = GenerationJob(kind=kind, file_id=file_id, params=params, status="queued", errors=[])
+        db.add(job)
+        db.commit()
+        await self._execute(job.id)
+        db.refresh(job)
+        return job
+
+    async def cancel(self, db: Session, job: GenerationJob) -> GenerationJob:
+        """
+        取消任务，排队中的任务直接标记为 cancelled，执行中的任务停止剩余调用
+
+        Args:
+            db: 数据库会话
+            job: 任务
+
+        Returns:
+            更新后的任务
+        """
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = _now()
+            db.commit()
+        elif job.status == "running":
+            task = self._running.get(job.id)
+            if task is not None:
+                self._cancel_requested.add(job.id)
+                task.cancel()
+                # 等待执行器退出，使返回的状态为 cancelled
+                await asyncio.wait([task], timeout=5)
+                await asyncio.sleep(0)
+            else:
+                job.status = "cancelled"
+                job.finished_at = _now()
+                db.commit()
+        db.refresh(job)
+        return job
+
+    async def _worker(self, lane: str):
+        while True:
+            job_id = await self._queues[lane].get()
+            try:
+                await self._execute(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"生成任务 {job_id} 执行异常: {e}")
+
+    async def _execute(self, job_id: int):
+        """执行单个任务"""
+        db = SessionLocal()
+        try:
+            job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+            if job is None or job.status != "queued":
+                return
+            job.status = "running"
+            job.started_at = _now()
+            job.attempts = (job.attempts or 0) + 1
+            job.error = None
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+        finally:
+            db.close()
+
+        runner = self._runners.get(job.kind)
+        progress = JobProgress(job_id)
+        if runner is None:
+            update_job(job_id, status="failed", error=f"未知的任务类型: {job.kind}", finished_at=_now())
+            return
+
+        task = asyncio.create_task(runner(job, progress))
+        self._running[job_id] = task
+        try:
+            await task
+            progress.flush()
+            update_job(job_id, status="completed", finished_at=_now())
+        except asyncio.CancelledError:
+            if job_id in self._cancel_requested:
+                progress.flush()
+                update_job(job_id, status="cancelled", finished_at=_now())
+            if self._stopping:
+                # 应用关闭，未取消的任务保留 running 状态以便重启后恢复
+                raise
+        except Exception as e:
+            progress.flush()
+            update_job(job_id, status="failed", error=str(e), finished_at=_now())
+        finally:
+            self._running.pop(job_id, None)
+            self._cancel_requested.discard(job_id)
+
+
+# 创建全局实例
+job_manager = JobManager()
@@ -0,0 +1,200 @@
+"""
+调用延迟模型 - 按端点记录实际耗时与预估耗时之比，为每次调用计算超时和对冲请求的等待时间
+"""
+import asyncio
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+from ..config import settings
+from .token_estimator import FUNCTION_OUTPUT_TOKENS, LINE_OUTPUT_TOKENS_PER_LINE, token_estimator
+
+# 单个函数复杂度评分的输出 token 数
+TRIAGE_OUTPUT_TOKENS_PER_FUNCTION = 15
+
+
+class CallTimeoutError(asyncio.TimeoutError):
+    """单次调用超过按延迟模型计算的超时时间（按超时错误分类和重试）"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        super().__init__(f"LLM request timed out after {timeout:.1f}s")
+
+
+@dataclass
+class CallPlan:
+    """单次调用的时间预算"""
+    expected: float  # 按 token 数估算的耗时（秒）
+    timeout: float  # 超时时间（秒）
+    hedge_after: Optional[float] = None  # 超过该时间仍未返回时发出对冲请求，None 表示不对冲
+
+
+def expected_output_tokens(output_kind: Optional[str], prompt: str, max_tokens: int) -> int:
+    """按请求类型估算输出 token 数（不超过 max_tokens）"""
+    if output_kind == "line":
+        estimate = LINE_OUTPUT_TOKENS_PER_LINE * (prompt.count("\n") + 1)
+    elif output_kind == "function":
+        estimate = FUNCTION_OUTPUT_TOKENS
+    elif output_kind == "batch":
+        estimate = FUNCTION_OUTPUT_TOKENS * max(1, prompt.count("### id:"))
+    elif output_kind == "triage":
+        estimate = TRIAGE_OUTPUT_TOKENS_PER_FUNCTION * max(1, prompt.count("### id:"))
+    else:
+        estimate = max_tokens // 4
+    return min(max_tokens, estimate)
+
+
+def _quantile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LatencyTracker:
+    """
+    延迟模型（进程内，按限流键即提供商或端点区分）
+
+    每次成功调用记录 实际耗时 / 预估耗时，预估耗时由输入输出 token 数和模型速度得出。
+    样本足够后，超时 = 预估耗时 × 比值的 p99 × 余量，对冲等待时间 = 预估耗时 × 比值的 p95；
+    样本不足时超时 = 预估耗时 × 冷启动倍数（或最慢样本比值的两倍），且不对冲。超时时间限制在 [LLM_TIMEOUT_MIN, LLM_TIMEOUT_MAX]
+    """
+
+    def __init__(self, window: int = None):
+        self.window = window or settings.LLM_LATENCY_WINDOW
+        self._lock = threading.Lock()
+        self._ratios: Dict[str, Deque[float]] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _stat(self, key: str) -> Dict[str, int]:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {"calls": 0, "timeouts": 0, "hedged": 0, "hedge_wins": 0}
+        return stats
+
+    def plan(self, key: str, provider: str, model: str, input_tokens: int, output_tokens: int) -> CallPlan:
+        """
+        计算单次调用的超时和对冲等待时间
+
+        Args:
+            key: 限流键（提供商或端点）
+            provider: LLM 提供商
+            model: 模型名称
+            input_tokens: 输入 token 数
+            output_tokens: 预计输出 token 数
+
+        Returns:
+            调用的时间预算
+        """
+        expected = token_estimator.expected_latency(provider, model, output_tokens, input_tokens)
+        with self._lock:
+            ratios = list(self._ratios.get(key, ()))
+        hedge_after = None
+        if len(ratios) < settings.LLM_LATENCY_MIN_SAMPLES:
+            # 冷启动期间端点明显慢于预估时（包括已超时的调用）按最慢样本的两倍放宽
+            timeout = expected * max([settings.LLM_TIMEOUT_COLD_FACTOR] + [ratio * 2 for ratio in ratios])
+        else:
+            timeout = expected * _quantile(ratios, 0.99) * settings.LLM_TIMEOUT_MARGIN
+            if settings.LLM_HEDGE_ENABLED:
+                hedge_after = expected * _quantile(ratios, 0.95)
+        timeout = min(settings.LLM_TIMEOUT_MAX, max(settings.LLM_TIMEOUT_MIN, timeout))
+        if hedge_after is not None and hedge_after >= timeout:
+            hedge_after = None
+        return CallPlan(expected=expected, timeout=timeout, hedge_after=hedge_after)
+
+    def observe(self, key: str, plan: CallPlan, elapsed: Optional[float]):
+        """
+        记录一次调用
+
+        Args:
+            key: 限流键
+            plan: 调用的时间预算
+            elapsed: 成功调用的耗时（秒），None 表示超时（按超时时间记录，使模型尽快放宽超时）
+        """
+        with self._lock:
+            ratios = self._ratios.get(key)
+            if ratios is None:
+                ratios = self._ratios[key] = deque(maxlen=self.window)
+            stats = self._stat(key)
+            stats["calls"] += 1
+            if elapsed is None:
+                stats["timeouts"] += 1
+                elapsed = plan.timeout
+            ratios.append(elapsed / max(plan.expected, 1e-3))
+
+    def allow_hedge(self, key: str) -> bool:
+        """对冲请求数是否仍在预算内（不超过调用数的 LLM_HEDGE_BUDGET）"""
+        with self._lock:
+            stats = self._stat(key)
+            return stats["hedged"] < settings.LLM_HEDGE_BUDGET * max(1, stats["calls"])
+
+    def record_hedge(self, key: str, won: Optional[bool] = None):
+        """记录发出的对冲请求（won 为 True 时记录对冲请求先返回）"""
+        with self._lock:
+            stats = self._stat(key)
+            if won is None:
+                stats["hedged"] += 1
+            elif won:
+                stats["hedge_wins"] += 1
+
+    def snapshot(self) -> Dict:
+        """各限流键的样本数、耗时比值分位数、超时和对冲统计"""
+        with self._lock:
+            result = {}
+            for key, stats in self._stats.items():
+                ratios = list(self._ratios.get(key, ()))
+                result[key] = dict(
+                    stats,
+                    samples=len(ratios),
+                    ratio_p50=round(_quantile(ratios, 0.5), 3) if ratios else None,
+                    ratio_p95=round(_quantile(ratios, 0.95), 3) if ratios else None,
+                    ratio_p99=round(_quantile(ratios, 0.99), 3) if ratios else None
+                )
+            return result
+
+
+async def hedged(
+    call: Callable[[], Awaitable[Any]],
+    delay: float,
+    on_hedge: Callable[[], None] = None,
+    may_hedge: Callable[[], bool] = None
+) -> Tuple[Any, Optional[bool]]:
+    """
+    对冲执行：call 超过 delay 秒未完成时再发起一次，取先成功的结果并取消另一个
+
+    Args:
+        call: 发起请求的协程函数（必须幂等）
+        delay: 发出对冲请求前的等待时间（秒）
+        on_hedge: 发出对冲请求时的回调
+        may_hedge: 到达 delay 时调用，返回 False 时不发出对冲请求，继续等待第一次请求
+
+    Returns:
+        (结果, 是否由对冲请求返回)；未发出对冲请求时第二项为 None。两次都失败时抛出先完成的异常
+    """
+    first = asyncio.ensure_future(call())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result(), None
+        if may_hedge is not None and not may_hedge():
+            return await first, None
+        if on_hedge:
+            on_hedge()
+        second = asyncio.ensure_future(call())
+        tasks.add(second)
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is second
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+# 创建全局实例
+latency_tracker = LatencyTracker()
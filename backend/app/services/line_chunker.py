@@ -0,0 +1,69 @@
+"""
+代码分块服务 - 将大文件切分为带重叠的行窗口
+"""
+from typing import Dict, List
+from ..config import settings
+from .code_parser import code_parser
+
+
+def _boundary_lines(code: str, language: str) -> List[int]:
+    """获取函数/类定义的起始行，作为优先切分点"""
+    parse_result = code_parser.parse_code(code, language or "")
+    if not parse_result.get('success'):
+        return []
+    nodes = parse_result.get('functions', []) + parse_result.get('classes', [])
+    return sorted({node['line_start'] for node in nodes if node.get('line_start')})
+
+
+def split_into_windows(code: str, language: str, max_lines: int = None, overlap: int = None) -> List[Dict]:
+    """
+    将代码切分为行窗口，尽量在函数/类边界处切分
+
+    Args:
+        code: 代码内容
+        language: 编程语言
+        max_lines: 单个窗口的最大行数
+        overlap: 相邻窗口的重叠行数
+
+    Returns:
+        窗口列表，每项包含 start/end（1 起始、含两端的绝对行号）、
+        own_start/own_end（该窗口负责的行范围，用于重叠区去重）和 code
+    """
+    max_lines = max_lines or settings.LLM_LINE_WINDOW_LINES
+    overlap = settings.LLM_LINE_WINDOW_OVERLAP if overlap is None else overlap
+    overlap = min(overlap, max_lines // 2)
+
+    lines = code.split('\n')
+    total = len(lines)
+    if total <= max_lines:
+        return [{'start': 1, 'end': total, 'own_start': 1, 'own_end': total, 'code': code}]
+
+    boundaries = _boundary_lines(code, language)
+    min_lines = max(1, max_lines // 2)
+
+    spans = []
+    start = 1
+    while True:
+        hard_end = start + max_lines - 1
+        if hard_end >= total:
+            spans.append((start, total))
+            break
+        # 在窗口后半段寻找最靠后的定义起始行，在其前一行结束
+        candidates = [b for b in boundaries if start + min_lines <= b <= hard_end + 1]
+        end = candidates[-1] - 1 if candidates else hard_end
+        spans.append((start, end))
+        start = max(end + 1 - overlap, start + 1)
+
+    windows = []
+    for index, (start, end) in enumerate(spans):
+        # 重叠区按中点划分归属
+        own_start = 1 if index == 0 else (start + spans[index - 1][1]) // 2 + 1
+        own_end = total if index == len(spans) - 1 else (spans[index + 1][0] + end) // 2
+        windows.append({
+            'start': start,
+            'end': end,
+            'own_start': own_start,
+            'own_end': own_end,
+            'code': '\n'.join(lines[start - 1:end])
+        })
+    return windows
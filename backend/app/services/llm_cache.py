@@ -0,0 +1,255 @@
+"""
+LLM 响应缓存 - 内存 LRU + SQLite 磁盘两级缓存
+"""
+import atexit
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from ..config import settings
+
+
+def make_cache_key(*parts) -> str:
+    """
+    根据提供商、模型、提示词模板版本和代码文本等生成内容寻址的缓存键
+
+    Args:
+        parts: 参与计算的各个部分
+
+    Returns:
+        sha256 十六进制字符串
+    """
+    payload = json.dumps([str(part) for part in parts], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def endpoint_identity(base_url: Optional[str]) -> str:
+    """
+    规范化的端点地址，作为缓存键的一部分（同名模型在不同的兼容服务上输出不同）
+
+    Args:
+        base_url: 服务地址，None 表示提供商的默认地址
+
+    Returns:
+        去掉末尾斜杠并转为小写的地址，默认地址为 "default"
+    """
+    if not base_url:
+        return "default"
+    return base_url.strip().rstrip("/").lower()
+
+
+class LLMCache:
+    """
+    LLM 响应缓存
+
+    读写都先在内存中完成：新条目和命中时的访问时间按 LLM_CACHE_FLUSH_INTERVAL 批量写入磁盘，
+    在同一事务中淘汰超出容量的条目，命中不再逐次提交。磁盘占用按写入和淘汰累计，不逐次统计
+    """
+
+    def __init__(self, path: str = None, memory_entries: int = None, max_bytes: int = None, ttl: int = None,
+                 flush_interval: float = None):
+        self.path = path or settings.LLM_CACHE_PATH
+        self.memory_entries = memory_entries or settings.LLM_CACHE_MEMORY_ENTRIES
+        self.max_bytes = max_bytes or settings.LLM_CACHE_MAX_BYTES
+        self.ttl = ttl if ttl is not None else settings.LLM_CACHE_TTL
+        self.flush_interval = settings.LLM_CACHE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # 尚未写入磁盘的新条目 {key: (data, created_at)} 和命中时间 {key: accessed_at}
+        self._pending: Dict[str, tuple] = {}
+        self._touched: Dict[str, float] = {}
+        self._bytes = 0
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        atexit.register(self.flush)
+
+    def _connection(self) -> sqlite3.Connection:
+        """延迟打开磁盘缓存"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed ON llm_cache (accessed_at)")
+            self._conn.commit()
+            self._bytes = self._disk_bytes(self._conn)
+        return self._conn
+
+    @staticmethod
+    def _disk_bytes(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl > 0 and now - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的响应字典，未命中返回 None
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                entry = self._memory.get(key) or self._pending.get(key)
+                if entry is not None:
+                    if not self._expired(entry[1], now):
+                        self._remember(key, entry[0], entry[1])
+                        self._touched[key] = now
+                        self._stats["memory_hits"] += 1
+                        return json.loads(entry[0])
+                    self._memory.pop(key, None)
+                    self._pending.pop(key, None)
+
+                row = self._connection().execute(
+                    "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or self._expired(row[1], now):
+                    # 过期的磁盘条目在下次写入磁盘时淘汰
+                    self._stats["misses"] += 1
+                    return None
+
+                self._remember(key, row[0], row[1])
+                self._touched[key] = now
+                self._stats["disk_hits"] += 1
+                return json.loads(row[0])
+            finally:
+                self._maybe_flush()
+
+    def contains(self, key: str) -> bool:
+        """检查缓存是否存在且未过期（不计入命中统计）"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key) or self._pending.get(key)
+            if entry is not None and not self._expired(entry[1], now):
+                return True
+            row = self._connection().execute("SELECT created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            return row is not None and not self._expired(row[0], now)
+
+    def set(self, key: str, value: Dict):
+        """
+        写入缓存（批量写入磁盘）
+
+        Args:
+            key: 缓存键
+            value: 响应字典
+        """
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._remember(key, data, now)
+            self._pending[key] = (data, now)
+            self._touched.pop(key, None)
+            self._stats["writes"] += 1
+            self._maybe_flush()
+
+    def _remember(self, key: str, data: str, created_at: float):
+        """写入内存 LRU"""
+        self._memory[key] = (data, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _maybe_flush(self):
+        """距上次写入磁盘超过间隔时写入"""
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self._flush()
+
+    def flush(self):
+        """立即将新条目和访问时间写入磁盘"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        """在一个事务中写入新条目、更新访问时间并淘汰（调用方持有锁）"""
+        self._flushed_at = time.monotonic()
+        if not self._pending and not self._touched:
+            return
+        conn = self._connection()
+        for key, (data, created_at) in self._pending.items():
+            row = conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            size = len(data.encode("utf-8"))
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, created_at, created_at)
+            )
+            self._bytes += size - (row[0] if row else 0)
+        # 内存命中也计入最近访问时间，淘汰时按同一份访问记录排序
+        conn.executemany(
+            "UPDATE llm_cache SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in self._touched.items()]
+        )
+        self._pending.clear()
+        self._touched.clear()
+        self._evict(conn, time.time())
+        conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """淘汰过期条目，并按最近访问时间淘汰超出容量的条目"""
+        if self.ttl > 0:
+            expired_bytes, expired = conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM llm_cache WHERE created_at < ?", (now - self.ttl,)
+            ).fetchone()
+            if expired:
+                conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+                self._bytes -= expired_bytes
+                self._stats["evictions"] += expired
+
+        if self._bytes <= self.max_bytes:
+            return
+        # 其他进程也可能写入同一缓存文件，淘汰前重新统计一次
+        self._bytes = self._disk_bytes(conn)
+        if self._bytes <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at").fetchall():
+            if self._bytes <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            self._bytes -= size
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._memory.clear()
+            self._pending.clear()
+            self._touched.clear()
+            conn = self._connection()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        """获取命中统计"""
+        with self._lock:
+            self._flush()
+            stats = dict(self._stats)
+            entries = self._connection().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            size = self._bytes
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats.update({
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": entries,
+            "disk_bytes": size
+        })
+        return stats
+
+
+# 创建全局实例
+llm_cache = LLMCache()
@@ -0,0 +1,161 @@
+"""
+LLM 客户端连接池 - 复用提供商客户端及其 keep-alive 连接
+"""
+import asyncio
+import hashlib
+import importlib.util
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+import httpx
+import requests
+import anthropic as anthropic_sdk
+import openai as openai_sdk
+from anthropic import Anthropic, AsyncAnthropic
+from openai import AsyncOpenAI, OpenAI
+from ..config import settings
+
+# 安装了 h2 时启用 HTTP/2
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _key_hash(api_key: Optional[str]) -> str:
+    """API 密钥只以哈希形式参与缓存键"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class LLMClientRegistry:
+    """
+    LLM 客户端注册表
+
+    按 (客户端类型, base_url, API 密钥哈希) 缓存客户端，异步客户端额外按事件循环区分。
+    设置变更时调用 clear() 丢弃旧客户端
+    """
+
+    def __init__(self):
+        self._clients: Dict[Tuple, Tuple[Any, Optional[asyncio.AbstractEventLoop]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _limits(httpx_module=httpx):
+        return httpx_module.Limits(
+            max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_POOL_KEEPALIVE_EXPIRY
+        )
+
+    def _sdk_http_client(self, client_cls, **kwargs):
+        """
+        使用 SDK 导出的 DefaultHttpxClient 类创建带连接池的 HTTP 客户端
+        （不同 SDK 版本底层依赖的 httpx 包可能不同，Limits 需取自同一个包）
+        """
+        httpx_module = importlib.import_module(client_cls.__mro__[1].__module__.partition(".")[0])
+        return client_cls(limits=self._limits(httpx_module), http2=HTTP2_AVAILABLE, **kwargs)
+
+    def _get(self, key: Tuple, factory: Callable[[], Any], is_async: bool = False) -> Any:
+        """获取或创建客户端"""
+        loop = None
+        if is_async:
+            loop = asyncio.get_running_loop()
+            key = key + (id(loop),)
+        with self._lock:
+            if is_async:
+                self._drop_closed_loops()
+            entry = self._clients.get(key)
+            if entry is None:
+                entry = (factory(), loop)
+                self._clients[key] = entry
+            return entry[0]
+
+    def _drop_closed_loops(self):
+        """丢弃已关闭事件循环上的异步客户端"""
+        for key in [k for k, (_, loop) in self._clients.items() if loop is not None and loop.is_closed()]:
+            del self._clients[key]
+
+    def openai(self, api_key: str, base_url: Optional[str] = None, timeout: float = 180.0) -> OpenAI:
+        """获取同步 OpenAI 客户端"""
+        def factory():
+            kwargs = {
+                "api_key": api_key,
+                "timeout": timeout,
+                "http_client": self._sdk_http_client(openai_sdk.DefaultHttpxClient, timeout=timeout)
+            }
+            if base_url:
+                kwargs["base_url"] = base_url
+            return OpenAI(**kwargs)
+        return self._get(("openai", base_url or "", _key_hash(api_key), timeout), factory)
+
+    def async_openai(self, api_key: str, base_url: Optional[str] = None, timeout: float = 180.0) -> AsyncOpenAI:
+        """获取异步 OpenAI 客户端（需在事件循环中调用）"""
+        def factory():
+            kwargs = {
+                "api_key": api_key,
+                "timeout": timeout,
+                "max_retries": 0,  # 重试由 rate_limiter 统一调度
+                "http_client": self._sdk_http_client(openai_sdk.DefaultAsyncHttpxClient, timeout=timeout)
+            }
+            if base_url:
+                kwargs["base_url"] = base_url
+            return AsyncOpenAI(**kwargs)
+        return self._get(("async_openai", base_url or "", _key_hash(api_key), timeout), factory, is_async=True)
+
+    def anthropic(self, api_key: str) -> Anthropic:
+        """获取同步 Anthropic 客户端"""
+        def factory():
+            return Anthropic(
+                api_key=api_key,
+                http_client=self._sdk_http_client(anthropic_sdk.DefaultHttpxClient)
+            )
+        return self._get(("anthropic", "", _key_hash(api_key)), factory)
+
+    def async_anthropic(self, api_key: str) -> AsyncAnthropic:
+        """获取异步 Anthropic 客户端（需在事件循环中调用）"""
+        def factory():
+            return AsyncAnthropic(
+                api_key=api_key,
+                max_retries=0,
+                http_client=self._sdk_http_client(anthropic_sdk.DefaultAsyncHttpxClient)
+            )
+        return self._get(("async_anthropic", "", _key_hash(api_key)), factory, is_async=True)
+
+    def ollama_session(self, base_url: str) -> requests.Session:
+        """获取 Ollama 同步会话"""
+        def factory():
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.LLM_POOL_MAX_KEEPALIVE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            return session
+        return self._get(("ollama", base_url, ""), factory)
+
+    def ollama_async(self, base_url: str, timeout: float = 120.0) -> httpx.AsyncClient:
+        """获取 Ollama 异步客户端（需在事件循环中调用）"""
+        def factory():
+            return httpx.AsyncClient(base_url=base_url, limits=self._limits(), http2=HTTP2_AVAILABLE, timeout=timeout)
+        return self._get(("async_ollama", base_url, "", timeout), factory, is_async=True)
+
+    def clear(self):
+        """关闭并丢弃所有客户端（设置变更后调用）"""
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        for client, loop in entries:
+            if loop is None:
+                client.close()
+            elif loop is running:
+                running.create_task(client.aclose() if hasattr(client, "aclose") else client.close())
+            # 其他事件循环上的异步客户端直接丢弃，由垃圾回收释放连接
+
+    def size(self) -> int:
+        """当前缓存的客户端数量"""
+        with self._lock:
+            return len(self._clients)
+
+
+# 创建全局实例
+client_registry = LLMClientRegistry()
@@ -0,0 +1,222 @@
+"""
+LLM 调用调度服务 - 按提供商限制并发，按优先级和项目分配并发名额
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Sequence
+from ..config import settings
+
+# 优先级从高到低：交互式单文件请求、批量项目任务、空闲时执行的补全任务
+PRIORITIES = ("interactive", "bulk", "backfill")
+
+
+@dataclass
+class TaskResult:
+    """单个调用的结果（保持原始顺序）"""
+    index: int
+    item: Any
+    value: Any = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class PrioritySlots:
+    """
+    按优先级分配的并发名额
+
+    名额释放时先唤醒交互式请求，再按项目轮转唤醒批量请求，最后是补全请求。
+    预留的名额只给交互式请求使用，批量任务占满其余名额时交互式请求仍可立即开始
+    """
+
+    def __init__(self, capacity: int, reserved: int = 0):
+        self.capacity = capacity
+        self.reserved = max(0, min(reserved, capacity - 1))
+        self.in_use = 0
+        # {优先级: {项目: 等待中的 Future 队列}}，同一优先级内按项目轮转
+        self._waiters: Dict[str, "OrderedDict[Hashable, Deque[asyncio.Future]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self.stats = {p: {"granted": 0, "queued": 0, "wait_seconds": 0.0, "max_wait": 0.0} for p in PRIORITIES}
+
+    def _limit(self, priority: str) -> int:
+        return self.capacity if priority == "interactive" else self.capacity - self.reserved
+
+    def _blocked(self, priority: str) -> bool:
+        """同级或更高优先级有请求在等待"""
+        for level in PRIORITIES[:PRIORITIES.index(priority) + 1]:
+            if self._waiters[level]:
+                return True
+        return False
+
+    def waiting(self, priority: str) -> int:
+        return sum(len(queue) for queue in self._waiters[priority].values())
+
+    async def acquire(self, priority: str = "interactive", tenant: Hashable = None):
+        """等待一个名额"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的优先级: {priority}")
+        started = time.monotonic()
+        if self.in_use < self._limit(priority) and not self._blocked(priority):
+            self.in_use += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[priority].setdefault(tenant, deque()).append(future)
+            self.stats[priority]["queued"] += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # 已分配名额但调用方被取消
+                    self.release()
+                else:
+                    self._discard(priority, tenant, future)
+                raise
+        waited = time.monotonic() - started
+        stats = self.stats[priority]
+        stats["granted"] += 1
+        stats["wait_seconds"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+
+    def release(self):
+        """归还名额并唤醒等待者"""
+        self.in_use -= 1
+        self._wake()
+
+    def _discard(self, priority: str, tenant: Hashable, future: asyncio.Future):
+        queue = self._waiters[priority].get(tenant)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self._waiters[priority][tenant]
+
+    def _wake(self):
+        for priority in PRIORITIES:
+            tenants = self._waiters[priority]
+            while tenants and self.in_use < self._limit(priority):
+                tenant, queue = next(iter(tenants.items()))
+                future = queue.popleft()
+                # 轮转：本项目还有等待者时移到队尾
+                if queue:
+                    tenants.move_to_end(tenant)
+                else:
+                    del tenants[tenant]
+                if future.done():
+                    continue
+                self.in_use += 1
+                future.set_result(None)
+            if tenants:
+                # 高优先级仍在等待时不唤醒低优先级
+                return
+
+    def snapshot(self) -> Dict:
+        """名额使用和各优先级的排队情况"""
+        return {
+            "capacity": self.capacity,
+            "reserved": self.reserved,
+            "in_use": self.in_use,
+            "waiting": {p: self.waiting(p) for p in PRIORITIES},
+            "stats": {p: dict(s, wait_seconds=round(s["wait_seconds"], 3), max_wait=round(s["max_wait"], 3)) for p, s in self.stats.items()}
+        }
+
+
+class LLMDispatcher:
+    """
+    LLM 调度器，所有进行中的生成请求共享同一组提供商并发上限
+
+    每个调用带有优先级（interactive / bulk / backfill）和所属项目，
+    交互式请求优先获得名额，批量任务在项目间轮转分配
+    """
+
+    def __init__(self, limits: Dict[str, int] = None, default_limit: int = None, reserved: int = None):
+        self.limits = dict(limits if limits is not None else settings.LLM_CONCURRENCY)
+        self.default_limit = default_limit or settings.LLM_DEFAULT_CONCURRENCY
+        self.reserved = settings.LLM_INTERACTIVE_RESERVED_SLOTS if reserved is None else reserved
+        self._semaphores: Dict[str, tuple] = {}
+
+    def limit_for(self, provider: str) -> int:
+        """获取提供商的并发上限"""
+        return max(1, int(self.limits.get(provider, self.default_limit)))
+
+    def set_limit(self, provider: str, limit: int):
+        """修改提供商的并发上限（对之后创建的信号量生效）"""
+        self.limits[provider] = limit
+        self._semaphores.pop(provider, None)
+
+    def _semaphore(self, provider: str) -> PrioritySlots:
+        """获取当前事件循环上的提供商名额池"""
+        loop = asyncio.get_running_loop()
+        entry = self._semaphores.get(provider)
+        if entry is None or entry[0] is not loop:
+            entry = (loop, PrioritySlots(self.limit_for(provider), self.reserved))
+            self._semaphores[provider] = entry
+        return entry[1]
+
+    @asynccontextmanager
+    async def slot(self, provider: str, priority: str = "interactive", tenant: Hashable = None):
+        """
+        占用一个提供商并发名额
+
+        Args:
+            provider: LLM 提供商
+            priority: 优先级，interactive / bulk / backfill
+            tenant: 所属项目，同一优先级内按项目轮转
+        """
+        slots = self._semaphore(provider)
+        await slots.acquire(priority, tenant)
+        try:
+            yield
+        finally:
+            slots.release()
+
+    def snapshot(self) -> Dict:
+        """各提供商的名额使用和排队情况"""
+        return {provider: entry[1].snapshot() for provider, entry in self._semaphores.items()}
+
+    async def map(
+        self,
+        provider: str,
+        items: Sequence[Any],
+        worker: Callable[[Any], Awaitable[Any]],
+        on_done: Optional[Callable[[TaskResult], None]] = None,
+        priority: str = "interactive",
+        tenant: Hashable = None,
+    ) -> List[TaskResult]:
+        """
+        并发执行 worker，结果按 items 的原始顺序返回
+
+        Args:
+            provider: LLM 提供商，用于选择并发上限
+            items: 待处理的条目
+            worker: 处理单个条目的协程函数
+            on_done: 每个条目完成时立即调用的回调（按完成顺序），用于流式输出
+            priority: 优先级，interactive / bulk / backfill
+            tenant: 所属项目，同一优先级内按项目轮转
+
+        Returns:
+            与 items 一一对应的 TaskResult 列表，单个失败（包括 on_done 回调出错）不影响其他条目
+        """
+        async def run(index: int, item: Any) -> TaskResult:
+            async with self.slot(provider, priority, tenant):
+                try:
+                    result = TaskResult(index=index, item=item, value=await worker(item))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    result = TaskResult(index=index, item=item, error=str(e))
+            if on_done:
+                try:
+                    on_done(result)
+                except Exception as e:
+                    # 回调出错只使该条目失败，不中断其他进行中的条目
+                    result = TaskResult(index=index, item=item, error=f"结果处理失败: {e}")
+            return result
+
+        return list(await asyncio.gather(*(run(i, item) for i, item in enumerate(items))))
+
+
+# 创建全局实例
+llm_dispatcher = LLMDispatcher()
@@ -0,0 +1,202 @@
+"""
+LLM 调用指标 - 按提供商和模型统计耗时、token、重试和错误，导出为 Prometheus 文本格式
+"""
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 请求耗时直方图的分桶上界（秒）
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """累计分桶直方图"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按分桶估算分位数（返回所在分桶的上界）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= target:
+                return bound
+        return float("inf")
+
+
+class LLMMetrics:
+    """LLM 调用指标注册表（进程内，线程安全）"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清空所有指标"""
+        with self._lock:
+            self._latency: Dict[Tuple[str, str], Histogram] = {}
+            self._requests: Dict[Tuple[str, str, str], int] = defaultdict(int)
+            self._tokens: Dict[Tuple[str, str, str], int] = defaultdict(int)
+            self._retries: Dict[Tuple[str, str, str], int] = defaultdict(int)
+            self._parses: Dict[Tuple[str, str, str], int] = defaultdict(int)
+
+    def observe_request(self, provider: str, model: str, seconds: float, error_code: Optional[str] = None):
+        """
+        记录一次提供商调用
+
+        Args:
+            provider: LLM 提供商
+            model: 模型名称
+            seconds: 耗时（含限流等待和重试）
+            error_code: 失败时的错误分类，成功为 None
+        """
+        with self._lock:
+            key = (provider, model)
+            if key not in self._latency:
+                self._latency[key] = Histogram(self.buckets)
+            self._latency[key].observe(seconds)
+            self._requests[(provider, model, error_code or "ok")] += 1
+
+    def record_tokens(self, provider: str, model: str, input_tokens: int, output_tokens: int):
+        """记录提供商返回的 token 用量"""
+        with self._lock:
+            self._tokens[(provider, model, "input")] += input_tokens or 0
+            self._tokens[(provider, model, "output")] += output_tokens or 0
+
+    def record_retry(self, provider: str, reason: str, endpoint: str = "default"):
+        """
+        记录一次重试
+
+        Args:
+            provider: LLM 提供商（与请求指标的 provider 一致）
+            reason: 重试原因（HTTP 状态码或异常类型）
+            endpoint: 多端点路由的端点名称，单一提供商为 default
+        """
+        with self._lock:
+            self._retries[(provider, endpoint, reason)] += 1
+
+    def record_parse(self, provider: str, model: str, outcome: str):
+        """记录一次模型输出的 JSON 解析结果（ok、salvaged 或 failed）"""
+        with self._lock:
+            self._parses[(provider, model, outcome)] += 1
+
+    def snapshot(self) -> List[Dict]:
+        """按提供商和模型汇总的指标"""
+        with self._lock:
+            rows = []
+            for (provider, model), histogram in sorted(self._latency.items()):
+                errors = {
+                    status: count for (p, m, status), count in self._requests.items()
+                    if p == provider and m == model and status != "ok"
+                }
+                parses = {
+                    outcome: count for (p, m, outcome), count in self._parses.items()
+                    if p == provider and m == model
+                }
+                parsed = sum(parses.values())
+                rows.append({
+                    "provider": provider,
+                    "model": model,
+                    "requests": histogram.count,
+                    "errors": errors,
+                    "input_tokens": self._tokens.get((provider, model, "input"), 0),
+                    "output_tokens": self._tokens.get((provider, model, "output"), 0),
+                    "retries": sum(count for (p, _, _), count in self._retries.items() if p == provider),
+                    "parses": parses,
+                    "parse_failure_rate": round(parses.get("failed", 0) / parsed, 4) if parsed else None,
+                    "latency_mean": round(histogram.sum / histogram.count, 3) if histogram.count else None,
+                    "latency_p50": histogram.quantile(0.5),
+                    "latency_p95": histogram.quantile(0.95),
+                    "latency_p99": histogram.quantile(0.99)
+                })
+            return rows
+
+    def render(self, extra: Optional[List[str]] = None) -> str:
+        """
+        导出 Prometheus 文本格式
+
+        Args:
+            extra: 追加的指标行（缓存、限流器等其他组件的状态）
+
+        Returns:
+            text/plain; version=0.0.4 格式的文本
+        """
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP llm_request_duration_seconds LLM 请求耗时（含限流等待和重试）",
+                "# TYPE llm_request_duration_seconds histogram",
+            ]
+            for (provider, model), histogram in sorted(self._latency.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"llm_request_duration_seconds_bucket{_labels(provider=provider, model=model, le=_number(bound))} {count}")
+                lines.append(f"llm_request_duration_seconds_bucket{_labels(provider=provider, model=model, le='+Inf')} {histogram.count}")
+                lines.append(f"llm_request_duration_seconds_sum{_labels(provider=provider, model=model)} {_number(histogram.sum)}")
+                lines.append(f"llm_request_duration_seconds_count{_labels(provider=provider, model=model)} {histogram.count}")
+
+            lines += ["# HELP llm_requests_total LLM 请求数（status 为 ok 或错误分类）", "# TYPE llm_requests_total counter"]
+            for (provider, model, status), count in sorted(self._requests.items()):
+                lines.append(f"llm_requests_total{_labels(provider=provider, model=model, status=status)} {count}")
+
+            lines += ["# HELP llm_tokens_total 提供商返回的 token 用量", "# TYPE llm_tokens_total counter"]
+            for (provider, model, direction), count in sorted(self._tokens.items()):
+                lines.append(f"llm_tokens_total{_labels(provider=provider, model=model, direction=direction)} {count}")
+
+            lines += ["# HELP llm_retries_total 限流器发起的重试次数", "# TYPE llm_retries_total counter"]
+            for (provider, endpoint, reason), count in sorted(self._retries.items()):
+                lines.append(f"llm_retries_total{_labels(provider=provider, endpoint=endpoint, reason=reason)} {count}")
+
+            lines += [
+                "# HELP llm_json_parse_total 模型输出的 JSON 解析结果（ok 直接解析、salvaged 从不规范或截断的输出中恢复或修正了不符合 Schema 的字段、failed 无法解析）",
+                "# TYPE llm_json_parse_total counter",
+            ]
+            for (provider, model, outcome), count in sorted(self._parses.items()):
+                lines.append(f"llm_json_parse_total{_labels(provider=provider, model=model, outcome=outcome)} {count}")
+
+        lines += extra or []
+        return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name: str, help_text: str, samples: List[Tuple[Dict, float]], kind: str = "gauge") -> List[str]:
+    """
+    生成单个指标的 Prometheus 文本行
+
+    Args:
+        name: 指标名
+        help_text: 说明
+        samples: [(标签字典, 数值)]
+        kind: gauge 或 counter
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(**labels) if labels else ''} {_number(value)}")
+    return lines
+
+
+# 创建全局实例
+llm_metrics = LLMMetrics()
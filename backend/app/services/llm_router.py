@@ -0,0 +1,281 @@
+"""
+LLM 端点路由 - 在多个端点间按延迟和空闲容量分配请求，失败时切换端点并熔断故障端点
+"""
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+from ..config import settings
+from .llm_cache import endpoint_identity
+from .llm_dispatcher import llm_dispatcher
+from .llm_service import AsyncLLMService
+
+# 路由服务在调度器和缓存键中使用的提供商名称
+ROUTER_PROVIDER = "router"
+
+# 不切换端点的错误：模型输出格式问题，与端点是否可用无关
+NON_FAILOVER_ERRORS = ("invalid_json",)
+
+# 尚无延迟样本时的默认预期延迟（秒）
+DEFAULT_LATENCY = 1.0
+
+
+@dataclass
+class LLMEndpoint:
+    """单个 LLM 端点配置"""
+    name: str
+    provider: str  # openai（含 DeepSeek、vLLM 等兼容服务）、anthropic、ollama
+    model: str
+    base_url: Optional[str] = None  # OpenAI 兼容地址或 Ollama 地址
+    api_key: Optional[str] = None
+    weight: float = 1.0  # 权重越大，同等延迟下越优先
+    max_concurrency: int = 4  # 端点同时处理的请求上限
+
+    @classmethod
+    def from_settings(cls, item: Dict) -> "LLMEndpoint":
+        """从用户设置 llmEndpoints 的条目创建"""
+        provider = item.get("provider", "openai")
+        model = item.get("model") or settings.DEFAULT_MODEL
+        base_url = item.get("baseUrl") or None
+        return cls(
+            name=item.get("name") or f"{provider}:{model}@{base_url or 'default'}",
+            provider=provider,
+            model=model,
+            base_url=base_url,
+            api_key=item.get("apiKey") or None,
+            weight=max(0.01, float(item.get("weight") or 1.0)),
+            max_concurrency=max(1, int(item.get("maxConcurrency") or 4))
+        )
+
+
+class EndpointState:
+    """端点运行状态：进行中的请求数、延迟滑动平均和熔断器"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.latency: Optional[float] = None  # 成功请求耗时的指数滑动平均
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.opened_until = 0.0  # 熔断截止时间，0 表示未熔断
+        self.probing = False  # 半开状态下是否已有试探请求
+        self.last_error: Optional[str] = None
+
+    def status(self, now: float) -> str:
+        """closed（正常）、open（熔断中）或 half_open（冷却结束，等待试探）"""
+        if not self.opened_until:
+            return "closed"
+        return "open" if now < self.opened_until else "half_open"
+
+    def available(self, now: float) -> bool:
+        """是否可以接收请求（半开状态只放行一个试探请求）"""
+        status = self.status(now)
+        return status == "closed" or (status == "half_open" and not self.probing)
+
+
+class EndpointRouter:
+    """
+    端点路由器（全局共享端点状态）
+
+    每次调用选择预期耗时最短的可用端点：
+    延迟滑动平均 × (1 + 进行中请求数 / 并发上限) / 权重，已满载的端点仅在全部满载时使用。
+    连续失败达到阈值后熔断，冷却期结束放行一个试探请求，成功则恢复
+    """
+
+    def __init__(self, alpha: float = None, failure_threshold: int = None, cooldown: float = None):
+        self.alpha = alpha or settings.LLM_ROUTER_EWMA_ALPHA
+        self.failure_threshold = failure_threshold or settings.LLM_ROUTER_FAILURE_THRESHOLD
+        self.cooldown = settings.LLM_ROUTER_COOLDOWN if cooldown is None else cooldown
+        self._states: Dict[str, EndpointState] = {}
+
+    def state(self, endpoint: LLMEndpoint) -> EndpointState:
+        """获取端点状态"""
+        state = self._states.get(endpoint.name)
+        if state is None:
+            state = self._states[endpoint.name] = EndpointState()
+        return state
+
+    def _expected_latency(self, endpoints: List[LLMEndpoint]) -> float:
+        """无样本端点的预期延迟取已知最小值，使新端点尽快获得样本"""
+        known = [self.state(e).latency for e in endpoints if self.state(e).latency is not None]
+        return min(known) if known else DEFAULT_LATENCY
+
+    def select(self, endpoints: Iterable[LLMEndpoint], exclude: Iterable[str] = ()) -> Optional[LLMEndpoint]:
+        """
+        选择端点
+
+        Args:
+            endpoints: 候选端点
+            exclude: 本次调用已尝试过的端点名称
+
+        Returns:
+            选中的端点，全部熔断或已尝试时返回 None
+        """
+        now = time.monotonic()
+        excluded = set(exclude)
+        candidates = [e for e in endpoints if e.name not in excluded and self.state(e).available(now)]
+        if not candidates:
+            return None
+        free = [e for e in candidates if self.state(e).in_flight < e.max_concurrency]
+        pool = free or candidates
+        default = self._expected_latency(pool)
+
+        def score(endpoint: LLMEndpoint) -> float:
+            state = self.state(endpoint)
+            latency = state.latency if state.latency is not None else default
+            return latency * (1 + state.in_flight / endpoint.max_concurrency) / endpoint.weight
+
+        best = min(score(e) for e in pool)
+        # 得分相同时随机选择，避免总是压在列表第一个端点上
+        return random.choice([e for e in pool if score(e) <= best])
+
+    def acquire(self, endpoint: LLMEndpoint):
+        """开始一次请求"""
+        state = self.state(endpoint)
+        state.in_flight += 1
+        if state.status(time.monotonic()) == "half_open":
+            state.probing = True
+
+    def release(self, endpoint: LLMEndpoint, latency: Optional[float], ok: Optional[bool], error_code: Optional[str] = None):
+        """
+        结束一次请求
+
+        Args:
+            endpoint: 端点
+            latency: 耗时（秒）
+            ok: 是否成功，None 表示请求被取消（不影响延迟和熔断统计）
+            error_code: 失败时的错误分类
+        """
+        state = self.state(endpoint)
+        state.in_flight = max(0, state.in_flight - 1)
+        state.probing = False
+        if ok is None:
+            return
+        if ok:
+            state.successes += 1
+            state.consecutive_failures = 0
+            state.opened_until = 0.0
+            if latency is not None:
+                state.latency = latency if state.latency is None else self.alpha * latency + (1 - self.alpha) * state.latency
+            return
+
+        state.failures += 1
+        state.consecutive_failures += 1
+        state.last_error = error_code
+        if state.opened_until or state.consecutive_failures >= self.failure_threshold:
+            # 达到阈值或试探请求失败：重新熔断
+            state.opened_until = time.monotonic() + self.cooldown
+
+    def snapshot(self) -> Dict:
+        """所有端点的状态"""
+        now = time.monotonic()
+        return {
+            name: {
+                "status": state.status(now),
+                "in_flight": state.in_flight,
+                "latency": round(state.latency, 3) if state.latency is not None else None,
+                "successes": state.successes,
+                "failures": state.failures,
+                "consecutive_failures": state.consecutive_failures,
+                "retry_in": round(max(0.0, state.opened_until - now), 1) if state.opened_until else None,
+                "last_error": state.last_error
+            }
+            for name, state in self._states.items()
+        }
+
+
+class RoutedLLMService(AsyncLLMService):
+    """
+    多端点 LLM 服务
+
+    每次调用由路由器选择端点，失败（超时、连接错误、5xx、限流重试耗尽等）时换下一个端点，
+    所有端点都失败时返回最后一个错误。各端点的用量累计到本实例的 usage
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint], router: EndpointRouter = None):
+        super().__init__(provider=ROUTER_PROVIDER, model=",".join(e.model for e in endpoints))
+        self.endpoints = endpoints
+        self.router = router or llm_router
+        self.delegates = {endpoint.name: self._delegate(endpoint) for endpoint in endpoints}
+
+        # 路由服务的总并发为各端点并发上限之和，单个端点的容量由路由器控制
+        capacity = sum(endpoint.max_concurrency for endpoint in endpoints)
+        if llm_dispatcher.limit_for(ROUTER_PROVIDER) != capacity:
+            llm_dispatcher.set_limit(ROUTER_PROVIDER, capacity)
+
+    def _cache_endpoint(self) -> str:
+        """缓存键中的端点标识：各端点的提供商和地址"""
+        return ",".join(f"{endpoint.provider}@{endpoint_identity(endpoint.base_url)}" for endpoint in self.endpoints)
+
+    def _delegate(self, endpoint: LLMEndpoint) -> AsyncLLMService:
+        """创建单个端点的 LLM 服务（不读写缓存，缓存由路由服务统一处理）"""
+        service = AsyncLLMService(
+            provider=endpoint.provider,
+            model=endpoint.model,
+            # 兼容服务（如本地 vLLM）可能不需要密钥，不回退到全局 OPENAI_API_KEY 以免泄露给第三方
+            openai_api_key=(endpoint.api_key or "none") if endpoint.provider == "openai" else None,
+            openai_base_url=endpoint.base_url if endpoint.provider == "openai" else None,
+            anthropic_api_key=endpoint.api_key if endpoint.provider == "anthropic" else None
+        )
+        if endpoint.provider == "ollama" and endpoint.base_url:
+            service.ollama_url = endpoint.base_url.rstrip("/")
+        service.cache = None
+        service.usage = self.usage
+        service.rate_limit_key = f"{endpoint.provider}:{endpoint.name}"
+        service.max_retries = settings.LLM_ROUTER_MAX_RETRIES
+        return service
+
+    async def _generate(self, prompt: str, system_prompt: str, max_tokens: int = 2000, output_kind: Optional[str] = None) -> Dict:
+        """
+        按路由结果调用端点，失败时切换端点
+
+        Args:
+            prompt: 提示词
+            system_prompt: 系统提示词
+            max_tokens: 最大输出 token 数
+            output_kind: 输出类型
+
+        Returns:
+            标注数据字典
+        """
+        tried: List[str] = []
+        result = None
+        while True:
+            endpoint = self.router.select(self.endpoints, tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint.name)
+
+            self.router.acquire(endpoint)
+            started = time.perf_counter()
+            ok = None
+            try:
+                # 端点服务的 _generate 按实际提供商和模型记录指标
+                result = await self.delegates[endpoint.name]._generate(prompt, system_prompt, max_tokens, output_kind)
+                ok = "error" not in result or result.get("error_code") in NON_FAILOVER_ERRORS
+            finally:
+                self.router.release(endpoint, time.perf_counter() - started, ok, (result or {}).get("error_code"))
+            if ok:
+                return result
+
+        if result is None:
+            return self._observe(time.perf_counter(), {
+                "error": "没有可用的 LLM 端点 🔌",
+                "detail": "所有端点均已熔断，请稍后重试",
+                "solution": "检查设置中的端点地址和密钥，或等待熔断冷却结束",
+                "error_code": "no_endpoint"
+            })
+        return dict(result, tried_endpoints=tried)
+
+
+def load_endpoints(user_settings: Dict) -> List[LLMEndpoint]:
+    """从用户设置读取启用的端点"""
+    return [
+        LLMEndpoint.from_settings(item)
+        for item in user_settings.get("llmEndpoints") or []
+        if item.get("enabled", True)
+    ]
+
+
+# 创建全局实例
+llm_router = EndpointRouter()
@@ -2,11 +2,41 @@
 LLM服务 - 调用大语言模型
 """
 import json
+import time
+import asyncio
 import requests
-from typing import Dict, List, Optional
-from openai import OpenAI
+import httpx
+from typing import Dict, List, Optional, Set, Union
+from openai import AsyncOpenAI, BadRequestError
 import anthropic
 from ..config import settings
+from .llm_cache import endpoint_identity, llm_cache, make_cache_key
+from .llm_clients import client_registry
+from .latency_model import CallPlan, CallTimeoutError, expected_output_tokens, hedged, latency_tracker
+from .llm_metrics import llm_metrics
+from .rate_limiter import rate_limiter
+from .structured_output import PARSE_FAILED, extract_json, output_schema
+from .token_estimator import token_estimator
+
+
+# 提示词模板版本，修改提示词后需递增以使旧缓存失效
+PROMPT_TEMPLATE_VERSION = "1"
+
+# 系统提示词
+LINE_SYSTEM_PROMPT = "你是一个专业的代码审查专家，擅长分析代码并提供有价值的注释。"
+FUNCTION_SYSTEM_PROMPT = "你是一个专业的代码文档生成专家。"
+TRIAGE_SYSTEM_PROMPT = "你是一个代码复杂度评估助手，只输出 JSON。"
+
+# 打包请求的最大输出 token 数
+BATCH_MAX_OUTPUT_TOKENS = 4000
+# 复杂度评分请求的最大输出 token 数
+TRIAGE_MAX_OUTPUT_TOKENS = 600
+
+# Anthropic 结构化输出使用的工具名
+OUTPUT_TOOL_NAME = "submit_result"
+
+# 不支持 json_schema 响应格式的 OpenAI 兼容服务地址（进程内记录，之后改用 json_object）
+_json_schema_unsupported: Set[str] = set()
 
 
 class LLMService:
@@ -15,81 +45,53 @@ class LLMService:
     def __init__(self, provider: str = None, model: str = None, openai_api_key: str = None, openai_base_url: str = None, anthropic_api_key: str = None):
         self.provider = provider or settings.DEFAULT_LLM_PROVIDER
         self.model = model or settings.DEFAULT_MODEL
-        self.openai_client = None
-        self.anthropic_client = None
-        self.ollama_url = "http://localhost:11434"  # Ollama 默认地址
+        self.ollama_url = settings.OLLAMA_BASE_URL
+        self.cache = llm_cache if settings.LLM_CACHE_ENABLED else None
+        self.rate_limit_key = self.provider  # 限流器名称，同一提供商的多个端点各自限流
+        self.max_retries: Optional[int] = None  # 限流器重试次数，None 使用 LLM_MAX_RETRIES
+        self.usage = {"requests": 0, "input_tokens": 0, "output_tokens": 0, "calls": 0, "errors": 0, "latency_seconds": 0.0}  # 本实例发出请求的累计用量
         
         # 使用传入的 API key，如果没有则使用配置文件中的
         final_openai_key = openai_api_key or settings.OPENAI_API_KEY
         final_openai_base_url = openai_base_url or settings.OPENAI_BASE_URL
         final_anthropic_key = anthropic_api_key or settings.ANTHROPIC_API_KEY
+        self.openai_base_url = final_openai_base_url or None
         
-        if final_openai_key:
-            # 支持自定义 OpenAI API 地址
-            openai_kwargs = {
-                "api_key": final_openai_key,
-                "timeout": 180.0  # 设置 3 分钟超时，适配 DeepSeek 等较慢的 API
-            }
-            if final_openai_base_url:
-                openai_kwargs["base_url"] = final_openai_base_url
-            self.openai_client = OpenAI(**openai_kwargs)
+        self._init_clients(final_openai_key, final_openai_base_url, final_anthropic_key)
+    
+    def _init_clients(self, openai_api_key: Optional[str], openai_base_url: Optional[str], anthropic_api_key: Optional[str]):
+        """从连接池获取同步客户端"""
+        self.openai_client = None
+        self.anthropic_client = None
+        
+        if openai_api_key:
+            # 支持自定义 OpenAI API 地址，超时 3 分钟适配 DeepSeek 等较慢的 API
+            self.openai_client = client_registry.openai(openai_api_key, openai_base_url, timeout=180.0)
         
-        if final_anthropic_key:
-            self.anthropic_client = anthropic.Anthropic(api_key=final_anthropic_key)
+        if anthropic_api_key:
+            self.anthropic_client = client_registry.anthropic(anthropic_api_key)
     
-    def generate_line_annotations(self, code: str, language: str) -> Dict:
+    def generate_line_annotations(self, code: str, language: str, use_cache: bool = True) -> Dict:
         """
         生成行内标注
         
         Args:
             code: 代码内容
             language: 编程语言
+            use_cache: 是否读取缓存（为 False 时强制重新生成并刷新缓存）
             
         Returns:
             标注数据字典
         """
-        prompt = self._build_line_annotation_prompt(code, language)
+        cache_key = self._cache_key("line", language, code)
+        cached = self._cache_get(cache_key, use_cache)
+        if cached is not None:
+            return cached
         
-        try:
-            # 使用 Ollama
-            if self.provider == "ollama":
-                return self._call_ollama(prompt)
-            
-            # 使用 OpenAI
-            elif self.provider == "openai" and self.openai_client:
-                response = self.openai_client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "你是一个专业的代码审查专家，擅长分析代码并提供有价值的注释。"},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.3,
-                    response_format={"type": "json_object"}
-                )
-                
-                result = response.choices[0].message.content
-                return json.loads(result)
-            
-            # 使用 Anthropic
-            elif self.provider == "anthropic" and self.anthropic_client:
-                message = self.anthropic_client.messages.create(
-                    model=self.model,
-                    max_tokens=2000,
-                    temperature=0.3,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                result = message.content[0].text
-                return json.loads(result)
-            
-            else:
-                return {"error": f"未配置 {self.provider} LLM 或 API 密钥无效"}
-                
-        except Exception as e:
-            return self._handle_llm_error(e)
+        prompt = self._build_line_annotation_prompt(code, language)
+        return self._cache_put(cache_key, self._generate(prompt, LINE_SYSTEM_PROMPT, output_kind="line"))
     
-    def generate_function_annotations(self, function_code: str, language: str, function_name: str) -> Dict:
+    def generate_function_annotations(self, function_code: str, language: str, function_name: str, use_cache: bool = True) -> Dict:
         """
         生成函数标注
         
@@ -97,127 +99,414 @@ class LLMService:
             function_code: 函数代码
             language: 编程语言
             function_name: 函数名
+            use_cache: 是否读取缓存（为 False 时强制重新生成并刷新缓存）
             
         Returns:
             标注数据字典
         """
+        cache_key = self._cache_key("function", language, function_code)
+        cached = self._cache_get(cache_key, use_cache)
+        if cached is not None:
+            return cached
+        
         prompt = self._build_function_annotation_prompt(function_code, language)
+        return self._cache_put(cache_key, self._generate(prompt, FUNCTION_SYSTEM_PROMPT, output_kind="function"))
+    
+    def generate_batch_function_annotations(self, functions: List[Dict], language: str, use_cache: bool = True) -> Dict:
+        """
+        在一次请求中为多个函数生成标注
+        
+        Args:
+            functions: 函数列表，每项包含 id 和 code
+            language: 编程语言
+            use_cache: 是否读取缓存
+            
+        Returns:
+            {id: 标注数据字典}，响应中缺失或格式错误的函数不会出现在结果中；
+            整个请求失败时返回 {"error": ...}
+        """
+        results, pending = self._batch_from_cache(functions, language, use_cache)
+        if not pending:
+            return results
+        
+        prompt = self._build_batch_function_annotation_prompt(pending, language)
+        response = self._generate(prompt, FUNCTION_SYSTEM_PROMPT, max_tokens=BATCH_MAX_OUTPUT_TOKENS, output_kind="batch")
+        if 'error' in response:
+            return response
+        results.update(self._split_batch_response(response, pending, language))
+        return results
+    
+    def score_functions(self, functions: List[Dict], language: str, use_cache: bool = True) -> Dict:
+        """
+        在一次请求中为多个函数评估文档难度（1-10 分）
+        
+        Args:
+            functions: 函数列表，每项包含 id 和 code
+            language: 编程语言
+            use_cache: 是否读取缓存
+            
+        Returns:
+            {id: 分数}，响应中缺失的函数不会出现在结果中；整个请求失败时返回 {"error": ...}
+        """
+        results, pending = self._scores_from_cache(functions, language, use_cache)
+        if not pending:
+            return results
+        
+        prompt = self._build_triage_prompt(pending, language)
+        response = self._generate(prompt, TRIAGE_SYSTEM_PROMPT, max_tokens=TRIAGE_MAX_OUTPUT_TOKENS, output_kind="triage")
+        if 'error' in response:
+            return response
+        results.update(self._split_triage_response(response, pending, language))
+        return results
+    
+    def _generate(self, prompt: str, system_prompt: str, max_tokens: int = 2000, output_kind: Optional[str] = None) -> Dict:
+        """
+        调用 LLM 并记录耗时和结果指标
         
+        Args:
+            prompt: 提示词
+            system_prompt: 系统提示词
+            max_tokens: 最大输出 token 数
+            output_kind: 输出类型（line、function、batch、triage），决定结构化输出使用的 Schema
+            
+        Returns:
+            标注数据字典
+        """
+        started = time.perf_counter()
+        return self._observe(started, self._dispatch(prompt, system_prompt, max_tokens, output_kind))
+    
+    def _dispatch(self, prompt: str, system_prompt: str, max_tokens: int, output_kind: Optional[str] = None) -> Dict:
+        """按提供商分发请求（超时按延迟模型计算）"""
+        plan = self._call_plan(prompt, system_prompt, max_tokens, output_kind)
+        timeout = {"timeout": plan.timeout} if plan else {}
+        started = time.perf_counter()
         try:
             # 使用 Ollama
             if self.provider == "ollama":
-                return self._call_ollama(prompt)
+                return self._call_ollama(prompt, output_kind, plan)
             
             # 使用 OpenAI
             elif self.provider == "openai" and self.openai_client:
-                response = self.openai_client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "你是一个专业的代码文档生成专家。"},
+                request = {
+                    "model": self.model,
+                    "messages": [
+                        {"role": "system", "content": system_prompt},
                         {"role": "user", "content": prompt}
                     ],
-                    temperature=0.3,
-                    response_format={"type": "json_object"}
-                )
-                
-                result = response.choices[0].message.content
-                return json.loads(result)
+                    "temperature": 0.3
+                }
+                response_format = self._openai_response_format(output_kind)
+                try:
+                    response = self.openai_client.chat.completions.create(**request, response_format=response_format, **timeout)
+                except BadRequestError:
+                    if response_format["type"] != "json_schema":
+                        raise
+                    # 兼容服务不支持 json_schema 时改用 json_object，成功后记住该地址
+                    response = self.openai_client.chat.completions.create(**request, response_format={"type": "json_object"}, **timeout)
+                    _json_schema_unsupported.add(self._openai_endpoint())
+                self._observe_latency(plan, started)
+                usage = response.usage
+                self._record_usage(getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+                return self._parse_output(response.choices[0].message.content, output_kind)
             
             # 使用 Anthropic
             elif self.provider == "anthropic" and self.anthropic_client:
                 message = self.anthropic_client.messages.create(
                     model=self.model,
-                    max_tokens=2000,
+                    max_tokens=max_tokens,
                     temperature=0.3,
                     messages=[
                         {"role": "user", "content": prompt}
-                    ]
+                    ],
+                    **self._anthropic_tool_options(output_kind),
+                    **timeout
                 )
-                result = message.content[0].text
-                return json.loads(result)
+                self._observe_latency(plan, started)
+                usage = message.usage
+                self._record_usage(getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None))
+                return self._parse_output(self._anthropic_output(message), output_kind)
             
             else:
-                return {"error": f"未配置 {self.provider} LLM 或 API 密钥无效"}
+                return {"error": f"未配置 {self.provider} LLM 或 API 密钥无效", "error_code": "not_configured"}
                 
         except Exception as e:
+            if "Timeout" in type(e).__name__:
+                self._observe_latency(plan, None)
             return self._handle_llm_error(e)
     
-    def _call_ollama(self, prompt: str) -> Dict:
+    def _call_plan(self, prompt: str, system_prompt: str, max_tokens: int, output_kind: Optional[str]) -> Optional[CallPlan]:
+        """按输入输出 token 数和端点的历史耗时计算本次调用的超时（未启用自适应超时时返回 None）"""
+        if not settings.LLM_ADAPTIVE_TIMEOUT:
+            return None
+        input_tokens = token_estimator.count(system_prompt + prompt, self.provider, self.model)
+        output_tokens = expected_output_tokens(output_kind, prompt, max_tokens)
+        return latency_tracker.plan(self.rate_limit_key, self.provider, self.model, input_tokens, output_tokens)
+    
+    def _observe_latency(self, plan: Optional[CallPlan], started: Optional[float]):
+        """记录调用耗时到延迟模型（started 为 None 表示超时）"""
+        if plan is not None:
+            latency_tracker.observe(self.rate_limit_key, plan, None if started is None else time.perf_counter() - started)
+    
+    def _openai_endpoint(self) -> str:
+        return self.openai_base_url or "default"
+    
+    def _openai_response_format(self, output_kind: Optional[str]) -> Dict:
+        """OpenAI 响应格式：有 Schema 时使用 json_schema，兼容服务不支持时使用 json_object"""
+        schema = output_schema(output_kind)
+        if schema is None or not settings.LLM_STRUCTURED_OUTPUT or self._openai_endpoint() in _json_schema_unsupported:
+            return {"type": "json_object"}
+        return {"type": "json_schema", "json_schema": {"name": f"{output_kind}_result", "schema": schema}}
+    
+    @staticmethod
+    def _anthropic_tool_options(output_kind: Optional[str]) -> Dict:
+        """Anthropic 结构化输出：强制调用输入格式为 Schema 的工具"""
+        schema = output_schema(output_kind)
+        if schema is None or not settings.LLM_STRUCTURED_OUTPUT:
+            return {}
+        return {
+            "tools": [{"name": OUTPUT_TOOL_NAME, "description": "提交分析结果", "input_schema": schema}],
+            "tool_choice": {"type": "tool", "name": OUTPUT_TOOL_NAME}
+        }
+    
+    @staticmethod
+    def _anthropic_output(message) -> Union[Dict, str]:
+        """Anthropic 响应内容：工具调用的输入，或拼接后的文本"""
+        for block in message.content:
+            if getattr(block, "type", None) == "tool_use":
+                return block.input
+        return "".join(getattr(block, "text", "") for block in message.content)
+    
+    def _parse_output(self, output: Union[Dict, str], output_kind: Optional[str]) -> Dict:
+        """
+        解析模型输出并记录解析结果指标
+        
+        Args:
+            output: 模型输出文本，或结构化输出已解析的对象
+            output_kind: 输出类型
+            
+        Returns:
+            JSON 对象；无法提取时返回 invalid_json 错误
+        """
+        if isinstance(output, dict):
+            output = json.dumps(output, ensure_ascii=False)
+        value, outcome = extract_json(output, output_kind)
+        llm_metrics.record_parse(self.provider, self.model, outcome)
+        if outcome == PARSE_FAILED:
+            return {
+                "error": "LLM 返回的不是有效的 JSON 格式",
+                "raw_response": (output or "")[:500],
+                "error_code": "invalid_json"
+            }
+        return value
+    
+    def _batch_from_cache(self, functions: List[Dict], language: str, use_cache: bool):
+        """拆分出已缓存的函数结果和待请求的函数"""
+        results = {}
+        pending = []
+        for func in functions:
+            cached = self._cache_get(self._cache_key("function", language, func['code']), use_cache)
+            if cached is not None:
+                results[func['id']] = cached
+            else:
+                pending.append(func)
+        return results, pending
+    
+    def _split_batch_response(self, response: Dict, functions: List[Dict], language: str) -> Dict:
+        """
+        将打包响应拆分为单个函数的结果，并按单函数缓存键写入缓存
+        
+        Args:
+            response: LLM 返回的 {"functions": [...]}
+            functions: 请求中的函数列表
+            language: 编程语言
+            
+        Returns:
+            {id: 标注数据字典}，仅包含格式正确的条目
+        """
+        by_id = {func['id']: func for func in functions}
+        items = response.get('functions')
+        results = {}
+        if not isinstance(items, list):
+            return results
+        
+        for item in items:
+            if not isinstance(item, dict) or item.get('id') not in by_id or 'description' not in item:
+                continue
+            func = by_id[item['id']]
+            result = {key: value for key, value in item.items() if key != 'id'}
+            self._cache_put(self._cache_key("function", language, func['code']), result)
+            results[item['id']] = result
+        return results
+    
+    def _scores_from_cache(self, functions: List[Dict], language: str, use_cache: bool):
+        """拆分出已缓存的评分和待请求的函数"""
+        results = {}
+        pending = []
+        for func in functions:
+            cached = self._cache_get(self._cache_key("triage", language, func['code']), use_cache)
+            if cached is not None:
+                results[func['id']] = cached['score']
+            else:
+                pending.append(func)
+        return results, pending
+    
+    def _split_triage_response(self, response: Dict, functions: List[Dict], language: str) -> Dict:
+        """
+        解析评分响应 {"scores": [{"id": ..., "score": ...}]}，并按单函数缓存键写入缓存
+        
+        Returns:
+            {id: 分数}，仅包含格式正确的条目（分数限制在 1-10）
+        """
+        by_id = {func['id']: func for func in functions}
+        items = response.get('scores')
+        results = {}
+        if not isinstance(items, list):
+            return results
+        
+        for item in items:
+            if not isinstance(item, dict) or item.get('id') not in by_id:
+                continue
+            try:
+                score = min(10, max(1, int(item['score'])))
+            except (KeyError, TypeError, ValueError):
+                continue
+            self._cache_put(self._cache_key("triage", language, by_id[item['id']]['code']), {'score': score})
+            results[item['id']] = score
+        return results
+    
+    def _record_usage(self, input_tokens: Optional[int], output_tokens: Optional[int]):
+        """累计提供商返回的 token 用量"""
+        self.usage["requests"] += 1
+        self.usage["input_tokens"] += input_tokens or 0
+        self.usage["output_tokens"] += output_tokens or 0
+        llm_metrics.record_tokens(self.provider, self.model, input_tokens, output_tokens)
+    
+    def _observe(self, started: float, result: Dict) -> Dict:
+        """记录一次调用的耗时和结果（错误按 error_code 分类）"""
+        elapsed = time.perf_counter() - started
+        error_code = (result.get("error_code") or "unknown") if "error" in result else None
+        self.usage["calls"] += 1
+        self.usage["latency_seconds"] += elapsed
+        if error_code:
+            self.usage["errors"] += 1
+        llm_metrics.observe_request(self.provider, self.model, elapsed, error_code)
+        return result
+    
+    def _cache_endpoint(self) -> str:
+        """缓存键中的端点标识（OpenAI 兼容服务和 Ollama 为服务地址）"""
+        if self.provider == "openai":
+            return endpoint_identity(self.openai_base_url)
+        if self.provider == "ollama":
+            return endpoint_identity(self.ollama_url)
+        return endpoint_identity(None)
+    
+    def _cache_key(self, kind: str, language: str, code: str) -> str:
+        """缓存键：提供商 + 端点 + 模型 + 提示词模板版本 + 标注类型 + 语言 + 代码"""
+        return make_cache_key(self.provider, self._cache_endpoint(), self.model, PROMPT_TEMPLATE_VERSION, kind, language, code)
+    
+    def is_cached(self, kind: str, language: str, code: str) -> bool:
+        """检查某次调用是否会命中缓存（不计入统计）"""
+        return self.cache is not None and self.cache.contains(self._cache_key(kind, language, code))
+    
+    def _cache_get(self, cache_key: str, use_cache: bool) -> Optional[Dict]:
+        """读取缓存"""
+        if not use_cache or self.cache is None:
+            return None
+        return self.cache.get(cache_key)
+    
+    def _cache_put(self, cache_key: str, result: Dict) -> Dict:
+        """写入缓存（错误结果不缓存）"""
+        if self.cache is not None and 'error' not in result:
+            self.cache.set(cache_key, result)
+        return result
+    
+    def _call_ollama(self, prompt: str, output_kind: Optional[str] = None, plan: Optional[CallPlan] = None) -> Dict:
         """
         调用 Ollama API
         
         Args:
             prompt: 提示词
+            output_kind: 输出类型
+            plan: 调用的时间预算
             
         Returns:
             标注数据字典
         """
+        # 未启用自适应超时时使用固定的较长超时（Ollama 可能需要较长时间）
+        timeout = plan.timeout if plan else 120
+        started = time.perf_counter()
         try:
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.model or "codellama:7b",
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,
-                        "top_p": 0.9,
-                    }
-                },
-                timeout=120  # Ollama 可能需要较长时间
-            )
+            session = client_registry.ollama_session(self.ollama_url)
+            payload = self._build_ollama_payload(prompt, output_kind=output_kind)
+            response = session.post(f"{self.ollama_url}/api/generate", json=payload, timeout=timeout)
+            if response.status_code in (400, 500) and isinstance(payload.get("format"), dict):
+                # 旧版 Ollama（0.5 以前）不支持 JSON Schema，改用 JSON 模式
+                payload["format"] = "json"
+                response = session.post(f"{self.ollama_url}/api/generate", json=payload, timeout=timeout)
             
             if response.status_code == 200:
+                self._observe_latency(plan, started)
                 result = response.json()
-                response_text = result.get("response", "")
-                
-                # 尝试解析 JSON
-                try:
-                    # 提取 JSON 部分（可能包含在 markdown 代码块中）
-                    if "```json" in response_text:
-                        json_str = response_text.split("```json")[1].split("```")[0].strip()
-                    elif "```" in response_text:
-                        json_str = response_text.split("```")[1].split("```")[0].strip()
-                    else:
-                        json_str = response_text.strip()
-                    
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    # 如果无法解析 JSON，返回原始响应
-                    return {
-                        "error": "Ollama 返回的不是有效的 JSON 格式",
-                        "raw_response": response_text[:500]
-                    }
+                self._record_usage(result.get("prompt_eval_count"), result.get("eval_count"))
+                return self._parse_output(result.get("response", ""), output_kind)
             else:
                 return {
                     "error": f"Ollama API 调用失败: HTTP {response.status_code}",
-                    "detail": response.text
+                    "detail": response.text,
+                    "error_code": f"http_{response.status_code}"
                 }
                 
         except requests.exceptions.ConnectionError:
             return {
                 "error": "无法连接到 Ollama 服务 🔌",
                 "detail": "请确保 Ollama 正在运行\n运行命令: ollama serve",
-                "solution": "1. 启动 Ollama 服务\n2. 或检查 Ollama 是否已安装"
+                "solution": "1. 启动 Ollama 服务\n2. 或检查 Ollama 是否已安装",
+                "error_code": "connection"
             }
         except requests.exceptions.Timeout:
+            self._observe_latency(plan, None)
             return {
                 "error": "Ollama 响应超时 ⏱️",
                 "detail": "模型处理时间过长，请稍后重试",
-                "solution": "1. 使用更小的代码片段\n2. 或使用更快的模型"
+                "solution": "1. 使用更小的代码片段\n2. 或使用更快的模型",
+                "error_code": "timeout"
             }
         except Exception as e:
             return {
                 "error": "Ollama 调用失败",
-                "detail": str(e)
+                "detail": str(e),
+                "error_code": "unknown"
             }
     
+    def _build_ollama_payload(self, prompt: str, stream: bool = False, output_kind: Optional[str] = None) -> Dict:
+        """构建 Ollama 请求体（format 约束输出为 Schema 或 JSON）"""
+        payload = {
+            "model": self.model or "codellama:7b",
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+            "options": {
+                "temperature": 0.3,
+                "top_p": 0.9,
+            }
+        }
+        if settings.LLM_STRUCTURED_OUTPUT:
+            payload["format"] = output_schema(output_kind) or "json"
+        return payload
+    
     def _handle_llm_error(self, error: Exception) -> Dict:
         """处理 LLM 错误，返回友好的错误信息"""
         error_msg = str(error)
         
+        # 模型输出不是合法 JSON
+        if isinstance(error, json.JSONDecodeError):
+            return {
+                "error": "LLM 返回的不是有效的 JSON 格式",
+                "detail": error_msg,
+                "error_code": "invalid_json"
+            }
         # 超时错误
-        if "timeout" in error_msg.lower() or "timed out" in error_msg.lower():
+        elif "timeout" in error_msg.lower() or "timed out" in error_msg.lower():
             return {
                 "error": "API 响应超时 ⏱️",
                 "detail": "AI 模型处理时间过长，请尝试以下方法：",
@@ -225,7 +514,7 @@ class LLMService:
                 "error_code": "timeout"
             }
         # 429 - 余额不足
-        elif "insufficient_quota" in error_msg or "429" in error_msg:
+        elif "insufficient_quota" in error_msg:
             return {
                 "error": "API 账户余额不足 💰",
                 "detail": "请访问服务商网站充值账户或在设置中切换到免费的 Ollama 本地方案",
@@ -240,19 +529,36 @@ class LLMService:
                 "solution": "1. 确认 API 密钥正确\n2. 确认 API 地址正确\n3. 检查密钥是否过期",
                 "error_code": "invalid_api_key"
             }
-        # 429 - 速率限制
-        elif "rate_limit" in error_msg:
+        # 429 - 速率限制（自动重试后仍失败）
+        elif "rate_limit" in error_msg or "429" in error_msg:
             return {
                 "error": "API 调用频率过快 ⏱️",
-                "detail": "请稍后再试，或升级账户以获得更高限额",
+                "detail": "已自动退避重试但仍被限流，请稍后再试，或升级账户以获得更高限额",
                 "error_code": "rate_limit"
             }
+        # 5xx - 服务端错误（自动重试后仍失败）
+        elif (getattr(error, "status_code", None) or 0) >= 500:
+            return {
+                "error": "LLM 服务暂时不可用",
+                "detail": error_msg,
+                "solution": "请稍后重试，或在设置中切换到其他服务",
+                "error_code": "server_error"
+            }
+        # 网络连接失败（自动重试后仍失败）
+        elif "Connect" in type(error).__name__ or "connection error" in error_msg.lower():
+            return {
+                "error": "无法连接到 LLM 服务 🔌",
+                "detail": error_msg,
+                "solution": "请检查网络连接和 API 地址",
+                "error_code": "connection"
+            }
         # 其他错误
         else:
             return {
                 "error": "LLM 调用失败",
                 "detail": error_msg,
-                "solution": "请检查网络连接和 API 配置"
+                "solution": "请检查网络连接和 API 配置",
+                "error_code": "unknown"
             }
     
     def _build_line_annotation_prompt(self, code: str, language: str) -> str:
@@ -332,6 +638,463 @@ class LLMService:
 }}
 
 请直接返回JSON，不要有其他文字。"""
+    
+    def _build_triage_prompt(self, functions: List[Dict], language: str) -> str:
+        """构建函数复杂度评分提示词"""
+        blocks = "\n\n".join(
+            f"### id: {func['id']}\n```{language}\n{func['code']}\n```" for func in functions
+        )
+        return f"""请评估以下{len(functions)}个{language}函数是否需要详细文档。
+
+{blocks}
+
+评分标准（1-10）:
+- 1-3: 简单的存取、转发或样板代码，看函数名和签名即可理解
+- 4-6: 有少量逻辑，一两句说明即可
+- 7-10: 包含复杂算法、业务规则、并发或容易误用的边界条件，需要详细文档
+
+返回格式示例:
+{{
+  "scores": [
+    {{"id": "f0", "score": 2}},
+    {{"id": "f1", "score": 8}}
+  ]
+}}
+
+请直接返回JSON，不要有其他文字。"""
+    
+    def _build_batch_function_annotation_prompt(self, functions: List[Dict], language: str) -> str:
+        """构建多函数打包标注提示词"""
+        blocks = "\n\n".join(
+            f"### id: {func['id']}\n```{language}\n{func['code']}\n```" for func in functions
+        )
+        return f"""你是一个专业的代码文档生成专家。请为以下{len(functions)}个{language}函数分别生成文档。
+
+每个函数以 "### id: 编号" 开头:
+
+{blocks}
+
+要求:
+1. 为每个函数生成清晰的中文函数功能描述
+2. 说明每个参数的名称、类型和用途
+3. 说明返回值的类型和含义
+4. 如果可能，提供一个简单的使用示例
+5. functions 数组中每一项必须带上对应函数的 id，不要遗漏任何函数
+6. 返回严格的JSON格式
+
+返回格式示例:
+{{
+  "functions": [
+    {{
+      "id": "f0",
+      "function_name": "calculate_total",
+      "description": "计算订单总价，包含税费和折扣",
+      "parameters": [
+        {{
+          "name": "items",
+          "type": "List[Item]",
+          "description": "订单商品列表"
+        }}
+      ],
+      "returns": {{
+        "type": "float",
+        "description": "计算后的总价"
+      }},
+      "example": "total = calculate_total(items)"
+    }}
+  ]
+}}
+
+请直接返回JSON，不要有其他文字。"""
+
+
+class AsyncLLMService(LLMService):
+    """
+    异步 LLM 服务类
+    
+    使用 AsyncOpenAI / AsyncAnthropic / httpx.AsyncClient，调用期间不阻塞事件循环，
+    单个 worker 可同时处理多个生成请求。客户端来自连接池，跨请求复用 keep-alive 连接；
+    缓存读写（磁盘查询和批量写入）在线程中执行
+    """
+    
+    def _init_clients(self, openai_api_key: Optional[str], openai_base_url: Optional[str], anthropic_api_key: Optional[str]):
+        """记录连接参数，异步客户端在事件循环中按需从连接池获取"""
+        self._openai_config = (openai_api_key, openai_base_url) if openai_api_key else None
+        self._anthropic_key = anthropic_api_key or None
+    
+    @property
+    def openai_client(self) -> Optional[AsyncOpenAI]:
+        """当前事件循环上的 AsyncOpenAI 客户端"""
+        if self._openai_config is None:
+            return None
+        return client_registry.async_openai(*self._openai_config, timeout=180.0)
+    
+    @property
+    def anthropic_client(self) -> Optional[anthropic.AsyncAnthropic]:
+        """当前事件循环上的 AsyncAnthropic 客户端"""
+        if self._anthropic_key is None:
+            return None
+        return client_registry.async_anthropic(self._anthropic_key)
+    
+    async def generate_line_annotations(self, code: str, language: str, use_cache: bool = True) -> Dict:
+        """
+        生成行内标注（异步）
+        
+        Args:
+            code: 代码内容
+            language: 编程语言
+            use_cache: 是否读取缓存
+            
+        Returns:
+            标注数据字典
+        """
+        cache_key = self._cache_key("line", language, code)
+        cached = await asyncio.to_thread(self._cache_get, cache_key, use_cache)
+        if cached is not None:
+            return cached
+        
+        prompt = self._build_line_annotation_prompt(code, language)
+        result = await self._generate(prompt, LINE_SYSTEM_PROMPT, output_kind="line")
+        return await asyncio.to_thread(self._cache_put, cache_key, result)
+    
+    async def generate_function_annotations(self, function_code: str, language: str, function_name: str, use_cache: bool = True) -> Dict:
+        """
+        生成函数标注（异步）
+        
+        Args:
+            function_code: 函数代码
+            language: 编程语言
+            function_name: 函数名
+            use_cache: 是否读取缓存
+            
+        Returns:
+            标注数据字典
+        """
+        cache_key = self._cache_key("function", language, function_code)
+        cached = await asyncio.to_thread(self._cache_get, cache_key, use_cache)
+        if cached is not None:
+            return cached
+        
+        prompt = self._build_function_annotation_prompt(function_code, language)
+        result = await self._generate(prompt, FUNCTION_SYSTEM_PROMPT, output_kind="function")
+        return await asyncio.to_thread(self._cache_put, cache_key, result)
+    
+    async def generate_batch_function_annotations(self, functions: List[Dict], language: str, use_cache: bool = True) -> Dict:
+        """
+        在一次请求中为多个函数生成标注（异步）
+        
+        Args:
+            functions: 函数列表，每项包含 id 和 code
+            language: 编程语言
+            use_cache: 是否读取缓存
+            
+        Returns:
+            {id: 标注数据字典}；整个请求失败时返回 {"error": ...}
+        """
+        results, pending = await asyncio.to_thread(self._batch_from_cache, functions, language, use_cache)
+        if not pending:
+            return results
+        
+        prompt = self._build_batch_function_annotation_prompt(pending, language)
+        response = await self._generate(prompt, FUNCTION_SYSTEM_PROMPT, max_tokens=BATCH_MAX_OUTPUT_TOKENS, output_kind="batch")
+        if 'error' in response:
+            return response
+        results.update(await asyncio.to_thread(self._split_batch_response, response, pending, language))
+        return results
+    
+    async def score_functions(self, functions: List[Dict], language: str, use_cache: bool = True) -> Dict:
+        """
+        在一次请求中为多个函数评估文档难度（异步）
+        
+        Args:
+            functions: 函数列表，每项包含 id 和 code
+            language: 编程语言
+            use_cache: 是否读取缓存
+            
+        Returns:
+            {id: 分数（1-10）}；整个请求失败时返回 {"error": ...}
+        """
+        results, pending = await asyncio.to_thread(self._scores_from_cache, functions, language, use_cache)
+        if not pending:
+            return results
+        
+        prompt = self._build_triage_prompt(pending, language)
+        response = await self._generate(prompt, TRIAGE_SYSTEM_PROMPT, max_tokens=TRIAGE_MAX_OUTPUT_TOKENS, output_kind="triage")
+        if 'error' in response:
+            return response
+        results.update(await asyncio.to_thread(self._split_triage_response, response, pending, language))
+        return results
+    
+    async def _generate(self, prompt: str, system_prompt: str, max_tokens: int = 2000, output_kind: Optional[str] = None) -> Dict:
+        """
+        调用 LLM 并记录耗时和结果指标
+        
+        Args:
+            prompt: 提示词
+            system_prompt: 系统提示词
+            max_tokens: 最大输出 token 数
+            output_kind: 输出类型（line、function、batch、triage），决定结构化输出使用的 Schema
+            
+        Returns:
+            标注数据字典
+        """
+        started = time.perf_counter()
+        return self._observe(started, await self._dispatch(prompt, system_prompt, max_tokens, output_kind))
+    
+    async def _dispatch(self, prompt: str, system_prompt: str, max_tokens: int, output_kind: Optional[str] = None) -> Dict:
+        """按提供商分发请求"""
+        plan = self._call_plan(prompt, system_prompt, max_tokens, output_kind)
+        # 使用 Ollama（本地服务，不经过限流）
+        if self.provider == "ollama":
+            return await self._call_ollama(prompt, output_kind, plan)
+        
+        if not (self.provider == "openai" and self.openai_client) and not (self.provider == "anthropic" and self.anthropic_client):
+            return {"error": f"未配置 {self.provider} LLM 或 API 密钥无效", "error_code": "not_configured"}
+        
+        try:
+            # 限流并在 429 / 超时 / 5xx 时退避重试
+            tokens = token_estimator.count(system_prompt + prompt, self.provider, self.model) + max_tokens // 2
+            result = await rate_limiter.run(
+                self.rate_limit_key,
+                tokens,
+                lambda: self._timed_request(plan, prompt, system_prompt, max_tokens, output_kind, tokens),
+                max_retries=self.max_retries
+            )
+            return self._parse_output(result, output_kind)
+        except Exception as e:
+            return self._handle_llm_error(e)
+    
+    async def _timed_request(
+        self,
+        plan: Optional[CallPlan],
+        prompt: str,
+        system_prompt: str,
+        max_tokens: int,
+        output_kind: Optional[str] = None,
+        tokens: int = 0
+    ) -> Union[Dict, str]:
+        """
+        在时间预算内发起一次请求：超过超时时间视为超时（交给限流器重试），
+        超过预期的 p95 仍未返回时发出一次对冲请求，取先成功的结果。
+        对冲请求单独占用限流额度（tokens 为预计消耗的 token 数），没有空闲额度时不发出
+        
+        Returns:
+            模型输出，失败时抛出异常
+        """
+        if plan is None:
+            return await self._request(prompt, system_prompt, max_tokens, output_kind)
+        key = self.rate_limit_key
+        
+        async def attempt() -> Union[Dict, str]:
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(
+                    self._request(prompt, system_prompt, max_tokens, output_kind, timeout=plan.timeout),
+                    plan.timeout
+                )
+            except asyncio.TimeoutError:
+                self._observe_latency(plan, None)
+                raise CallTimeoutError(plan.timeout)
+            except Exception as e:
+                if "Timeout" in type(e).__name__:
+                    self._observe_latency(plan, None)
+                raise
+            self._observe_latency(plan, started)
+            return result
+        
+        if plan.hedge_after is None or not latency_tracker.allow_hedge(key):
+            return await attempt()
+        result, hedge_won = await hedged(
+            attempt,
+            plan.hedge_after,
+            lambda: latency_tracker.record_hedge(key),
+            lambda: rate_limiter.for_provider(key).try_acquire(tokens)
+        )
+        if hedge_won:
+            latency_tracker.record_hedge(key, won=True)
+        return result
+    
+    async def _request(
+        self,
+        prompt: str,
+        system_prompt: str,
+        max_tokens: int,
+        output_kind: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Union[Dict, str]:
+        """
+        发起一次 OpenAI / Anthropic 请求
+        
+        Returns:
+            模型输出文本（Anthropic 工具调用时为已解析的输入对象），失败时抛出 SDK 异常
+        """
+        options = {"timeout": timeout} if timeout else {}
+        # 使用 OpenAI
+        if self.provider == "openai":
+            request = {
+                "model": self.model,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                "temperature": 0.3
+            }
+            response_format = self._openai_response_format(output_kind)
+            try:
+                response = await self.openai_client.chat.completions.create(**request, response_format=response_format, **options)
+            except BadRequestError:
+                if response_format["type"] != "json_schema":
+                    raise
+                # 兼容服务不支持 json_schema 时改用 json_object，成功后记住该地址
+                response = await self.openai_client.chat.completions.create(**request, response_format={"type": "json_object"}, **options)
+                _json_schema_unsupported.add(self._openai_endpoint())
+            usage = response.usage
+            self._record_usage(getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+            return response.choices[0].message.content
+        
+        # 使用 Anthropic
+        message = await self.anthropic_client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            temperature=0.3,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            **self._anthropic_tool_options(output_kind),
+            **options
+        )
+        usage = message.usage
+        self._record_usage(getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None))
+        return self._anthropic_output(message)
+    
+    async def _call_ollama(self, prompt: str, output_kind: Optional[str] = None, plan: Optional[CallPlan] = None) -> Dict:
+        """
+        调用 Ollama API（异步）
+        
+        Args:
+            prompt: 提示词
+            output_kind: 输出类型
+            plan: 调用的时间预算（非流式请求的超时；流式请求按分片间隔判断超时）
+            
+        Returns:
+            标注数据字典
+        """
+        timeout = plan.timeout if plan else None
+        started = time.perf_counter()
+        try:
+            client = client_registry.ollama_async(self.ollama_url, timeout=120)
+            payload = self._build_ollama_payload(prompt, stream=settings.OLLAMA_STREAM, output_kind=output_kind)
+            result = await self._ollama_request(client, payload, timeout)
+            if result.get("status_code") in (400, 500) and isinstance(payload.get("format"), dict):
+                # 旧版 Ollama（0.5 以前）不支持 JSON Schema，改用 JSON 模式
+                payload["format"] = "json"
+                result = await self._ollama_request(client, payload, timeout)
+            
+            if "status_code" in result:
+                return {
+                    "error": f"Ollama API 调用失败: HTTP {result['status_code']}",
+                    "detail": result["detail"],
+                    "error_code": f"http_{result['status_code']}"
+                }
+            self._observe_latency(plan, started)
+            self._record_usage(result.get("prompt_eval_count"), result.get("eval_count"))
+            return self._parse_output(result.get("response", ""), output_kind)
+                
+        except httpx.ConnectError:
+            return {
+                "error": "无法连接到 Ollama 服务 🔌",
+                "detail": "请确保 Ollama 正在运行\n运行命令: ollama serve",
+                "solution": "1. 启动 Ollama 服务\n2. 或检查 Ollama 是否已安装",
+                "error_code": "connection"
+            }
+        except (httpx.TimeoutException, asyncio.TimeoutError):
+            self._observe_latency(plan, None)
+            return {
+                "error": "Ollama 响应超时 ⏱️",
+                "detail": "模型长时间没有输出，请稍后重试",
+                "solution": "1. 使用更小的代码片段\n2. 或使用更快的模型",
+                "error_code": "timeout"
+            }
+        except Exception as e:
+            return {
+                "error": "Ollama 调用失败",
+                "detail": str(e),
+                "error_code": "unknown"
+            }
+    
+    async def _ollama_request(self, client: httpx.AsyncClient, payload: Dict, timeout: Optional[float] = None) -> Dict:
+        """发送 Ollama 请求，HTTP 错误时返回 {"status_code", "detail"}"""
+        if payload["stream"]:
+            return await self._stream_ollama(client, payload)
+        options = {"timeout": timeout} if timeout else {}
+        response = await client.post("/api/generate", json=payload, **options)
+        if response.status_code == 200:
+            return response.json()
+        return {"status_code": response.status_code, "detail": response.text}
+    
+    async def _stream_ollama(self, client: httpx.AsyncClient, payload: Dict) -> Dict:
+        """
+        流式读取 Ollama 输出
+        
+        不限制总耗时：首个分片最多等待 OLLAMA_LOAD_TIMEOUT（含模型加载），
+        之后相邻分片的间隔超过 OLLAMA_IDLE_TIMEOUT 时视为超时
+        
+        Args:
+            client: Ollama 异步客户端
+            payload: 请求体（stream 为 True）
+            
+        Returns:
+            与非流式响应格式相同的结果字典；HTTP 错误时返回 {"status_code", "detail"}
+        """
+        timeout = httpx.Timeout(settings.OLLAMA_CONNECT_TIMEOUT, read=None)
+        async with client.stream("POST", "/api/generate", json=payload, timeout=timeout) as response:
+            if response.status_code != 200:
+                detail = await response.aread()
+                return {"status_code": response.status_code, "detail": detail.decode("utf-8", errors="replace")}
+            
+            parts = []
+            result = {}
+            lines = response.aiter_lines()
+            wait = settings.OLLAMA_LOAD_TIMEOUT
+            while True:
+                try:
+                    line = await asyncio.wait_for(lines.__anext__(), timeout=wait)
+                except StopAsyncIteration:
+                    break
+                wait = settings.OLLAMA_IDLE_TIMEOUT
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    return {"status_code": response.status_code, "detail": chunk["error"]}
+                parts.append(chunk.get("response", ""))
+                if chunk.get("done"):
+                    result = chunk
+                    break
+            
+            result["response"] = "".join(parts)
+            return result
+    
+    async def warmup(self) -> bool:
+        """
+        预加载 Ollama 模型，使首个请求的延迟与稳定状态一致
+        
+        Returns:
+            是否加载成功（非 Ollama 提供商直接返回 False）
+        """
+        if self.provider != "ollama":
+            return False
+        try:
+            client = client_registry.ollama_async(self.ollama_url, timeout=120)
+            # 不带 prompt 的请求只加载模型
+            response = await client.post(
+                "/api/generate",
+                json={"model": self.model or "codellama:7b", "keep_alive": settings.OLLAMA_KEEP_ALIVE},
+                timeout=httpx.Timeout(settings.OLLAMA_CONNECT_TIMEOUT, read=settings.OLLAMA_LOAD_TIMEOUT)
+            )
+            return response.status_code == 200
+        except httpx.HTTPError:
+            return False
 
 
 # 创建全局实例（默认配置）
@@ -355,3 +1118,20 @@ def get_llm_service(provider: str = None, model: str = None, openai_api_key: str
     return LLMService(provider=provider, model=model, openai_api_key=openai_api_key, openai_base_url=openai_base_url, anthropic_api_key=anthropic_api_key)
 
 
+def get_async_llm_service(provider: str = None, model: str = None, openai_api_key: str = None, openai_base_url: str = None, anthropic_api_key: str = None) -> AsyncLLMService:
+    """
+    获取异步 LLM 服务实例
+    
+    Args:
+        provider: LLM 提供商 (openai, anthropic, ollama)
+        model: 模型名称
+        openai_api_key: OpenAI API 密钥
+        openai_base_url: OpenAI API 基础 URL (支持 DeepSeek 等兼容服务)
+        anthropic_api_key: Anthropic API 密钥
+        
+    Returns:
+        AsyncLLMService 实例
+    """
+    return AsyncLLMService(provider=provider, model=model, openai_api_key=openai_api_key, openai_base_url=openai_base_url, anthropic_api_key=anthropic_api_key)
+
+
@@ -0,0 +1,87 @@
+"""
+项目批量生成调度 - 规划文件处理顺序并汇总吞吐报告
+"""
+from fnmatch import fnmatch
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+def _priority_rank(path: str, patterns: List[str]) -> int:
+    """返回首个匹配的优先级模式序号，未匹配时排在所有模式之后"""
+    for rank, pattern in enumerate(patterns):
+        if fnmatch(path, pattern):
+            return rank
+    return len(patterns)
+
+
+def plan_project_files(
+    files: Iterable,
+    annotated_file_ids: Set[int],
+    order: str = "largest",
+    priority: List[str] = None,
+    include_annotated: bool = False
+) -> Tuple[List, List]:
+    """
+    规划项目文件的处理顺序
+
+    Args:
+        files: 文件列表（需包含 id、filename、filepath、size）
+        annotated_file_ids: 已有标注的文件 ID
+        order: largest 先处理大文件（缩短整体耗时），smallest 先处理小文件（尽快看到结果）
+        priority: 路径通配模式列表，匹配的文件按模式顺序优先处理
+        include_annotated: 是否重新处理已有标注的文件
+
+    Returns:
+        (待处理文件列表, 跳过的文件列表)
+    """
+    priority = priority or []
+    planned = []
+    skipped = []
+    for file in files:
+        if file.id in annotated_file_ids and not include_annotated:
+            skipped.append(file)
+        else:
+            planned.append(file)
+
+    direction = -1 if order == "largest" else 1
+    planned.sort(key=lambda f: (
+        _priority_rank(f.filepath or f.filename, priority),
+        direction * (f.size or 0),
+        f.id
+    ))
+    return planned, skipped
+
+
+def throughput_report(entries: Dict[int, Dict], elapsed: float, usage: Dict) -> Dict:
+    """
+    汇总批量生成报告
+
+    Args:
+        entries: {file_id: 单个文件的处理结果}
+        elapsed: 累计耗时（秒）
+        usage: LLM 用量（requests、input_tokens、output_tokens）
+
+    Returns:
+        包含文件统计和吞吐量（文件/分钟、token/秒）的报告
+    """
+    statuses = [entry["status"] for entry in entries.values()]
+    processed = statuses.count("completed") + statuses.count("failed")
+    tokens = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+    return {
+        "files_total": len(entries),
+        "files_completed": statuses.count("completed"),
+        "files_failed": statuses.count("failed"),
+        "files_skipped": statuses.count("skipped"),
+        "annotation_count": sum(entry.get("annotation_count", 0) for entry in entries.values()),
+        "reused_count": sum(entry.get("reused_count", 0) for entry in entries.values()),
+        "dedup_saved_calls": sum(entry.get("dedup_saved_calls", 0) for entry in entries.values()),
+        "prompt_tokens_saved": sum(entry.get("prompt_tokens_saved", 0) for entry in entries.values()),
+        "triage_calls_saved": sum(entry.get("triage_calls_saved", 0) for entry in entries.values()),
+        "triage_latency_saved_seconds": round(sum(entry.get("triage_latency_saved_seconds", 0.0) for entry in entries.values()), 1),
+        "requests": usage.get("requests", 0),
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "elapsed_seconds": round(elapsed, 1),
+        "files_per_minute": round(processed / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "tokens_per_second": round(tokens / elapsed, 1) if elapsed > 0 else 0.0,
+        "files": list(entries.values())
+    }
@@ -0,0 +1,107 @@
+"""
+提示词压缩服务 - 去掉注释、空行和多余缩进以减少行内标注的输入 token，并保留到原始行号的映射
+"""
+import math
+from dataclasses import dataclass, field
+from functools import reduce
+from typing import Dict, Iterable, List, Optional
+from .code_parser import code_parser
+from .token_estimator import token_estimator
+
+# 计算缩进宽度时 Tab 按 4 个空格计
+TAB_WIDTH = 4
+
+
+@dataclass
+class CompactedCode:
+    """压缩后的代码片段"""
+    code: str
+    line_map: List[int] = field(default_factory=list)  # 压缩后第 i 行（0 起始）对应的原始行号（1 起始，相对于输入片段）
+    original_tokens: int = 0  # 压缩前的 token 数（FileCompactor 生成时填写）
+    compacted_tokens: int = 0  # 压缩后的 token 数
+
+    @property
+    def empty(self) -> bool:
+        """是否没有剩余代码（片段全部为注释或空行）"""
+        return not self.line_map
+
+    def original_line(self, line: int) -> Optional[int]:
+        """
+        将压缩后的行号（1 起始）换算为原始行号
+
+        Returns:
+            原始行号，超出范围时返回 None
+        """
+        if 1 <= line <= len(self.line_map):
+            return self.line_map[line - 1]
+        return None
+
+
+def _indent_width(line: str) -> int:
+    stripped = line.lstrip(' \t')
+    return len(line[:len(line) - len(stripped)].expandtabs(TAB_WIDTH))
+
+
+def compact_code(code: str, dropped: Iterable[int] = (), reindent: bool = True) -> CompactedCode:
+    """
+    压缩代码片段
+
+    删除 dropped 中的行和行尾空白；reindent 时将缩进按最大公约数缩为每级 1 个空格，
+    同一代码块内各行的相对缩进保持不变（Python 语义不受影响）
+
+    Args:
+        code: 代码片段
+        dropped: 要删除的行号（1 起始，相对于片段）
+        reindent: 是否压缩缩进
+
+    Returns:
+        压缩结果
+    """
+    dropped = set(dropped)
+    kept = [(index, line.rstrip()) for index, line in enumerate(code.split('\n'), 1) if index not in dropped]
+    kept = [(index, line) for index, line in kept if line]
+
+    unit = 1
+    if reindent:
+        widths = [_indent_width(line) for _, line in kept]
+        unit = reduce(math.gcd, [w for w in widths if w], 0) or 1
+
+    lines = []
+    for _, line in kept:
+        if reindent:
+            lines.append(' ' * (_indent_width(line) // unit) + line.lstrip(' \t'))
+        else:
+            lines.append(line)
+    return CompactedCode(code='\n'.join(lines), line_map=[index for index, _ in kept])
+
+
+class FileCompactor:
+    """
+    单个文件的压缩器
+
+    对整个文件做一次语言相关的分析（注释、文档字符串位于窗口边界时也能正确识别），
+    再按窗口生成压缩片段，并累计压缩前后的 token 数
+    """
+
+    def __init__(self, code: str, language: str, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.dropped = code_parser.non_semantic_lines(code, language)
+        self.original_tokens = 0
+        self.compacted_tokens = 0
+
+    def compact_window(self, window: Dict) -> CompactedCode:
+        """
+        压缩一个行窗口（split_into_windows 的返回项）
+
+        Returns:
+            压缩结果，line_map 为相对于窗口起始行的行号
+        """
+        offset = window['start'] - 1
+        dropped = {line - offset for line in self.dropped if window['start'] <= line <= window['end']}
+        compacted = compact_code(window['code'], dropped)
+        compacted.original_tokens = token_estimator.count(window['code'], self.provider, self.model)
+        compacted.compacted_tokens = token_estimator.count(compacted.code, self.provider, self.model) if not compacted.empty else 0
+        self.original_tokens += compacted.original_tokens
+        self.compacted_tokens += compacted.compacted_tokens
+        return compacted
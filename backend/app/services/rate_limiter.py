@@ -0,0 +1,270 @@
+"""
+LLM 限流服务 - 按提供商的令牌桶限流、自适应降速和重试调度
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+from ..config import settings
+from .llm_metrics import llm_metrics
+
+
+class TokenBucket:
+    """
+    令牌桶（预约式）
+
+    reserve() 立即扣除额度并返回需要等待的时间，额度可以暂时为负，
+    因此无需加锁，并发请求按预约顺序排队
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.per_minute = per_minute
+        self.burst_seconds = burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """每秒补充的额度"""
+        return self.per_minute / 60.0
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.rate * self.burst_seconds)
+
+    def reserve(self, amount: float, factor: float = 1.0) -> float:
+        """
+        预约额度
+
+        Args:
+            amount: 需要的额度
+            factor: 自适应降速系数（0-1]
+
+        Returns:
+            需要等待的秒数
+        """
+        now = time.monotonic()
+        rate = self.rate * factor
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / rate
+
+    def available(self, amount: float, factor: float = 1.0) -> bool:
+        """当前是否有足够的空闲额度（不预约）"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate * factor)
+        self.updated = now
+        return self.tokens >= amount
+
+
+class RetryableError(Exception):
+    """可重试的 LLM 调用错误"""
+
+
+class ProviderRateLimiter:
+    """单个提供商的限流器，所有进行中的生成请求共享"""
+
+    def __init__(self, provider: str, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.provider = provider
+        self.requests = TokenBucket(rpm, settings.LLM_RATE_BURST_SECONDS) if rpm else None
+        self.tokens = TokenBucket(tpm, settings.LLM_RATE_BURST_SECONDS) if tpm else None
+        self.factor = 1.0  # 自适应降速系数
+        self.blocked_until = 0.0  # 收到 429 后所有请求暂停到该时间点
+        self._recent = deque()  # 最近一分钟的请求开始时间，用于在未配置限额时推断速率
+        self.stats = {"requests": 0, "throttled": 0, "retries": 0, "failures": 0, "wait_seconds": 0.0}
+
+    async def acquire(self, tokens: int):
+        """等待可用额度"""
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1, self.factor))
+        if self.tokens:
+            wait = max(wait, self.tokens.reserve(tokens, self.factor))
+        wait = max(wait, self.blocked_until - time.monotonic())
+        if wait > 0:
+            self.stats["wait_seconds"] += wait
+            await asyncio.sleep(wait)
+
+        self._record()
+
+    def try_acquire(self, tokens: int) -> bool:
+        """
+        有空闲额度时立即占用，不等待（用于对冲请求等可以放弃的额外请求）
+
+        Returns:
+            是否占用成功；额度不足或处于 429 暂停期时不占用额度并返回 False
+        """
+        if time.monotonic() < self.blocked_until:
+            return False
+        if self.requests and not self.requests.available(1, self.factor):
+            return False
+        if self.tokens and not self.tokens.available(tokens, self.factor):
+            return False
+        if self.requests:
+            self.requests.reserve(1, self.factor)
+        if self.tokens:
+            self.tokens.reserve(tokens, self.factor)
+        self._record()
+        return True
+
+    def _record(self):
+        """记录一次请求的开始时间"""
+        now = time.monotonic()
+        self._recent.append(now)
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        self.stats["requests"] += 1
+
+    def on_success(self):
+        """请求成功，逐步恢复速率（加性增）"""
+        self.factor = min(1.0, self.factor + settings.LLM_RATE_RECOVERY_STEP)
+
+    def on_throttle(self, retry_after: Optional[float]):
+        """收到 429，降低速率（乘性减）并按 Retry-After 暂停"""
+        self.stats["throttled"] += 1
+        if self.requests is None:
+            # 未配置限额时，以最近一分钟的实际请求数推断提供商限额
+            observed = max(1.0, len(self._recent) * 0.8)
+            self.requests = TokenBucket(observed, settings.LLM_RATE_BURST_SECONDS)
+        else:
+            self.factor = max(settings.LLM_RATE_MIN_FACTOR, self.factor * 0.5)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def snapshot(self) -> Dict:
+        """当前限流状态"""
+        return dict(
+            self.stats,
+            factor=round(self.factor, 3),
+            rpm=round(self.requests.per_minute * self.factor, 1) if self.requests else None,
+            tpm=round(self.tokens.per_minute * self.factor, 1) if self.tokens else None
+        )
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """从 SDK / httpx 异常中提取 HTTP 状态码"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    解析 Retry-After / retry-after-ms 响应头
+
+    Args:
+        error: SDK 或 httpx 异常
+
+    Returns:
+        需要等待的秒数，没有该响应头时返回 None
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """判断错误是否值得重试：429（余额不足除外）、408、5xx、超时和连接错误"""
+    if isinstance(error, RetryableError):
+        return True
+    if "insufficient_quota" in str(error):
+        return False
+    status = _status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name or "Connect" in name
+
+
+class RateLimiter:
+    """限流器注册表"""
+
+    def __init__(self, limits: Dict[str, Dict] = None):
+        self.limits = limits if limits is not None else settings.LLM_RATE_LIMITS
+        self._limiters: Dict[str, ProviderRateLimiter] = {}
+
+    def for_provider(self, provider: str) -> ProviderRateLimiter:
+        """获取提供商的限流器"""
+        limiter = self._limiters.get(provider)
+        if limiter is None:
+            # 端点级限流器（"openai:deepseek"）未单独配置时沿用提供商的限额
+            config = self.limits.get(provider) or self.limits.get(provider.partition(":")[0], {})
+            limiter = ProviderRateLimiter(provider, config.get("rpm"), config.get("tpm"))
+            self._limiters[provider] = limiter
+        return limiter
+
+    async def run(self, provider: str, tokens: int, call: Callable[[], Awaitable[Any]], max_retries: int = None) -> Any:
+        """
+        在限流和重试调度下执行一次调用
+
+        Args:
+            provider: LLM 提供商或端点级限流器名称（"openai:deepseek"）
+            tokens: 预计消耗的 token 数（输入 + 输出）
+            call: 发起请求的协程函数，失败时抛出异常
+            max_retries: 最大重试次数
+
+        Returns:
+            call 的返回值；重试耗尽或不可重试时抛出最后一次的异常
+        """
+        limiter = self.for_provider(provider)
+        max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            await limiter.acquire(tokens)
+            try:
+                result = await call()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not is_retryable(e) or attempt >= max_retries:
+                    limiter.stats["failures"] += 1
+                    raise
+                retry_after = retry_after_seconds(e)
+                if _status_code(e) == 429:
+                    limiter.on_throttle(retry_after)
+                # 指数退避 + 全抖动，Retry-After 优先
+                backoff = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2 ** attempt)
+                delay = retry_after if retry_after is not None else random.uniform(0, backoff)
+                attempt += 1
+                limiter.stats["retries"] += 1
+                status = _status_code(e)
+                # 端点级限流器名称为 "提供商:端点"，指标按实际提供商记录，端点作为单独的标签
+                provider_name, _, endpoint = provider.partition(":")
+                llm_metrics.record_retry(
+                    provider_name,
+                    str(status) if status is not None else type(e).__name__,
+                    endpoint or "default"
+                )
+                await asyncio.sleep(delay)
+                continue
+            limiter.on_success()
+            return result
+
+    def snapshot(self) -> Dict:
+        """所有提供商的限流状态"""
+        return {provider: limiter.snapshot() for provider, limiter in self._limiters.items()}
+
+
+# 创建全局实例
+rate_limiter = RateLimiter()
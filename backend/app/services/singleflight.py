@@ -0,0 +1,61 @@
+"""
+请求合并服务 - 相同的并发请求共享同一次执行
+"""
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+def content_hash(content: str) -> str:
+    """文件内容哈希，用于区分同一文件的不同版本"""
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    请求合并（进程内）
+
+    同一个键同时只执行一次：第一个请求启动执行，之后到达的相同请求等待同一结果。
+    执行在独立任务中进行，发起请求的客户端断开不会中断其他等待者
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"started": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行或加入进行中的执行
+
+        Args:
+            key: 请求键
+            call: 执行函数（返回协程）
+
+        Returns:
+            (结果, 是否复用了进行中的执行)；执行失败时所有等待者收到同一异常
+        """
+        task = self._flights.get(key)
+        shared = task is not None
+        if shared:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.create_task(call())
+            self._flights[key] = task
+            self.stats["started"] += 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # shield：单个等待者被取消时执行继续，结果仍会持久化并交给其他等待者
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # 所有等待者都已取消时由这里取走异常，避免未处理异常的警告
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+
+# 创建全局实例
+generation_flights = SingleFlight()
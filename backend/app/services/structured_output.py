@@ -0,0 +1,244 @@
+"""
+结构化输出 - 各类请求的 JSON Schema，以及从不规范或被截断的模型输出中提取 JSON
+"""
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+# 各类请求的输出格式（OpenAI json_schema、Anthropic 工具输入、Ollama format 共用）
+_FUNCTION_PROPERTIES = {
+    "function_name": {"type": "string"},
+    "description": {"type": "string"},
+    "parameters": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "type": {"type": "string"},
+                "description": {"type": "string"}
+            },
+            "required": ["name", "description"]
+        }
+    },
+    "returns": {
+        "type": "object",
+        "properties": {"type": {"type": "string"}, "description": {"type": "string"}}
+    },
+    "example": {"type": "string"}
+}
+
+OUTPUT_SCHEMAS = {
+    "line": {
+        "type": "object",
+        "properties": {
+            "annotations": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "line": {"type": "integer"},
+                        "type": {"type": "string", "enum": ["info", "warning", "suggestion", "security"]},
+                        "content": {"type": "string"}
+                    },
+                    "required": ["line", "type", "content"]
+                }
+            }
+        },
+        "required": ["annotations"]
+    },
+    "function": {
+        "type": "object",
+        "properties": _FUNCTION_PROPERTIES,
+        "required": ["description"]
+    },
+    "batch": {
+        "type": "object",
+        "properties": {
+            "functions": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": dict(_FUNCTION_PROPERTIES, id={"type": "string"}),
+                    "required": ["id", "description"]
+                }
+            }
+        },
+        "required": ["functions"]
+    },
+    "triage": {
+        "type": "object",
+        "properties": {
+            "scores": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"id": {"type": "string"}, "score": {"type": "integer"}},
+                    "required": ["id", "score"]
+                }
+            }
+        },
+        "required": ["scores"]
+    }
+}
+
+# 解析结果：ok（直接解析）、salvaged（去掉多余文字或截断后恢复）、failed
+PARSE_OK = "ok"
+PARSE_SALVAGED = "salvaged"
+PARSE_FAILED = "failed"
+
+_FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", re.DOTALL)
+
+
+def output_schema(kind: Optional[str]) -> Optional[Dict]:
+    """请求类型对应的 JSON Schema，未知类型返回 None"""
+    return OUTPUT_SCHEMAS.get(kind) if kind else None
+
+
+def _close_truncated(text: str) -> Tuple[Optional[str], bool]:
+    """
+    补全被截断的 JSON 对象
+
+    逐字符扫描并记录安全截断点：数组中的完整元素之后，或根对象中的完整成员之后。
+    数组元素和嵌套对象只保留完整的部分，避免得到缺字段的条目
+
+    Returns:
+        (文本, 是否被截断)：根对象在文本中闭合时返回到闭合处为止的文本（未截断）；
+        被截断时返回补全后的文本，没有可用内容时文本为 None
+    """
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    safe: Optional[Tuple[int, Tuple[str, ...]]] = None
+    for index, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if not stack:
+                return None, False
+            stack.pop()
+            if not stack:
+                return text[:index + 1], False
+            if stack[-1] == "[" or len(stack) == 1:
+                safe = (index + 1, tuple(stack))
+        elif ch == "," and stack and (stack[-1] == "[" or len(stack) == 1):
+            safe = (index, tuple(stack))
+    if safe is None:
+        return None, True
+    end, opened = safe
+    body = text[:end].rstrip().rstrip(",")
+    return body + "".join("}" if bracket == "{" else "]" for bracket in reversed(opened)), True
+
+
+def _drop_incomplete(value, schema: Optional[Dict]) -> Tuple[object, bool]:
+    """
+    按 Schema 的 required 字段丢弃数组中不完整的条目，类型不是数组的数组字段替换为空列表
+
+    Returns:
+        (处理后的值, 是否做了修正)
+    """
+    if not schema:
+        return value, False
+    repaired = False
+    if schema.get("type") == "object" and isinstance(value, dict):
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in value:
+                value[key], changed = _drop_incomplete(value[key], sub_schema)
+                repaired = repaired or changed
+    elif schema.get("type") == "array":
+        if not isinstance(value, list):
+            return [], True
+        item_schema = schema.get("items") or {}
+        required = item_schema.get("required", [])
+        items = []
+        for item in value:
+            if required and not (isinstance(item, dict) and all(key in item for key in required)):
+                repaired = True
+                continue
+            item, changed = _drop_incomplete(item, item_schema)
+            repaired = repaired or changed
+            items.append(item)
+        value = items
+    return value, repaired
+
+
+def _first_object(text: str) -> Optional[Dict]:
+    """
+    文本中第一个可以解析的 JSON 对象
+
+    从每个 "{" 开始尝试解析，跳过已闭合但无法解析的片段（如说明文字中的 {...}）；
+    到文本末尾仍未闭合的对象视为被截断，补全后解析，补全失败时继续尝试之后的位置
+
+    Returns:
+        JSON 对象，没有时返回 None
+    """
+    decoder = json.JSONDecoder()
+    position = 0
+    while True:
+        start = text.find("{", position)
+        if start < 0:
+            return None
+        try:
+            value, end = decoder.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+            position = end
+            continue
+        except json.JSONDecodeError:
+            pass
+        fragment, truncated = _close_truncated(text[start:])
+        if truncated:
+            if fragment is not None:
+                try:
+                    value = json.loads(fragment)
+                    if isinstance(value, dict):
+                        return value
+                except json.JSONDecodeError:
+                    pass
+            # 说明文字中未闭合的 "{"，继续尝试之后的位置
+            position = start + 1
+            continue
+        position = start + (len(fragment) if fragment else 1)
+
+
+def extract_json(text: str, kind: Optional[str] = None) -> Tuple[Optional[Dict], str]:
+    """
+    从模型输出中提取 JSON 对象
+
+    依次尝试：直接解析、markdown 代码块或前后说明文字中第一个可以解析的对象、补全被截断的对象
+    （保留已完整输出的数组元素）。提取后按 kind 的 Schema 丢弃缺少必填字段的数组元素，
+    类型不符的数组字段替换为空列表（这两种修正都记为 salvaged）
+
+    Args:
+        text: 模型输出文本
+        kind: 请求类型（line、function、batch、triage）
+
+    Returns:
+        (JSON 对象, 解析结果 ok / salvaged / failed)，失败时对象为 None
+    """
+    text = (text or "").strip()
+    schema = output_schema(kind)
+    try:
+        value = json.loads(text)
+        if isinstance(value, dict):
+            value, repaired = _drop_incomplete(value, schema)
+            return value, PARSE_SALVAGED if repaired else PARSE_OK
+    except json.JSONDecodeError:
+        pass
+
+    candidates = [match.group(1) for match in _FENCE_PATTERN.finditer(text)] + [text]
+    for candidate in candidates:
+        value = _first_object(candidate)
+        if value is not None:
+            return _drop_incomplete(value, schema)[0], PARSE_SALVAGED
+    return None, PARSE_FAILED
@@ -0,0 +1,135 @@
+"""
+Token 估算服务 - 按提供商估算提示词大小、输出大小和耗时
+"""
+import math
+from typing import Callable, Dict, Optional
+from ..config import settings
+
+try:
+    import tiktoken
+except ImportError:  # 可选依赖，未安装时使用启发式估算
+    tiktoken = None
+
+
+# 模型上下文窗口与输出速度（按模型名前缀匹配，越具体的前缀越靠前）
+MODEL_PROFILES = [
+    ("gpt-4o", {"context": 128000, "tokens_per_second": 80}),
+    ("gpt-4-turbo", {"context": 128000, "tokens_per_second": 40}),
+    ("gpt-4", {"context": 8192, "tokens_per_second": 25}),
+    ("gpt-3.5-turbo", {"context": 16385, "tokens_per_second": 70}),
+    ("deepseek", {"context": 64000, "tokens_per_second": 30}),
+    ("claude-3-haiku", {"context": 200000, "tokens_per_second": 120}),
+    ("claude", {"context": 200000, "tokens_per_second": 50}),
+    ("codellama", {"context": 16384, "tokens_per_second": 15}),
+    ("llama", {"context": 8192, "tokens_per_second": 15}),
+    ("qwen", {"context": 32768, "tokens_per_second": 20}),
+]
+DEFAULT_PROFILE = {"context": 8192, "tokens_per_second": 20}
+
+# 各提供商的请求超时（秒）与首包延迟估计（秒）
+PROVIDER_TIMEOUTS = {"openai": 180.0, "anthropic": 600.0, "ollama": 120.0}
+PROVIDER_BASE_LATENCY = {"openai": 1.0, "anthropic": 1.0, "ollama": 0.5}
+# 输入处理速度（token/秒）
+PREFILL_TOKENS_PER_SECOND = 2000
+
+# 预期输出大小
+LINE_OUTPUT_TOKENS_PER_LINE = 4  # 约 15% 的行会被标注，每条约 25 token
+FUNCTION_OUTPUT_TOKENS = 250  # 单个函数文档
+
+
+def heuristic_count(text: str) -> int:
+    """
+    启发式估算 token 数：ASCII 约 3.5 字符 1 个 token，中文等非 ASCII 字符约 1 字 1 个 token
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的 token 数
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return math.ceil((len(text) - non_ascii) / 3.5 + non_ascii)
+
+
+class TokenEstimator:
+    """Token 估算器，可按提供商注册更精确的计数函数"""
+
+    def __init__(self):
+        self._counters: Dict[str, Callable[[str, str], int]] = {}
+        if tiktoken is not None:
+            self.register("openai", self._tiktoken_count)
+
+    def register(self, provider: str, counter: Callable[[str, str], int]):
+        """
+        注册提供商的计数函数
+
+        Args:
+            provider: LLM 提供商
+            counter: 接收 (text, model) 返回 token 数的函数
+        """
+        self._counters[provider] = counter
+
+    @staticmethod
+    def _tiktoken_count(text: str, model: str) -> int:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def count(self, text: str, provider: str = None, model: str = None) -> int:
+        """估算文本的 token 数"""
+        counter = self._counters.get(provider)
+        if counter is not None:
+            try:
+                return counter(text, model or "")
+            except Exception:
+                pass
+        return heuristic_count(text)
+
+    @staticmethod
+    def profile(model: Optional[str]) -> Dict:
+        """获取模型的上下文窗口和输出速度"""
+        name = (model or "").lower()
+        for prefix, profile in MODEL_PROFILES:
+            if name.startswith(prefix):
+                return profile
+        return DEFAULT_PROFILE
+
+    def expected_latency(self, provider: str, model: str, output_tokens: int, input_tokens: int = 0) -> float:
+        """估算单次请求耗时（秒）"""
+        speed = self.profile(model)["tokens_per_second"]
+        return PROVIDER_BASE_LATENCY.get(provider, 1.0) + input_tokens / PREFILL_TOKENS_PER_SECOND + output_tokens / speed
+
+    def window_lines(self, code: str, provider: str, model: str, prompt_overhead: int = 400) -> int:
+        """
+        根据上下文窗口和超时预算计算行窗口的最大行数
+
+        Args:
+            code: 完整代码
+            provider: LLM 提供商
+            model: 模型名称
+            prompt_overhead: 提示词模板本身的 token 数
+
+        Returns:
+            单个窗口的行数上限（不超过 LLM_LINE_WINDOW_LINES）
+        """
+        lines = max(1, code.count('\n') + 1)
+        tokens_per_line = max(1.0, self.count(code, provider, model) / lines)
+        profile = self.profile(model)
+        budget = settings.LLM_TOKEN_BUDGET_RATIO
+
+        # 输入：提示词 + 代码 + 预留输出不超过上下文窗口的一定比例
+        context_budget = profile["context"] * budget - prompt_overhead
+        input_lines = context_budget / (tokens_per_line + LINE_OUTPUT_TOKENS_PER_LINE)
+
+        # 耗时：预期输出时间不超过超时时间的一定比例
+        timeout = PROVIDER_TIMEOUTS.get(provider, 120.0)
+        output_budget = (timeout * budget - PROVIDER_BASE_LATENCY.get(provider, 1.0)) * profile["tokens_per_second"]
+        timeout_lines = output_budget / LINE_OUTPUT_TOKENS_PER_LINE
+
+        return max(20, min(settings.LLM_LINE_WINDOW_LINES, int(input_lines), int(timeout_lines)))
+
+
+# 创建全局实例
+token_estimator = TokenEstimator()
@@ -0,0 +1,74 @@
+"""
+LLM 用量服务 - 按项目汇总 LLM 调用的请求数、错误、token 和耗时
+"""
+from typing import Dict, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models import LLMUsage
+
+USAGE_FIELDS = ("calls", "requests", "errors", "input_tokens", "output_tokens", "latency_seconds")
+
+
+def record_llm_usage(project_id: Optional[int], llm_service) -> None:
+    """
+    将 LLM 服务实例的累计用量合并到项目用量表（使用独立会话）
+    
+    Args:
+        project_id: 项目 ID
+        llm_service: 本次生成使用的 LLM 服务实例，每个实例只应记录一次
+    """
+    usage = llm_service.usage
+    if project_id is None or not usage["calls"]:
+        return
+    
+    # 并发记录同一项目时可能同时插入，唯一约束冲突后重试一次
+    for attempt in range(2):
+        db = SessionLocal()
+        try:
+            row = db.query(LLMUsage).filter(
+                LLMUsage.project_id == project_id,
+                LLMUsage.provider == llm_service.provider,
+                LLMUsage.model == llm_service.model
+            ).first()
+            if row is None:
+                row = LLMUsage(project_id=project_id, provider=llm_service.provider, model=llm_service.model)
+                db.add(row)
+            for field in USAGE_FIELDS:
+                setattr(row, field, (getattr(row, field) or 0) + usage[field])
+            db.commit()
+            return
+        except IntegrityError:
+            db.rollback()
+            if attempt:
+                raise
+        finally:
+            db.close()
+
+
+def project_usage(db: Session, project_id: int) -> Dict:
+    """
+    项目的 LLM 用量汇总
+    
+    Returns:
+        {"project_id", 合计字段, "average_latency", "models": [按提供商和模型的明细]}
+    """
+    rows = (
+        db.query(LLMUsage)
+        .filter(LLMUsage.project_id == project_id)
+        .order_by(LLMUsage.provider, LLMUsage.model)
+        .all()
+    )
+    models = []
+    for row in rows:
+        item = {"provider": row.provider, "model": row.model, "updated_at": row.updated_at}
+        item.update({field: getattr(row, field) or 0 for field in USAGE_FIELDS})
+        models.append(item)
+    
+    totals = {field: sum(item[field] for item in models) for field in USAGE_FIELDS}
+    return {
+        "project_id": project_id,
+        **totals,
+        "average_latency": round(totals["latency_seconds"] / totals["calls"], 3) if totals["calls"] else None,
+        "models": models
+    }
@@ -0,0 +1,185 @@
+"""
+工作单元检查点服务 - 记录生成任务中每个行窗口/函数的完成状态，使任务中断后只重新执行剩余的单元
+"""
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models import Annotation, File, GenerationWorkUnit
+from .singleflight import content_hash
+
+# 工作单元状态
+UNIT_PENDING = "pending"
+UNIT_DONE = "done"
+UNIT_FAILED = "failed"
+
+
+class WorkCheckpoint:
+    """
+    一个任务中单个文件的检查点
+
+    创建时读取之前执行中已记录的单元；每个单元完成时，其标注和单元状态在同一事务中提交，
+    进程在任意时刻退出都不会留下没有对应单元记录的标注。已完成（done）的单元在恢复时跳过，
+    失败和未完成的单元重新执行。
+    batch_size 大于 1 时累积多个单元后批量提交（需要在结束时调用 flush），
+    中断时最多重新执行一批尚未提交的单元。
+    单元键由行号组成，恢复时文件内容已被修改（内容哈希不同）则删除之前的单元及其标注，从头执行
+    """
+
+    def __init__(self, job_id: int, file_id: int, batch_size: int = 1):
+        self.job_id = job_id
+        self.file_id = file_id
+        self.batch_size = max(1, batch_size)
+        self._units: Dict[str, Dict] = {}
+        self._buffer: List[Tuple[str, str, List[Dict], List[Dict]]] = []
+        self.discarded = 0  # 因文件被修改而丢弃的单元数
+        db = SessionLocal()
+        try:
+            file = db.query(File.content).filter(File.id == file_id).first()
+            self.content_hash = content_hash(file.content) if file else None
+            units = self._query(db).all()
+            if any(unit.content_hash and unit.content_hash != self.content_hash for unit in units):
+                self._discard(db, units)
+                units = []
+            for unit in units:
+                self._units[unit.unit_key] = {"kind": unit.kind, "state": unit.state, "annotation_ids": unit.annotation_ids or []}
+        finally:
+            db.close()
+        self.restored = sum(1 for unit in self._units.values() if unit["state"] == UNIT_DONE)
+
+    def _discard(self, db: Session, units: List[GenerationWorkUnit]):
+        """删除文件修改前登记的单元和这些单元写入的标注"""
+        annotation_ids = [annotation_id for unit in units for annotation_id in (unit.annotation_ids or [])]
+        if annotation_ids:
+            db.query(Annotation).filter(Annotation.id.in_(annotation_ids)).delete(synchronize_session=False)
+        for unit in units:
+            db.delete(unit)
+        db.commit()
+        self.discarded = len(units)
+
+    def _query(self, db: Session):
+        return db.query(GenerationWorkUnit).filter(
+            GenerationWorkUnit.job_id == self.job_id,
+            GenerationWorkUnit.file_id == self.file_id
+        )
+
+    def is_done(self, key: str) -> bool:
+        """单元是否已完成"""
+        unit = self._units.get(key)
+        return unit is not None and unit["state"] == UNIT_DONE
+
+    def has_done(self, kind: str) -> bool:
+        """是否有该类型（line / function）的单元已完成"""
+        return any(unit["kind"] == kind and unit["state"] == UNIT_DONE for unit in self._units.values())
+
+    def plan(self, units: Dict[str, str]):
+        """
+        登记将要执行的单元（已登记的单元不重复写入）
+
+        Args:
+            units: {单元键: 类型}
+        """
+        new = {key: kind for key, kind in units.items() if key not in self._units}
+        if not new:
+            return
+        db = SessionLocal()
+        try:
+            db.add_all([
+                GenerationWorkUnit(
+                    job_id=self.job_id, file_id=self.file_id, unit_key=key, kind=kind,
+                    state=UNIT_PENDING, content_hash=self.content_hash
+                )
+                for key, kind in new.items()
+            ])
+            db.commit()
+        finally:
+            db.close()
+        for key, kind in new.items():
+            self._units[key] = {"kind": kind, "state": UNIT_PENDING, "annotation_ids": []}
+
+    def complete(self, key: str, kind: str, annotations: List[Dict], errors: List[Dict]):
+        """
+        记录单元的结果，累积到 batch_size 个单元时提交
+
+        Args:
+            key: 单元键
+            kind: 单元类型
+            annotations: 标注字段字典列表（不含 file_id）
+            errors: 失败信息，非空时单元记为 failed
+        """
+        self._buffer.append((key, kind, annotations, errors))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """提交累积的单元：写入标注并更新单元状态（同一事务）"""
+        if not self._buffer:
+            return
+        entries, self._buffer = self._buffer, []
+        db = SessionLocal()
+        try:
+            units = {
+                unit.unit_key: unit for unit in
+                self._query(db).filter(GenerationWorkUnit.unit_key.in_([key for key, _, _, _ in entries]))
+            }
+            written = []
+            for key, kind, annotations, errors in entries:
+                rows = [Annotation(file_id=self.file_id, **data) for data in annotations]
+                db.add_all(rows)
+                unit = units.get(key)
+                if unit is None:
+                    unit = units[key] = GenerationWorkUnit(
+                        job_id=self.job_id, file_id=self.file_id, unit_key=key, kind=kind, content_hash=self.content_hash
+                    )
+                    db.add(unit)
+                written.append((unit, kind, rows, errors))
+            db.flush()
+            for unit, kind, rows, errors in written:
+                unit.state = UNIT_FAILED if errors else UNIT_DONE
+                unit.annotation_ids = [row.id for row in rows]
+                unit.error = errors[0] if errors else None
+                unit.attempts = (unit.attempts or 0) + 1
+            db.commit()
+            for unit, kind, _, _ in written:
+                self._units[unit.unit_key] = {"kind": kind, "state": unit.state, "annotation_ids": unit.annotation_ids}
+        finally:
+            db.close()
+
+    def annotation_ids(self) -> List[int]:
+        """本任务为该文件写入的全部标注（包括之前的执行，不含尚未提交的单元）"""
+        return [annotation_id for unit in self._units.values() for annotation_id in unit["annotation_ids"]]
+
+    def rows(self, db: Session) -> List[Annotation]:
+        """本任务为该文件写入的标注记录（先提交累积的单元），按行号排序"""
+        self.flush()
+        ids = self.annotation_ids()
+        if not ids:
+            return []
+        return db.query(Annotation).filter(Annotation.id.in_(ids)).order_by(Annotation.line_number).all()
+
+
+def files_with_units(db: Session, job_id: int) -> Set[int]:
+    """任务中已登记过工作单元的文件（恢复项目任务时即使已有标注也需要继续处理）"""
+    return {
+        file_id for (file_id,) in
+        db.query(GenerationWorkUnit.file_id).filter(GenerationWorkUnit.job_id == job_id).distinct()
+    }
+
+
+def unit_summary(db: Session, job_id: int, file_id: Optional[int] = None) -> Dict:
+    """
+    任务的工作单元统计
+
+    Returns:
+        {'total': 单元数, 'line': {状态: 数量}, 'function': {状态: 数量}}
+    """
+    query = db.query(GenerationWorkUnit.kind, GenerationWorkUnit.state, func.count(GenerationWorkUnit.id)).filter(
+        GenerationWorkUnit.job_id == job_id
+    )
+    if file_id is not None:
+        query = query.filter(GenerationWorkUnit.file_id == file_id)
+    summary = {"total": 0, "line": {}, "function": {}}
+    for kind, state, count in query.group_by(GenerationWorkUnit.kind, GenerationWorkUnit.state):
+        summary.setdefault(kind, {})[state] = count
+        summary["total"] += count
+    return summary
@@ -0,0 +1,3 @@
+"""
+性能基准脚本（在 backend 目录下以 python -m benchmarks.<name> 运行）
+"""
@@ -0,0 +1,118 @@
+"""
+客户端连接池基准 - 对比每次调用新建客户端与复用连接池客户端的延迟
+
+本地启动一个 OpenAI 兼容的桩服务，每个新连接额外等待 --connect-delay 秒以模拟
+TCP/TLS 握手开销。
+
+运行:
+    cd backend
+    python -m benchmarks.bench_client_pool --calls 50 --connect-delay 0.05
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from openai import AsyncOpenAI
+from app.services.llm_clients import LLMClientRegistry
+
+COMPLETION = {
+    "id": "bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "stub",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "{}"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+}
+
+
+def start_stub_server(connect_delay: float) -> ThreadingHTTPServer:
+    """启动支持 keep-alive 的桩服务"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        connections = 0
+
+        def setup(self):
+            super().setup()
+            Handler.connections += 1
+            time.sleep(connect_delay)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = json.dumps(COMPLETION).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.handler_class = Handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def call(client: AsyncOpenAI) -> float:
+    start = time.perf_counter()
+    await client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hi"}])
+    return time.perf_counter() - start
+
+
+async def per_call_clients(base_url: str, calls: int) -> list:
+    """每次调用新建客户端（旧实现）"""
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client = AsyncOpenAI(api_key="bench", base_url=base_url)
+        await call(client)
+        await client.close()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def pooled_clients(base_url: str, calls: int) -> list:
+    """每次调用从连接池获取客户端"""
+    registry = LLMClientRegistry()
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await call(registry.async_openai("bench", base_url))
+        latencies.append(time.perf_counter() - start)
+    registry.clear()
+    return latencies
+
+
+def report(name: str, latencies: list, connections: int):
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{name:<12} {statistics.mean(latencies) * 1000:>9.1f} {statistics.median(latencies) * 1000:>9.1f} "
+          f"{p95 * 1000:>9.1f} {connections:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="客户端连接池基准")
+    parser.add_argument("--calls", type=int, default=50, help="调用次数")
+    parser.add_argument("--connect-delay", type=float, default=0.05, help="模拟的建连开销（秒）")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.connect_delay)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    handler = server.handler_class
+
+    print(f"{'模式':<12} {'平均(ms)':>9} {'中位(ms)':>9} {'p95(ms)':>9} {'新建连接':>8}")
+    for name, runner in [("per-call", per_call_clients), ("pooled", pooled_clients)]:
+        handler.connections = 0
+        latencies = asyncio.run(runner(base_url, args.calls))
+        report(name, latencies, handler.connections)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+生成流程基准 - 在本地模拟 LLM 服务上测量完整生成流程的吞吐量和尾延迟
+
+经过真实的 AsyncLLMService、连接池、限流器、调度器和 AnnotationGenerator，
+只把提供商替换为 benchmarks.fake_llm_server。相同的 --seed 得到相同的文件、延迟和错误序列
+
+运行:
+    cd backend
+    python -m benchmarks.bench_pipeline --files 20 --functions 15 --latency lognormal:0.3,0.6
+    python -m benchmarks.bench_pipeline --provider ollama --latency fixed:0.1 --error-rate 0.02
+    python -m benchmarks.bench_pipeline --source ../some_repo --mode replay --cassette cassettes/run.jsonl
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.config import settings
+from app.services import llm_service as llm_module
+from app.services.annotation_generator import AnnotationGenerator
+from app.services.llm_dispatcher import LLMDispatcher
+from app.services.llm_service import AsyncLLMService
+from app.services.rate_limiter import RateLimiter
+from benchmarks.fake_llm_server import FakeLLMConfig, FakeLLMServer, LatencyModel
+
+
+class TimedLLMService(AsyncLLMService):
+    """记录每次请求耗时的 LLM 服务"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies: List[float] = []
+        self.failures = 0
+
+    async def _generate(self, prompt: str, system_prompt: str, max_tokens: int = 2000, output_kind: Optional[str] = None) -> Dict:
+        start = time.perf_counter()
+        result = await super()._generate(prompt, system_prompt, max_tokens, output_kind)
+        self.latencies.append(time.perf_counter() - start)
+        if "error" in result:
+            self.failures += 1
+        return result
+
+
+def synthetic_files(count: int, functions: int, seed: int) -> List[Dict]:
+    """生成确定性的 Python 源文件"""
+    rng = random.Random(seed)
+    files = []
+    for index in range(count):
+        blocks = []
+        for f in range(functions):
+            body = [f"    value = {rng.randint(0, 999)} + arg_{k}" for k in range(rng.randint(2, 12))]
+            blocks.append(f"def func_{index}_{f}(arg_0, arg_1):\n" + "\n".join(body) + "\n    return value\n")
+        files.append({"name": f"module_{index}.py", "content": "\n\n".join(blocks), "language": "python"})
+    return files
+
+
+def source_files(root: str, limit: int) -> List[Dict]:
+    """读取目录中的 Python 文件"""
+    files = []
+    for path in sorted(Path(root).rglob("*.py"))[:limit]:
+        try:
+            files.append({"name": str(path), "content": path.read_text(encoding="utf-8"), "language": "python"})
+        except (UnicodeDecodeError, OSError):
+            continue
+    return files
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def build_service(provider: str, base_url: str) -> TimedLLMService:
+    """创建指向模拟服务的 LLM 服务"""
+    if provider == "anthropic":
+        os.environ["ANTHROPIC_BASE_URL"] = base_url
+        service = TimedLLMService(provider="anthropic", model="claude-3-haiku-20240307", anthropic_api_key="bench")
+    elif provider == "ollama":
+        settings.OLLAMA_BASE_URL = base_url
+        service = TimedLLMService(provider="ollama", model="codellama:7b")
+    else:
+        service = TimedLLMService(provider="openai", model="gpt-4o-mini", openai_api_key="bench", openai_base_url=base_url + "/v1")
+    service.cache = None
+    return service
+
+
+async def run_pipeline(files: List[Dict], service: TimedLLMService, args) -> float:
+    """按项目任务的方式并发处理所有文件，返回总耗时"""
+    dispatcher = LLMDispatcher(limits={service.provider: args.concurrency})
+    semaphore = asyncio.Semaphore(args.file_concurrency)
+
+    async def run_file(file: Dict):
+        async with semaphore:
+            generator = AnnotationGenerator(service, dispatcher, use_cache=False)
+            if not args.no_lines:
+                await generator.generate_line_annotations(file["content"], file["language"])
+            await generator.generate_function_annotations(file["content"], file["language"], batch=args.batch)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_file(f) for f in files))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成流程基准")
+    parser.add_argument("--provider", choices=["openai", "anthropic", "ollama"], default="openai")
+    parser.add_argument("--files", type=int, default=20, help="模拟文件数")
+    parser.add_argument("--functions", type=int, default=15, help="每个模拟文件的函数数")
+    parser.add_argument("--source", help="使用目录中的真实 Python 文件代替模拟文件")
+    parser.add_argument("--concurrency", type=int, default=8, help="提供商并发上限")
+    parser.add_argument("--file-concurrency", type=int, default=settings.PROJECT_FILE_CONCURRENCY)
+    parser.add_argument("--batch", action="store_true", help="打包小函数")
+    parser.add_argument("--no-lines", action="store_true", help="不生成行内标注")
+    parser.add_argument("--latency", default="lognormal:0.3,0.5", help="模拟服务延迟分布")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["synthetic", "replay"], default="synthetic")
+    parser.add_argument("--cassette", help="replay 模式的录制文件")
+    args = parser.parse_args()
+
+    files = source_files(args.source, args.files) if args.source else synthetic_files(args.files, args.functions, args.seed)
+    server = FakeLLMServer(FakeLLMConfig(
+        latency=LatencyModel(args.latency, args.seed),
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+        mode=args.mode,
+        cassette=args.cassette
+    )).start()
+
+    # 限流器状态与其他运行隔离；模拟服务未配置限额
+    llm_module.rate_limiter = RateLimiter({})
+    service = build_service(args.provider, server.url)
+    elapsed = asyncio.run(run_pipeline(files, service, args))
+    server.stop()
+
+    latencies = service.latencies
+    tokens = service.usage["input_tokens"] + service.usage["output_tokens"]
+    limiter = llm_module.rate_limiter.snapshot().get(args.provider, {})
+    print(f"提供商: {args.provider}  文件: {len(files)}  并发: {args.concurrency}  延迟分布: {args.latency}")
+    print(f"总耗时        {elapsed:8.2f} s")
+    print(f"LLM 调用      {len(latencies):8d}  （失败 {service.failures}，重试 {limiter.get('retries', 0)}）")
+    print(f"服务端统计    {server.stats}")
+    print(f"吞吐量        {len(latencies) / elapsed:8.2f} 调用/s  {len(files) / elapsed * 60:8.1f} 文件/min  {tokens / elapsed:8.1f} token/s")
+    if latencies:
+        print(f"调用延迟      p50 {percentile(latencies, 50):.3f}s  p90 {percentile(latencies, 90):.3f}s  "
+              f"p99 {percentile(latencies, 99):.3f}s  max {max(latencies):.3f}s  mean {statistics.mean(latencies):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+调度优先级基准 - 批量任务满载时测量交互式请求的延迟和项目间的公平性
+
+在本地模拟 LLM 服务上同时运行：
+  - 一个大项目和若干稍后开始的小项目（批量任务，每个项目按 --file-concurrency 并发处理文件）
+  - 每隔 --interval 秒发起一次交互式单文件生成（--interactive-functions 个函数）
+分别在 fifo（所有调用同一队列、无预留名额）和 priority（交互式优先、项目间轮转、预留名额）下运行
+
+运行:
+    cd backend
+    python -m benchmarks.bench_priority --concurrency 8 --latency lognormal:0.3,0.5
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+from app.services import llm_service as llm_module
+from app.services.annotation_generator import AnnotationGenerator
+from app.services.llm_dispatcher import LLMDispatcher
+from app.services.llm_service import AsyncLLMService
+from app.services.rate_limiter import RateLimiter
+from benchmarks.bench_pipeline import percentile, synthetic_files
+from benchmarks.fake_llm_server import FakeLLMConfig, FakeLLMServer, LatencyModel
+
+
+async def run_project(project_id: int, files: List[Dict], service, dispatcher, args, prioritized: bool) -> float:
+    """按项目任务的方式处理文件，返回完成耗时"""
+    semaphore = asyncio.Semaphore(args.file_concurrency)
+    start = time.perf_counter()
+
+    async def run_file(file: Dict):
+        async with semaphore:
+            generator = AnnotationGenerator(
+                service,
+                dispatcher,
+                use_cache=False,
+                priority="bulk",
+                tenant=project_id if prioritized else None
+            )
+            await generator.generate_function_annotations(file["content"], file["language"])
+
+    await asyncio.gather(*(run_file(f) for f in files))
+    return time.perf_counter() - start
+
+
+async def run_scenario(base_url: str, args, prioritized: bool) -> Dict:
+    """运行一轮负载，返回交互式延迟和各项目耗时"""
+    service = AsyncLLMService(provider="openai", model="bench", openai_api_key="bench", openai_base_url=base_url)
+    service.cache = None
+    dispatcher = LLMDispatcher(limits={"openai": args.concurrency}, reserved=args.reserved if prioritized else 0)
+
+    large = synthetic_files(args.large_files, args.functions, seed=1)
+    small = [synthetic_files(args.small_files, args.functions, seed=10 + i) for i in range(args.small_projects)]
+    interactive_file = synthetic_files(1, args.interactive_functions, seed=99)[0]
+
+    async def delayed(project_id: int, files: List[Dict]) -> float:
+        await asyncio.sleep(args.small_delay)
+        return await run_project(project_id, files, service, dispatcher, args, prioritized)
+
+    bulk = asyncio.gather(
+        run_project(0, large, service, dispatcher, args, prioritized),
+        *(delayed(i + 1, files) for i, files in enumerate(small))
+    )
+    bulk_task = asyncio.ensure_future(bulk)
+
+    latencies = []
+    await asyncio.sleep(args.warmup)
+    while not bulk_task.done() and len(latencies) < args.interactive:
+        generator = AnnotationGenerator(
+            service,
+            dispatcher,
+            use_cache=False,
+            priority="interactive" if prioritized else "bulk"
+        )
+        start = time.perf_counter()
+        await generator.generate_function_annotations(interactive_file["content"], interactive_file["language"])
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(args.interval)
+
+    durations = await bulk_task
+    return {"latencies": latencies, "durations": durations}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="调度优先级基准")
+    parser.add_argument("--concurrency", type=int, default=8, help="提供商并发上限")
+    parser.add_argument("--reserved", type=int, default=1, help="priority 场景中预留给交互式请求的名额")
+    parser.add_argument("--file-concurrency", type=int, default=24, help="每个项目同时处理的文件数（越大排队越深）")
+    parser.add_argument("--functions", type=int, default=10, help="批量文件的函数数")
+    parser.add_argument("--large-files", type=int, default=60, help="大项目的文件数")
+    parser.add_argument("--small-projects", type=int, default=2)
+    parser.add_argument("--small-files", type=int, default=6, help="小项目的文件数")
+    parser.add_argument("--small-delay", type=float, default=1.0, help="小项目晚于大项目开始的时间（秒）")
+    parser.add_argument("--interactive", type=int, default=30, help="交互式请求次数上限")
+    parser.add_argument("--interactive-functions", type=int, default=3)
+    parser.add_argument("--interval", type=float, default=0.5, help="交互式请求间隔（秒）")
+    parser.add_argument("--warmup", type=float, default=1.0, help="批量任务开始多久后发起交互式请求（秒）")
+    parser.add_argument("--latency", default="lognormal:0.3,0.5", help="模拟服务延迟分布")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    llm_module.rate_limiter = RateLimiter({})
+    print(f"并发: {args.concurrency}  预留: {args.reserved}  延迟分布: {args.latency}  "
+          f"大项目: {args.large_files} 文件  小项目: {args.small_projects} × {args.small_files} 文件")
+    print(f"{'场景':<10} {'交互次数':>8} {'p50(s)':>8} {'p95(s)':>8} {'max(s)':>8} {'大项目(s)':>10} {'小项目(s)':>16}")
+    for name, prioritized in (("fifo", False), ("priority", True)):
+        server = FakeLLMServer(FakeLLMConfig(latency=LatencyModel(args.latency, args.seed), seed=args.seed)).start()
+        result = asyncio.run(run_scenario(server.url + "/v1", args, prioritized))
+        server.stop()
+        latencies = result["latencies"]
+        large, *small = result["durations"]
+        print(f"{name:<10} {len(latencies):>8} {percentile(latencies, 50):>8.2f} {percentile(latencies, 95):>8.2f} "
+              f"{max(latencies, default=0.0):>8.2f} {large:>10.1f} {', '.join(f'{d:.1f}' for d in small):>16}")
+
+
+if __name__ == "__main__":
+    main()
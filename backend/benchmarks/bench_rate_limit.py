@@ -0,0 +1,83 @@
+"""
+限流基准 - 对限流的本地模拟服务发起批量调用，观察 429 次数和实际吞吐
+
+模拟服务（benchmarks.fake_llm_server）按 60 秒滑动窗口限制请求数，超出时返回 429 和 Retry-After。
+调用次数超过服务端每分钟限额，分别测试：
+- adaptive: 未配置客户端限额，收到 429 后根据最近一分钟的请求数推断限额并按 Retry-After 暂停
+- configured: 按服务端限额配置（扣除令牌桶可积攒的额度，使任意一分钟内的请求数不超过服务端限额）
+
+检查：两个场景都没有失败的调用；adaptive 场景确实收到 429，且最终速率低于服务端限额
+
+运行:
+    cd backend
+    python -m benchmarks.bench_rate_limit --calls 90 --server-rpm 60
+"""
+import argparse
+import asyncio
+import sys
+import time
+from app.config import settings
+from app.services import llm_service as llm_module
+from app.services.llm_dispatcher import LLMDispatcher
+from app.services.llm_service import AsyncLLMService
+from app.services.rate_limiter import RateLimiter
+from benchmarks.fake_llm_server import FakeLLMConfig, FakeLLMServer, LatencyModel
+
+
+async def run_scenario(base_url: str, calls: int, limits: dict, concurrency: int) -> tuple:
+    """以指定的客户端限额运行一轮批量调用"""
+    llm_module.rate_limiter = RateLimiter(limits)
+    service = AsyncLLMService(provider="openai", model="stub", openai_api_key="bench", openai_base_url=base_url)
+    service.cache = None
+    dispatcher = LLMDispatcher(limits={"openai": concurrency})
+
+    async def worker(index: int) -> dict:
+        return await service.generate_line_annotations(f"x = {index}", "python")
+
+    start = time.perf_counter()
+    results = await dispatcher.map("openai", list(range(calls)), worker)
+    elapsed = time.perf_counter() - start
+    failures = sum(1 for r in results if not r.ok or "error" in r.value)
+    return elapsed, calls - failures, failures, llm_module.rate_limiter.snapshot().get("openai", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="限流基准")
+    parser.add_argument("--calls", type=int, default=90, help="调用次数（应超过服务端每分钟限额）")
+    parser.add_argument("--server-rpm", type=int, default=60, help="模拟服务每分钟允许的请求数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务响应延迟（秒）")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发调用数")
+    args = parser.parse_args()
+
+    # 令牌桶在限额之外还可积攒 LLM_RATE_BURST_SECONDS 秒的额度，配置值需要扣除这部分
+    configured_rpm = int(args.server_rpm * 60 / (60 + settings.LLM_RATE_BURST_SECONDS))
+    scenarios = [
+        ("adaptive", {}),
+        ("configured", {"openai": {"rpm": configured_rpm}}),
+    ]
+    print(f"调用: {args.calls}  服务端限额: {args.server_rpm} rpm  configured 客户端限额: {configured_rpm} rpm  并发: {args.concurrency}")
+    print(f"{'场景':<12} {'耗时(s)':>8} {'成功':>5} {'失败':>5} {'服务端429':>9} {'重试':>5} {'最终rpm':>8}")
+    results = {}
+    for name, limits in scenarios:
+        # 每个场景使用新的模拟服务，限流窗口互不影响
+        server = FakeLLMServer(FakeLLMConfig(latency=LatencyModel(f"fixed:{args.latency}"), rpm=args.server_rpm)).start()
+        elapsed, ok, failed, stats = asyncio.run(run_scenario(server.url + "/v1", args.calls, limits, args.concurrency))
+        throttled = server.stats["throttled"]
+        print(f"{name:<12} {elapsed:>8.1f} {ok:>5} {failed:>5} {throttled:>9} "
+              f"{stats.get('retries', 0):>5} {str(stats.get('rpm')):>8}")
+        server.stop()
+        results[name] = {"failed": failed, "throttled": throttled, "rpm": stats.get("rpm")}
+
+    adaptive = results["adaptive"]
+    checks = {
+        "adaptive 收到 429（调用数超过服务端限额）": adaptive["throttled"] > 0,
+        "adaptive 没有失败的调用": adaptive["failed"] == 0,
+        "adaptive 最终速率低于服务端限额": adaptive["rpm"] is not None and adaptive["rpm"] < args.server_rpm,
+        "configured 没有失败的调用": results["configured"]["failed"] == 0,
+    }
+    for name, ok in checks.items():
+        print(f"{'通过' if ok else '失败'}  {name}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+崩溃恢复验证 - 在项目生成任务执行途中强制结束服务进程，重启后检查任务只执行剩余的工作单元
+
+流程:
+1. 以子进程启动服务（独立的临时数据库和缓存），LLM 提供商为 benchmarks.fake_llm_server
+2. 基准：项目 A 完整执行一次生成任务，记录标注数和 LLM 请求数
+3. 项目 B 上传相同的文件并提交任务，完成的工作单元达到 --kill-at 比例时 SIGKILL 服务进程
+4. 重启服务，等待任务自动恢复并完成
+5. 检查：任务完成且执行了两次；标注数与基准一致且没有重复；
+   两次执行的请求总数不超过基准请求数加上被强制结束时进行中的请求（并发上限）
+
+运行:
+    cd backend
+    python -m benchmarks.crash_recovery --files 10 --functions 12 --latency fixed:0.2 --kill-at 0.4
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List
+import httpx
+from benchmarks.bench_pipeline import synthetic_files
+from benchmarks.fake_llm_server import FakeLLMConfig, FakeLLMServer, LatencyModel
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(workdir: str, port: int, concurrency: int) -> subprocess.Popen:
+    """在 workdir 中启动服务进程并等待就绪"""
+    env = dict(
+        os.environ,
+        PYTHONPATH=BACKEND_DIR,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'crash.db')}",
+        LLM_CONCURRENCY=json.dumps({"openai": concurrency})
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise RuntimeError("服务进程启动失败")
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("服务进程启动超时")
+
+
+def create_project(client: httpx.Client, name: str, files: List[Dict]) -> int:
+    """创建项目并上传文件"""
+    project_id = client.post("/projects/", json={"name": name}).json()["id"]
+    for file in files:
+        client.post(
+            "/files/upload",
+            files={"file": (file["name"], file["content"].encode("utf-8"))},
+            data={"project_id": str(project_id)}
+        ).raise_for_status()
+    return project_id
+
+
+def submit(client: httpx.Client, project_id: int) -> int:
+    """提交项目生成任务（不读取缓存，每个工作单元都会请求 LLM）"""
+    response = client.post("/annotations/generate/project", json={"project_id": project_id, "force_regenerate": True})
+    response.raise_for_status()
+    return response.json()["job_id"]
+
+
+def wait_job(client: httpx.Client, job_id: int, timeout: float = 600) -> Dict:
+    """等待任务结束"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.2)
+    raise RuntimeError(f"任务 {job_id} 超时未完成")
+
+
+def units_done(client: httpx.Client, job_id: int) -> int:
+    summary = client.get(f"/jobs/{job_id}/units").json()
+    return summary["line"].get("done", 0) + summary["function"].get("done", 0)
+
+
+def project_annotations(client: httpx.Client, project_id: int) -> List[tuple]:
+    """项目内全部标注（文件名、类型、行号、函数名、内容）"""
+    rows = []
+    for file in client.get(f"/files/project/{project_id}/list").json():
+        for ann in client.get("/annotations/", params={"file_id": file["id"]}).json():
+            rows.append((file["filename"], ann["type"], ann["line_number"], ann.get("function_name"), ann["content"]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="崩溃恢复验证")
+    parser.add_argument("--files", type=int, default=10, help="模拟文件数")
+    parser.add_argument("--functions", type=int, default=12, help="每个模拟文件的函数数")
+    parser.add_argument("--latency", default="fixed:0.2", help="模拟服务延迟分布")
+    parser.add_argument("--concurrency", type=int, default=8, help="提供商并发上限")
+    parser.add_argument("--kill-at", type=float, default=0.4, help="完成的工作单元达到该比例时结束服务进程")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    files = synthetic_files(args.files, args.functions, args.seed)
+    server = FakeLLMServer(FakeLLMConfig(latency=LatencyModel(args.latency, args.seed), seed=args.seed)).start()
+    workdir = tempfile.mkdtemp(prefix="crash_recovery_")
+    with open(os.path.join(workdir, "user_settings.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "llmProvider": "openai",
+            "llmModel": "gpt-4o-mini",
+            "openaiApiKey": "test",
+            "openaiBaseUrl": f"{server.url}/v1"
+        }, f)
+    port = _free_port()
+    client = httpx.Client(base_url=f"http://127.0.0.1:{port}/api", timeout=30)
+
+    proc = start_app(workdir, port, args.concurrency)
+    try:
+        # 基准：不中断的完整执行
+        baseline_project = create_project(client, "baseline", files)
+        requests_before = server.stats["requests"]
+        baseline_job = wait_job(client, submit(client, baseline_project))
+        baseline_requests = server.stats["requests"] - requests_before
+        baseline_units = baseline_job["windows_total"] + baseline_job["functions_total"]
+        baseline_rows = project_annotations(client, baseline_project)
+
+        # 执行途中强制结束服务进程
+        project = create_project(client, "crash", files)
+        requests_before = server.stats["requests"]
+        job_id = submit(client, project)
+        while units_done(client, job_id) < args.kill_at * baseline_units:
+            time.sleep(0.05)
+        done_at_kill = units_done(client, job_id)
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+        requests_first = server.stats["requests"] - requests_before
+
+        # 重启后任务自动恢复
+        proc = start_app(workdir, port, args.concurrency)
+        job = wait_job(client, job_id)
+        requests_second = server.stats["requests"] - requests_before - requests_first
+        rows = project_annotations(client, project)
+    finally:
+        proc.kill()
+        proc.wait()
+        server.stop()
+
+    duplicates = sum(count - 1 for count in Counter(rows).values() if count > 1)
+    wasted = requests_first + requests_second - baseline_requests
+    print(f"文件: {len(files)}  工作单元: {baseline_units}  并发: {args.concurrency}  延迟分布: {args.latency}")
+    print(f"基准          请求 {baseline_requests:6d}  标注 {len(baseline_rows):6d}")
+    print(f"强制结束前    请求 {requests_first:6d}  已完成单元 {done_at_kill}")
+    print(f"恢复后        请求 {requests_second:6d}  任务状态 {job['status']}  执行次数 {job['attempts']}")
+    print(f"结果          标注 {len(rows):6d}  重复标注 {duplicates}  多余请求 {wasted}（结束时进行中的请求）")
+
+    checks = {
+        "任务完成": job["status"] == "completed",
+        "任务恢复执行": job["attempts"] == 2,
+        "标注数与基准一致": sorted(rows) == sorted(baseline_rows),
+        "没有重复标注": duplicates == 0,
+        "只重新执行剩余单元": wasted <= args.concurrency,
+    }
+    for name, ok in checks.items():
+        print(f"{'通过' if ok else '失败'}  {name}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
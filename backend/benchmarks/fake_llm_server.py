@@ -0,0 +1,484 @@
+"""
+本地模拟 LLM 服务 - 兼容 OpenAI chat/completions、Anthropic messages 和 Ollama /api/generate
+
+用于在无网络环境下运行和测量生成流程：
+- synthetic: 根据提示词生成确定性的标注响应（按 --seed 复现延迟和错误）
+- record: 将请求转发到真实提供商，并把响应写入录制文件（JSONL）
+- replay: 从录制文件回放响应，未录制的请求按 --replay-miss 处理
+
+运行:
+    cd backend
+    python -m benchmarks.fake_llm_server --port 8900 --latency lognormal:0.8,0.5 --error-rate 0.01
+    python -m benchmarks.fake_llm_server --mode record --cassette cassettes/run.jsonl \\
+        --upstream openai=https://api.openai.com
+    python -m benchmarks.fake_llm_server --mode replay --cassette cassettes/run.jsonl --latency recorded
+
+将 OpenAI 地址设置为 http://127.0.0.1:8900/v1，Anthropic 设置环境变量
+ANTHROPIC_BASE_URL=http://127.0.0.1:8900，Ollama 设置 OLLAMA_BASE_URL=http://127.0.0.1:8900
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+import httpx
+
+# 各协议的请求路径
+OPENAI_PATHS = ("/v1/chat/completions", "/chat/completions")
+ANTHROPIC_PATHS = ("/v1/messages", "/messages")
+OLLAMA_PATHS = ("/api/generate",)
+
+ANNOTATION_TYPES = ["info", "warning", "suggestion", "security"]
+
+
+class LatencyModel:
+    """
+    延迟分布
+
+    规格写法: fixed:0.2、uniform:0.1,0.5、normal:0.5,0.1、lognormal:中位数,sigma、exp:均值，
+    recorded 表示回放时使用录制的延迟
+    """
+
+    def __init__(self, spec: str = "fixed:0", seed: int = 0):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        if kind not in ("fixed", "uniform", "normal", "lognormal", "exp", "recorded"):
+            raise ValueError(f"未知的延迟分布: {spec}")
+
+    def sample(self, recorded: Optional[float] = None) -> float:
+        """采样一次延迟（秒）"""
+        if self.kind == "recorded":
+            return recorded or 0.0
+        with self._lock:
+            if self.kind == "fixed":
+                value = self.params[0]
+            elif self.kind == "uniform":
+                value = self._random.uniform(*self.params)
+            elif self.kind == "normal":
+                value = self._random.gauss(*self.params)
+            elif self.kind == "lognormal":
+                value = self._random.lognormvariate(math.log(self.params[0]), self.params[1])
+            else:
+                value = self._random.expovariate(1 / self.params[0])
+        return max(0.0, value)
+
+
+@dataclass
+class FakeLLMConfig:
+    """模拟服务配置"""
+    latency: LatencyModel = field(default_factory=LatencyModel)
+    tokens_per_second: float = 0.0  # 大于 0 时按输出长度追加生成耗时
+    error_rate: float = 0.0  # 返回 500 的比例
+    throttle_rate: float = 0.0  # 随机返回 429 的比例
+    retry_after: float = 1.0  # 429 响应的 Retry-After（秒）
+    rpm: int = 0  # 大于 0 时按滑动窗口限制每分钟请求数
+    seed: int = 0
+    mode: str = "synthetic"  # synthetic, record, replay
+    cassette: Optional[str] = None
+    upstreams: Dict[str, str] = field(default_factory=dict)  # record 模式下各协议的真实地址
+    replay_miss: str = "synthetic"  # replay 模式下未录制的请求: synthetic 或 error
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（约 4 字符 1 个 token）"""
+    return max(1, len(text) // 4)
+
+
+def _code_blocks(prompt: str) -> List[str]:
+    return re.findall(r"```[\w+#-]*\n(.*?)\n```", prompt, re.S)
+
+
+def _function_name(code: str) -> str:
+    match = re.search(r"(?:def|function|func|fn)\s+(\w+)", code)
+    return match.group(1) if match else "anonymous"
+
+
+def _function_doc(name: str, code: str) -> Dict:
+    params = re.search(r"\(([^)]*)\)", code)
+    names = [p.split(":")[0].split("=")[0].strip() for p in params.group(1).split(",")] if params else []
+    return {
+        "function_name": name,
+        "description": f"{name} 的功能说明",
+        "parameters": [
+            {"name": p, "type": "Any", "description": f"参数 {p}"}
+            for p in names if p and p not in ("self", "cls")
+        ],
+        "returns": {"type": "Any", "description": f"{name} 的返回值"},
+        "example": f"{name}(...)"
+    }
+
+
+def synthetic_output(prompt: str) -> Dict:
+    """
+    根据提示词生成确定性的标注响应
+
+    Args:
+        prompt: 用户提示词
+
+    Returns:
+        与提示词要求格式一致的 JSON 对象
+    """
+    if "### id:" in prompt:
+        blocks = re.findall(r"### id: (\S+)\n```[\w+#-]*\n(.*?)\n```", prompt, re.S)
+        return {"functions": [dict(_function_doc(_function_name(code), code), id=fid) for fid, code in blocks]}
+
+    blocks = _code_blocks(prompt)
+    code = blocks[0] if blocks else ""
+    if "行内注释" in prompt:
+        annotations = []
+        for number, line in enumerate(code.split("\n"), start=1):
+            digest = int(hashlib.md5(line.encode("utf-8")).hexdigest(), 16)
+            # 约 15% 的非空行被标注，同一行始终得到相同结果
+            if line.strip() and digest % 7 == 0:
+                annotations.append({
+                    "line": number,
+                    "type": ANNOTATION_TYPES[digest % len(ANNOTATION_TYPES)],
+                    "content": f"第 {number} 行说明"
+                })
+        return {"annotations": annotations}
+
+    return _function_doc(_function_name(code), code)
+
+
+def request_key(path: str, body: Dict) -> str:
+    """录制文件的查找键：路径 + 请求体"""
+    payload = json.dumps({"path": path, "body": body}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """录制文件（JSONL，每行一个请求/响应），同一请求录制多次时按顺序轮流回放"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, List[Dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def find(self, key: str) -> Optional[Dict]:
+        """查找录制的响应"""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            return entries[index % len(entries)]
+
+    def append(self, entry: Dict):
+        """追加一条录制"""
+        with self._lock:
+            self._entries.setdefault(entry["key"], []).append(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def _protocol(path: str) -> Optional[str]:
+    if path in OPENAI_PATHS:
+        return "openai"
+    if path in ANTHROPIC_PATHS:
+        return "anthropic"
+    if path in OLLAMA_PATHS:
+        return "ollama"
+    return None
+
+
+def _prompt_of(protocol: str, body: Dict) -> str:
+    if protocol == "ollama":
+        return body.get("prompt", "")
+    messages = body.get("messages") or [{}]
+    content = messages[-1].get("content", "")
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def render_response(protocol: str, body: Dict, text: str, prompt: str) -> Tuple[str, bytes]:
+    """
+    按协议封装模型输出
+
+    Returns:
+        (Content-Type, 响应体)
+    """
+    input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+    model = body.get("model", "fake")
+    if protocol == "openai":
+        payload = {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": input_tokens, "completion_tokens": output_tokens,
+                      "total_tokens": input_tokens + output_tokens}
+        }
+    elif protocol == "anthropic":
+        payload = {
+            "id": "msg_fake", "type": "message", "role": "assistant", "model": model,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        }
+    elif body.get("stream", True):
+        # Ollama 默认流式输出，每个分片一行
+        pieces = [text[i:i + 16] for i in range(0, len(text), 16)] or [""]
+        lines = [json.dumps({"model": model, "response": piece, "done": False}) for piece in pieces[:-1]]
+        lines.append(json.dumps({
+            "model": model, "response": pieces[-1], "done": True,
+            "prompt_eval_count": input_tokens, "eval_count": output_tokens
+        }))
+        return "application/x-ndjson", ("\n".join(lines) + "\n").encode("utf-8")
+    else:
+        payload = {
+            "model": model, "response": text, "done": True,
+            "prompt_eval_count": input_tokens, "eval_count": output_tokens
+        }
+    return "application/json", json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def _error_body(protocol: str, status: int, message: str) -> bytes:
+    if protocol == "anthropic":
+        kind = "rate_limit_error" if status == 429 else "api_error"
+        return json.dumps({"type": "error", "error": {"type": kind, "message": message}}).encode("utf-8")
+    if protocol == "ollama":
+        return json.dumps({"error": message}).encode("utf-8")
+    kind = "rate_limit_exceeded" if status == 429 else "server_error"
+    return json.dumps({"error": {"message": message, "type": kind, "code": kind}}).encode("utf-8")
+
+
+class FakeLLMServer:
+    """模拟 LLM 服务（在后台线程中运行）"""
+
+    def __init__(self, config: FakeLLMConfig = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeLLMConfig()
+        self.cassette = Cassette(self.config.cassette) if self.config.cassette else None
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0, "replayed": 0, "recorded": 0, "misses": 0}
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._window = deque()
+        self._upstream = httpx.Client(timeout=600.0) if self.config.mode == "record" else None
+        self._server = self._build_server(host, port)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """服务根地址"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeLLMServer":
+        """在后台线程中启动"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._upstream is not None:
+            self._upstream.close()
+
+    def _inject_failure(self) -> Optional[Tuple[int, float]]:
+        """按配置决定本次请求是否返回 429 / 500"""
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.config.rpm:
+                now = time.monotonic()
+                while self._window and now - self._window[0] > 60:
+                    self._window.popleft()
+                if len(self._window) >= self.config.rpm:
+                    self.stats["throttled"] += 1
+                    return 429, max(0.1, 60 - (now - self._window[0]))
+                self._window.append(now)
+            roll = self._random.random()
+        if roll < self.config.throttle_rate:
+            with self._lock:
+                self.stats["throttled"] += 1
+            return 429, self.config.retry_after
+        if roll < self.config.throttle_rate + self.config.error_rate:
+            with self._lock:
+                self.stats["errors"] += 1
+            return 500, 0.0
+        return None
+
+    def handle(self, path: str, body: Dict, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        处理一次请求
+
+        Returns:
+            (状态码, 响应头, 响应体)
+        """
+        protocol = _protocol(path)
+        if protocol is None:
+            return 404, {"Content-Type": "application/json"}, b'{"error": "not found"}'
+
+        failure = self._inject_failure()
+        if failure is not None:
+            status, retry_after = failure
+            extra = {"Retry-After": f"{retry_after:.2f}"} if status == 429 else {}
+            time.sleep(self.config.latency.sample() if status == 500 else 0)
+            return status, dict(extra, **{"Content-Type": "application/json"}), _error_body(protocol, status, "模拟错误")
+
+        key = request_key(path, body)
+        if self.config.mode == "record":
+            return self._record(protocol, path, key, body, headers)
+
+        if self.config.mode == "replay":
+            entry = self.cassette.find(key) if self.cassette else None
+            if entry is not None:
+                time.sleep(self.config.latency.sample(entry.get("latency")))
+                with self._lock:
+                    self.stats["replayed"] += 1
+                    self.stats["ok"] += 1
+                return entry["status"], {"Content-Type": entry["content_type"]}, entry["body"].encode("utf-8")
+            with self._lock:
+                self.stats["misses"] += 1
+            if self.config.replay_miss == "error":
+                return 404, {"Content-Type": "application/json"}, _error_body(protocol, 404, "录制文件中没有该请求")
+
+        prompt = _prompt_of(protocol, body)
+        text = json.dumps(synthetic_output(prompt), ensure_ascii=False)
+        delay = self.config.latency.sample()
+        if self.config.tokens_per_second > 0:
+            delay += estimate_tokens(text) / self.config.tokens_per_second
+        time.sleep(delay)
+        content_type, data = render_response(protocol, body, text, prompt)
+        with self._lock:
+            self.stats["ok"] += 1
+        return 200, {"Content-Type": content_type}, data
+
+    def _record(self, protocol: str, path: str, key: str, body: Dict, headers: Dict[str, str]):
+        """转发到真实提供商并录制响应"""
+        upstream = self.config.upstreams.get(protocol)
+        if not upstream:
+            return 502, {"Content-Type": "application/json"}, _error_body(protocol, 502, f"未配置 {protocol} 的上游地址")
+        forward = {k: v for k, v in headers.items() if k.lower() in (
+            "authorization", "x-api-key", "anthropic-version", "anthropic-beta", "content-type", "openai-organization"
+        )}
+        upstream_path = path if path.startswith(("/v1/", "/api/")) else "/v1" + path
+        started = time.monotonic()
+        response = self._upstream.post(upstream.rstrip("/") + upstream_path, json=body, headers=forward)
+        latency = time.monotonic() - started
+        content_type = response.headers.get("content-type", "application/json")
+        if response.status_code == 200:
+            self.cassette.append({
+                "key": key, "path": path, "request": body, "status": response.status_code,
+                "content_type": content_type, "body": response.text, "latency": round(latency, 4)
+            })
+            with self._lock:
+                self.stats["recorded"] += 1
+                self.stats["ok"] += 1
+        extra = {"Retry-After": response.headers["retry-after"]} if "retry-after" in response.headers else {}
+        return response.status_code, dict(extra, **{"Content-Type": content_type}), response.content
+
+    def _build_server(self, host: str, port: int) -> ThreadingHTTPServer:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    body = json.loads(raw or b"{}")
+                except ValueError:
+                    body = {}
+                path = self.path.split("?")[0]
+                status, headers, data = fake.handle(path, body, dict(self.headers.items()))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 256  # 避免并发建连时被拒绝
+
+        return Server((host, port), Handler)
+
+
+def parse_upstreams(values: List[str]) -> Dict[str, str]:
+    """解析 --upstream openai=https://api.openai.com 形式的参数"""
+    upstreams = {}
+    for value in values or []:
+        protocol, _, url = value.partition("=")
+        upstreams[protocol] = url
+    return upstreams
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--mode", choices=["synthetic", "record", "replay"], default="synthetic")
+    parser.add_argument("--latency", default="fixed:0.2", help="延迟分布，如 lognormal:0.8,0.5、recorded")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="按输出长度追加的生成速度")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="随机返回 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--rpm", type=int, default=0, help="每分钟请求数上限（0 表示不限制）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cassette", help="录制文件路径（JSONL）")
+    parser.add_argument("--upstream", action="append", help="record 模式的上游地址，如 openai=https://api.openai.com")
+    parser.add_argument("--replay-miss", choices=["synthetic", "error"], default="synthetic")
+    args = parser.parse_args()
+
+    if args.mode != "synthetic" and not args.cassette:
+        parser.error("record / replay 模式需要 --cassette")
+
+    config = FakeLLMConfig(
+        latency=LatencyModel(args.latency, args.seed),
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        rpm=args.rpm,
+        seed=args.seed,
+        mode=args.mode,
+        cassette=args.cassette,
+        upstreams=parse_upstreams(args.upstream),
+        replay_miss=args.replay_miss
+    )
+    server = FakeLLMServer(config, args.host, args.port)
+    print(f"模拟 LLM 服务已启动: {server.url} ({args.mode})")
+    if server.cassette is not None:
+        print(f"录制文件: {args.cassette}（{len(server.cassette)} 条）")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -222,12 +222,25 @@ export default function CodeAnnotation() {
 
     try {
       setGenerating(true)
-      await annotationService.generateAnnotations({
-        file_id: selectedFile.id,
-        generate_line_annotations: true,
-        generate_function_annotations: true,
-      })
-      message.success('标注生成成功')
+      // 流式生成：每条标注完成后立即显示
+      await annotationService.generateAnnotationsStream(
+        {
+          file_id: selectedFile.id,
+          generate_line_annotations: true,
+          generate_function_annotations: true,
+        },
+        (event) => {
+          if (event.event === 'annotation') {
+            setAnnotations((prev) => [...prev, event.data])
+          } else if (event.event === 'done') {
+            if (event.data.failed_count > 0) {
+              message.warning(`生成${event.data.annotation_count}条标注，${event.data.failed_count}处失败`)
+            } else {
+              message.success(`标注生成成功，共${event.data.annotation_count}条`)
+            }
+          }
+        }
+      )
       loadAnnotations()
     } catch (error: any) {
       message.error(`生成失败: ${error.message}`)
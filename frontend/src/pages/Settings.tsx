@@ -13,6 +13,17 @@ interface AnnotationType {
   description: string;
 }
 
+interface LLMEndpoint {
+  name: string;
+  provider: string;
+  model: string;
+  baseUrl?: string;
+  apiKey?: string;
+  weight?: number;
+  maxConcurrency?: number;
+  enabled?: boolean;
+}
+
 interface UserSettings {
   theme: string;
   language: string;
@@ -24,6 +35,7 @@ interface UserSettings {
   openaiApiKey: string;
   openaiBaseUrl: string;
   anthropicApiKey: string;
+  llmEndpoints?: LLMEndpoint[];
   annotationTypes?: AnnotationType[];
   exportFormat?: string;
   exportIncludeOriginal?: boolean;
@@ -2,7 +2,7 @@
  * 标注服务
  */
 import api from './api'
-import { Annotation, LLMGenerateRequest } from '../types'
+import { Annotation, LLMGenerateRequest, GenerateStreamEvent } from '../types'
 
 export const annotationService = {
   // 生成标注
@@ -10,6 +10,37 @@ export const annotationService = {
     return api.post('/annotations/generate', data)
   },
 
+  // 流式生成标注（NDJSON），每条标注入库后立即回调
+  generateAnnotationsStream: async (
+    data: LLMGenerateRequest,
+    onEvent: (event: GenerateStreamEvent) => void
+  ): Promise<void> => {
+    const response = await fetch(`${api.defaults.baseURL}/annotations/generate/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(data),
+    })
+    if (!response.ok || !response.body) {
+      const detail = await response.json().catch(() => null)
+      throw new Error(detail?.detail || `请求失败: HTTP ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      const lines = buffer.split('\n')
+      buffer = lines.pop() || ''
+      for (const line of lines) {
+        if (line.trim()) onEvent(JSON.parse(line))
+      }
+    }
+    if (buffer.trim()) onEvent(JSON.parse(buffer))
+  },
+
   // 创建标注
   createAnnotation: async (data: Partial<Annotation>): Promise<Annotation> => {
     return api.post('/annotations/', data)
@@ -56,8 +56,20 @@ export interface LLMGenerateRequest {
   file_id: number
   generate_line_annotations: boolean
   generate_function_annotations: boolean
+  force_regenerate?: boolean
+  batch_functions?: boolean
+  incremental?: boolean
+  compact_prompts?: boolean
+  triage?: boolean
 }
 
+// 流式生成事件
+export type GenerateStreamEvent =
+  | { event: 'start'; data: { file_id: number } }
+  | { event: 'annotation'; data: Annotation }
+  | { event: 'error'; data: { scope: string; error: string; function_name?: string; line_start?: number } }
+  | { event: 'done'; data: { file_id: number; annotation_count: number; failed_count: number } }
+
 // API响应
 export interface ApiResponse<T = any> {
   success?: boolean